@@ -0,0 +1,141 @@
+"""
+准入控制
+同步端点默认共用 anyio 的同一个线程池（40 个令牌），重的分析查询占满后，CRUD 请求和
+get_session 依赖都要排队。这里为每类路由（分析、CRUD 读取、写入）提供独立的有界执行器：各自的并发上限和最大排队数，
+排队已满时直接抛出 AdmissionRejected（接口返回 503 和 Retry-After），而不是继续积压。
+"""
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+import anyio
+from models import AdmissionPoolStats
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "4"))
+ANALYTICS_QUEUE_DEPTH = int(os.getenv("ANALYTICS_QUEUE_DEPTH", "8"))
+CRUD_WORKERS = int(os.getenv("CRUD_WORKERS", "16"))
+CRUD_QUEUE_DEPTH = int(os.getenv("CRUD_QUEUE_DEPTH", "200"))
+# SQLite 同一时间只有一个写事务，写线程多了也只是在数据库锁上等待
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", "4"))
+WRITE_QUEUE_DEPTH = int(os.getenv("WRITE_QUEUE_DEPTH", "100"))
+
+# 计算 Retry-After 时使用的平均执行时间的平滑系数
+EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} capacity exhausted, retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class AdmissionPool:
+    """一类路由的有界执行器：最多 workers 个并发，另外最多 max_queue 个排队"""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.limiter: Optional[anyio.CapacityLimiter] = None
+        # pending 与 rejected 只在事件循环中修改，其余统计由工作线程在锁内更新
+        self.pending = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.avg_wait_ms = 0.0
+        self.avg_run_ms = 0.0
+
+    def _limiter(self) -> anyio.CapacityLimiter:
+        # CapacityLimiter 绑定到创建它的事件循环，只能在循环中延迟创建
+        loop = asyncio.get_running_loop()
+        if self.limiter is None or self.loop is not loop:
+            self.loop = loop
+            self.limiter = anyio.CapacityLimiter(self.workers)
+        return self.limiter
+
+    @property
+    def active(self) -> int:
+        return int(self.limiter.borrowed_tokens) if self.limiter is not None else 0
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.active)
+
+    def retry_after(self) -> int:
+        """按平均执行时间估算排队清空所需的秒数"""
+        backlog = self.queued + 1
+        return max(1, math.ceil(self.avg_run_ms * backlog / self.workers / 1000))
+
+    async def run(self, func: Callable[[], Any]) -> Any:
+        """在执行器线程中运行 func；运行和排队都已满时抛出 AdmissionRejected"""
+        limiter = self._limiter()
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+
+        self.pending += 1
+        self.admitted += 1
+        self.max_queued = max(self.max_queued, self.pending - self.workers)
+        queued_at = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            succeeded = False
+            try:
+                result = func()
+                succeeded = True
+                return result
+            finally:
+                finished = time.perf_counter()
+                with self.lock:
+                    self.avg_wait_ms += EWMA_ALPHA * ((started - queued_at) * 1000 - self.avg_wait_ms)
+                    self.avg_run_ms += EWMA_ALPHA * ((finished - started) * 1000 - self.avg_run_ms)
+                    self.completed += 1
+                    if not succeeded:
+                        self.failed += 1
+
+        try:
+            return await anyio.to_thread.run_sync(call, limiter=limiter)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> AdmissionPoolStats:
+        with self.lock:
+            return AdmissionPoolStats(
+                name=self.name,
+                workers=self.workers,
+                max_queue=self.max_queue,
+                active=self.active,
+                queued=self.queued,
+                max_queued=self.max_queued,
+                admitted=self.admitted,
+                rejected=self.rejected,
+                completed=self.completed,
+                failed=self.failed,
+                avg_wait_ms=round(self.avg_wait_ms, 2),
+                avg_run_ms=round(self.avg_run_ms, 2),
+            )
+
+
+def admitted(pool: AdmissionPool):
+    """把同步端点改为在 pool 中执行；返回值原样交回 FastAPI，仍按路由的 response_model 校验和序列化"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await pool.run(lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+# 全局实例
+analytics_pool = AdmissionPool("analytics", ANALYTICS_WORKERS, ANALYTICS_QUEUE_DEPTH)
+crud_pool = AdmissionPool("crud", CRUD_WORKERS, CRUD_QUEUE_DEPTH)
+write_pool = AdmissionPool("write", WRITE_WORKERS, WRITE_QUEUE_DEPTH)
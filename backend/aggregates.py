@@ -0,0 +1,187 @@
+"""
+订阅汇总表维护模块
+subscription_aggregates 由 subscriptions 上的 SQLite 触发器按增量维护，
+仪表盘读取时只需扫描少量汇总行，与订阅数量无关。
+
+维护命令:
+    python aggregates.py rebuild   # 根据 subscriptions 全量重建汇总表
+    python aggregates.py check     # 与逐行 Python 计算结果做一致性校验
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from models import Subscription, SubscriptionAggregate
+
+logger = logging.getLogger(__name__)
+
+# 汇总维度 -> 分桶表达式（{r} 替换为 NEW / OLD / subscriptions）
+BUCKET_EXPRESSIONS = {
+    "total": "'all'",
+    "cycle": "{r}.cycle",
+    "currency": "{r}.currency",
+    "price_range": (
+        "CASE WHEN {r}.price < 50 THEN '0-50' "
+        "WHEN {r}.price < 100 THEN '50-100' "
+        "WHEN {r}.price < 300 THEN '100-300' "
+        "WHEN {r}.price < 500 THEN '300-500' "
+        "ELSE '500+' END"
+    ),
+}
+
+# 旧数据补算成本列时使用的折算表达式
+MONTHLY_COST_EXPRESSION = (
+    "CASE {r}.cycle WHEN 'monthly' THEN {r}.price "
+    "WHEN 'quarterly' THEN {r}.price / 3.0 "
+    "WHEN 'yearly' THEN {r}.price / 12.0 ELSE 0.0 END"
+)
+
+# 汇总列 -> 订阅行上写入时计算好的成本列
+COST_COLUMNS = {
+    "monthly_total": "monthly_cost",
+    "yearly_total": "yearly_cost",
+    "monthly_base_total": "monthly_cost_base",
+    "yearly_base_total": "yearly_cost_base",
+}
+
+# 浮点增量累计会产生微小误差，校验时允许的偏差
+TOLERANCE = 1e-6
+
+
+def _delta_statements(row: str, sign: str) -> List[str]:
+    """生成把一行订阅以 +/- 增量计入各维度汇总的语句"""
+    statements = []
+    costs = ", ".join(f"{sign}COALESCE({row}.{column}, 0)" for column in COST_COLUMNS.values())
+    for dimension, bucket in BUCKET_EXPRESSIONS.items():
+        statements.append(
+            "INSERT INTO subscription_aggregates "
+            f"(dimension, bucket, count, price_total, {', '.join(COST_COLUMNS)}) "
+            f"VALUES ('{dimension}', {bucket.format(r=row)}, {sign}1, {sign}{row}.price, {costs}) "
+            "ON CONFLICT(dimension, bucket) DO UPDATE SET "
+            "count = count + excluded.count, "
+            "price_total = price_total + excluded.price_total, "
+            + ", ".join(f"{total} = {total} + excluded.{total}" for total in COST_COLUMNS) + ";"
+        )
+    return statements
+
+
+def _trigger_definitions() -> Dict[str, str]:
+    """生成三个触发器的 DDL"""
+    cleanup = "DELETE FROM subscription_aggregates WHERE count <= 0;"
+    insert_body = _delta_statements("NEW", "")
+    update_body = _delta_statements("OLD", "-") + _delta_statements("NEW", "") + [cleanup]
+    delete_body = _delta_statements("OLD", "-") + [cleanup]
+    return {
+        "subscriptions_aggregate_insert":
+            "CREATE TRIGGER subscriptions_aggregate_insert AFTER INSERT ON subscriptions "
+            "BEGIN " + " ".join(insert_body) + " END",
+        "subscriptions_aggregate_update":
+            "CREATE TRIGGER subscriptions_aggregate_update "
+            f"AFTER UPDATE OF price, cycle, currency, {', '.join(COST_COLUMNS.values())} ON subscriptions "
+            "BEGIN " + " ".join(update_body) + " END",
+        "subscriptions_aggregate_delete":
+            "CREATE TRIGGER subscriptions_aggregate_delete AFTER DELETE ON subscriptions "
+            "BEGIN " + " ".join(delete_body) + " END",
+    }
+
+
+def install_aggregate_triggers(engine: Engine):
+    """安装（或更新）汇总触发器；汇总表为空或触发器定义变化时执行一次全量重建"""
+    definitions = _trigger_definitions()
+    with engine.begin() as conn:
+        installed = dict(conn.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'subscriptions'"
+        )).all())
+        changed = any(installed.get(name) != ddl for name, ddl in definitions.items())
+        for name, ddl in definitions.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(ddl))
+
+    with Session(engine) as session:
+        has_aggregates = session.exec(select(SubscriptionAggregate).limit(1)).first()
+        has_subscriptions = session.exec(select(Subscription.id).limit(1)).first()
+        if has_subscriptions is not None and (has_aggregates is None or changed):
+            logger.info("Aggregate table is empty or out of date, rebuilding from subscriptions")
+            rebuild_aggregates(session)
+
+
+def rebuild_aggregates(session: Session):
+    """根据 subscriptions 全量重建汇总表"""
+    session.execute(text("DELETE FROM subscription_aggregates"))
+    sums = ", ".join(f"TOTAL({column})" for column in COST_COLUMNS.values())
+    for dimension, bucket in BUCKET_EXPRESSIONS.items():
+        session.execute(text(
+            "INSERT INTO subscription_aggregates "
+            f"(dimension, bucket, count, price_total, {', '.join(COST_COLUMNS)}) "
+            f"SELECT '{dimension}', {bucket.format(r='subscriptions')}, COUNT(*), TOTAL(price), {sums} "
+            "FROM subscriptions GROUP BY 2"
+        ))
+    session.commit()
+    logger.info("Subscription aggregates rebuilt")
+
+
+def _expected_aggregates(session: Session) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """使用 AnalyticsService 的逐行计算得到期望的汇总值"""
+    from analytics import AnalyticsService
+
+    analytics_service = AnalyticsService(session)
+    expected = defaultdict(lambda: dict.fromkeys(["count", "price_total", *COST_COLUMNS], 0))
+    for sub in analytics_service.get_all_subscriptions():
+        monthly_cost = analytics_service.calculate_monthly_cost(sub)
+        yearly_cost = analytics_service.calculate_yearly_cost(sub)
+        price_range = next(
+            label for label, count in analytics_service._calculate_price_ranges([sub]).items() if count
+        )
+        cycle = getattr(sub.cycle, "value", sub.cycle)
+        for key in [("total", "all"), ("cycle", cycle), ("currency", sub.currency), ("price_range", price_range)]:
+            expected[key]["count"] += 1
+            expected[key]["price_total"] += sub.price
+            expected[key]["monthly_total"] += monthly_cost
+            expected[key]["yearly_total"] += yearly_cost
+            expected[key]["monthly_base_total"] += sub.monthly_cost_base or 0.0
+            expected[key]["yearly_base_total"] += sub.yearly_cost_base or 0.0
+    return expected
+
+
+def check_aggregates(session: Session) -> List[str]:
+    """校验汇总表与逐行计算是否一致，返回差异描述列表（为空表示一致）"""
+    expected = _expected_aggregates(session)
+    actual = {
+        (row.dimension, row.bucket): row
+        for row in session.exec(select(SubscriptionAggregate)).all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, dict.fromkeys(["count", "price_total", *COST_COLUMNS], 0))
+        row = actual.get(key)
+        for column, value in want.items():
+            got = getattr(row, column) if row else 0
+            if abs(got - value) > TOLERANCE * max(1.0, abs(value)):
+                mismatches.append(f"{key[0]}/{key[1]} {column}: expected {value}, got {got}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    from database import engine, create_db_and_tables
+
+    parser = argparse.ArgumentParser(description="Maintain the subscription aggregate table")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_db_and_tables()
+    with Session(engine) as session:
+        if args.command == "rebuild":
+            rebuild_aggregates(session)
+        problems = check_aggregates(session)
+
+    if problems:
+        for problem in problems:
+            print(problem)
+        sys.exit(1)
+    print("Aggregates are consistent")
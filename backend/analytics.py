@@ -2,28 +2,59 @@
 趋势分析服务模块
 提供订阅数据的各种统计分析功能
 """
-from datetime import datetime, date, timedelta
-from typing import List, Dict
+import json
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
 from sqlmodel import Session, select
 from models import (
     Subscription, SubscriptionAnalytics, PriceTrend, CycleAnalysis,
-    MonthlySpending, TimelineData, TrendAnalysis
+    MonthlySpending, TimelineData, TrendAnalysis, SubscriptionAggregate, SubscriptionEvent,
+    ArchivedSubscription
 )
+from aggregates import BUCKET_EXPRESSIONS
+from cycles import CYCLE_MONTHS
+from fieldsets import select_subscription_fields, fetch_subscription_rows
+from costs import get_base_currency, base_rates, base_price, round_amount
+from event_log import utc_day_start
+
+PRICE_RANGE_LABELS = ["0-50", "50-100", "100-300", "300-500", "500+"]
+
+# 单次价格趋势查询允许的最大区间数
+MAX_TREND_BUCKETS = 1000
 
 
 class AnalyticsService:
     """趋势分析服务类"""
 
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, include_archived: bool = False):
         self.session = session
+        # 为 True 时统计与创建时间线同时包含已归档（取消）的订阅
+        self.include_archived = include_archived
 
     def get_all_subscriptions(self) -> List[Subscription]:
         """获取所有订阅数据"""
         stmt = select(Subscription)
         return list(self.session.exec(stmt).all())
 
+    def get_archived_subscriptions(self) -> List[ArchivedSubscription]:
+        """获取所有已归档的订阅"""
+        return list(self.session.exec(select(ArchivedSubscription)).all())
+
+    def _archived_aggregates(self) -> Dict[str, Dict[str, Tuple[int, float]]]:
+        """按汇总表的维度对归档表分组，返回 维度 -> 分桶 -> (数量, 基准货币月度成本)"""
+        archived = defaultdict(dict)
+        for dimension in ("total", "cycle", "price_range"):
+            bucket = BUCKET_EXPRESSIONS[dimension].format(r="archived_subscriptions")
+            rows = self.session.execute(text(
+                f"SELECT {bucket}, COUNT(*), TOTAL(monthly_cost_base) FROM archived_subscriptions GROUP BY 1"
+            ))
+            for name, count, monthly_base_total in rows:
+                archived[dimension][name] = (count, monthly_base_total)
+        return archived
+
     def calculate_monthly_cost(self, subscription: Subscription) -> float:
         """计算单个订阅的月度成本"""
         if subscription.cycle == "monthly":
@@ -44,62 +75,84 @@ class AnalyticsService:
             return subscription.price
         return 0.0
 
-    def get_subscription_analytics(self) -> SubscriptionAnalytics:
-        """获取订阅数据综合分析"""
-        subscriptions = self.get_all_subscriptions()
+    def get_subscription_analytics(self, renewal_fields: Optional[List[str]] = None) -> SubscriptionAnalytics:
+        """获取订阅数据综合分析（基于增量维护的汇总表，成本按基准货币计）
+
+        renewal_fields 指定时，upcoming_renewals 只查询并返回这些列。
+        include_archived 时订阅总数、周期分析和价格区间包含归档订阅，
+        当前月度/年度成本与即将到期列表仍只统计活跃订阅。
+        """
+        aggregates = defaultdict(dict)
+        for row in self.session.exec(select(SubscriptionAggregate)).all():
+            aggregates[row.dimension][row.bucket] = row
+        archived = self._archived_aggregates() if self.include_archived else defaultdict(dict)
 
         # 基础统计
-        total_subscriptions = len(subscriptions)
-        active_subscriptions = total_subscriptions  # 所有存储的订阅都是活跃的
+        total = aggregates["total"].get("all")
+        active_subscriptions = total.count if total else 0  # subscriptions 表只保存活跃订阅
+        total_subscriptions = active_subscriptions + archived["total"].get("all", (0, 0.0))[0]
 
         # 成本计算
-        total_monthly_cost = sum(self.calculate_monthly_cost(sub) for sub in subscriptions)
-        total_yearly_cost = sum(self.calculate_yearly_cost(sub) for sub in subscriptions)
-
-        # 周期分析
-        cycle_stats = defaultdict(lambda: {'count': 0, 'total_amount': 0.0})
-        for sub in subscriptions:
-            cycle_stats[sub.cycle]['count'] += 1
-            cycle_stats[sub.cycle]['total_amount'] += sub.price
+        total_monthly_cost = total.monthly_base_total if total else 0.0
+        total_yearly_cost = total.yearly_base_total if total else 0.0
 
+        # 周期分析（单期价格 = 月度成本 × 周期月数）
         cycle_breakdown = []
-        for cycle, stats in cycle_stats.items():
+        for cycle in sorted(set(aggregates["cycle"]) | set(archived["cycle"])):
+            row = aggregates["cycle"].get(cycle)
+            archived_count, archived_monthly = archived["cycle"].get(cycle, (0, 0.0))
+            count = (row.count if row else 0) + archived_count
+            monthly_total = (row.monthly_base_total if row else 0.0) + archived_monthly
+            total_amount = monthly_total * CYCLE_MONTHS.get(cycle, 1)
             cycle_breakdown.append(CycleAnalysis(
                 cycle=cycle,
-                count=stats['count'],
-                total_amount=stats['total_amount'],
-                average_price=stats['total_amount'] / stats['count'] if stats['count'] > 0 else 0.0
+                count=count,
+                total_amount=round_amount(total_amount),
+                average_price=round_amount(total_amount / count) if count > 0 else 0.0
             ))
 
         # 即将到期的订阅（30天内）
-        upcoming_date = date.today() + timedelta(days=30)
-        upcoming_renewals = [
-            sub for sub in subscriptions
-            if sub.next_due_date <= upcoming_date
-        ]
+        upcoming_renewals = self.get_upcoming_renewals(renewal_fields)
 
         # 价格区间统计
-        price_ranges = self._calculate_price_ranges(subscriptions)
+        price_ranges = {label: 0 for label in PRICE_RANGE_LABELS}
+        for label, row in aggregates["price_range"].items():
+            price_ranges[label] = row.count
+        for label, (count, _) in archived["price_range"].items():
+            price_ranges[label] += count
 
         return SubscriptionAnalytics(
             total_subscriptions=total_subscriptions,
             active_subscriptions=active_subscriptions,
-            total_monthly_cost=total_monthly_cost,
-            total_yearly_cost=total_yearly_cost,
+            base_currency=get_base_currency(),
+            total_monthly_cost=round_amount(total_monthly_cost),
+            total_yearly_cost=round_amount(total_yearly_cost),
             cycle_breakdown=cycle_breakdown,
             upcoming_renewals=upcoming_renewals,
             price_ranges=price_ranges
         )
 
+    def get_upcoming_renewals(self, renewal_fields: Optional[List[str]] = None) -> List:
+        """30 天内到期的订阅（走 next_due_date 索引）；指定 renewal_fields 时只查询这些列"""
+        upcoming_date = date.today() + timedelta(days=30)
+        if renewal_fields:
+            stmt = (
+                select_subscription_fields(renewal_fields)
+                .where(Subscription.next_due_date <= upcoming_date)
+                .order_by(Subscription.next_due_date)
+            )
+            return fetch_subscription_rows(self.session, stmt)
+
+        stmt = (
+            select(Subscription)
+            .where(Subscription.next_due_date <= upcoming_date)
+            .order_by(Subscription.next_due_date)
+        )
+        return list(self.session.exec(stmt).all())
+
     def _calculate_price_ranges(self, subscriptions: List[Subscription]) -> Dict[str, int]:
         """计算价格区间分布"""
-        ranges = {
-            "0-50": 0,
-            "50-100": 0,
-            "100-300": 0,
-            "300-500": 0,
-            "500+": 0
-        }
+        ranges = {label: 0 for label in PRICE_RANGE_LABELS}
 
         for sub in subscriptions:
             if sub.price < 50:
@@ -115,60 +168,110 @@ class AnalyticsService:
 
         return ranges
 
-    def get_price_trend(self) -> PriceTrend:
-        """获取价格趋势分析"""
-        subscriptions = self.get_all_subscriptions()
-
-        # 生成最近12个月的月度支出统计
-        monthly_spending = []
-        today = date.today()
-
-        # 按货币分组统计
-        currency_stats = defaultdict(lambda: {'monthly': 0.0, 'yearly': 0.0})
-
-        for i in range(12):
-            month_date = today.replace(day=1) - relativedelta(months=i)
-            month_str = month_date.strftime("%Y-%m")
-
-            # 计算该月的总支出（基于当前活跃订阅）
-            month_total = 0.0
-            month_count = 0
+    def get_price_trend(self, from_date: Optional[date] = None, to_date: Optional[date] = None,
+                        granularity: str = "month") -> PriceTrend:
+        """获取价格趋势分析（基于事件日志的前缀和，成本为 O(区间内事件数 + 区间数)）"""
+        to_date = to_date or date.today()
+        from_date = from_date or (to_date.replace(day=1) - relativedelta(months=11))
+        if from_date > to_date:
+            raise ValueError("from must not be later than to")
+
+        buckets = self._trend_buckets(from_date, to_date, granularity)
+        if len(buckets) > MAX_TREND_BUCKETS:
+            raise ValueError(f"Range too large: at most {MAX_TREND_BUCKETS} buckets per request")
+
+        # 区间起点之前的最后一条事件即为起始累计值
+        # occurred_at 为 UTC，区间按本地日期划分
+        range_start = utc_day_start(from_date)
+        range_end = utc_day_start(to_date + timedelta(days=1))
+        baseline_stmt = (
+            select(SubscriptionEvent)
+            .where(SubscriptionEvent.occurred_at < range_start)
+            .order_by(SubscriptionEvent.occurred_at.desc(), SubscriptionEvent.id.desc())
+            .limit(1)
+        )
+        state = self.session.exec(baseline_stmt).first()
 
-            for sub in subscriptions:
-                # 只计算在该月之前或该月创建的订阅
-                if sub.created_at.date() <= month_date:
-                    monthly_cost = self.calculate_monthly_cost(sub)
-                    month_total += monthly_cost
-                    month_count += 1
+        events_stmt = (
+            select(SubscriptionEvent)
+            .where(SubscriptionEvent.occurred_at >= range_start, SubscriptionEvent.occurred_at < range_end)
+            .order_by(SubscriptionEvent.occurred_at, SubscriptionEvent.id)
+        )
+        events = self.session.exec(events_stmt).all()
+
+        # 累计值按原币种分别保存，用当前汇率折算到基准货币后再相加
+        base_currency = get_base_currency()
+        rates = base_rates(self.session)
+        base_totals: Dict[int, float] = {}
+
+        def base_monthly(event: Optional[SubscriptionEvent]) -> float:
+            if event is None:
+                return 0.0
+            if event.id not in base_totals:
+                base_totals[event.id] = sum(
+                    totals["monthly"] * rates.get(currency, 0.0)
+                    for currency, totals in json.loads(event.running_currency_totals).items()
+                )
+            return base_totals[event.id]
 
-                    # 累计货币统计
-                    currency_stats[sub.currency]['monthly'] += monthly_cost
-                    currency_stats[sub.currency]['yearly'] += self.calculate_yearly_cost(sub)
+        monthly_spending = []
+        index = 0
+        for label, bucket_end in buckets:
+            bucket_end_dt = utc_day_start(min(bucket_end, to_date) + timedelta(days=1))
+            while index < len(events) and events[index].occurred_at < bucket_end_dt:
+                state = events[index]
+                index += 1
 
             monthly_spending.append(MonthlySpending(
-                month=month_str,
-                total_amount=month_total,
-                currency="CNY",  # 主要货币，后续可以支持多货币
-                subscription_count=month_count
+                month=label,
+                total_amount=round_amount(base_monthly(state)),
+                currency=base_currency,
+                subscription_count=state.running_count if state else 0
             ))
 
-        # 反转列表，使时间顺序正确
-        monthly_spending.reverse()
+        # 区间终点的按货币统计
+        currency_stats = {}
+        if state:
+            for currency, totals in json.loads(state.running_currency_totals).items():
+                currency_stats[currency] = {
+                    'monthly': totals['monthly'],
+                    'yearly': totals['monthly'] * 12,
+                    'monthly_base': totals['monthly'] * rates.get(currency, 0.0),
+                    'yearly_base': totals['monthly'] * rates.get(currency, 0.0) * 12
+                }
 
-        # 计算总成本
-        total_monthly = sum(self.calculate_monthly_cost(sub) for sub in subscriptions)
-        total_yearly = sum(self.calculate_yearly_cost(sub) for sub in subscriptions)
+        total_monthly = base_monthly(state)
 
         return PriceTrend(
+            granularity=granularity,
             monthly_spending=monthly_spending,
-            total_monthly=total_monthly,
-            total_yearly=total_yearly,
-            currency_breakdown=dict(currency_stats)
+            total_monthly=round_amount(total_monthly),
+            total_yearly=round_amount(total_monthly * 12),
+            currency_breakdown=currency_stats
         )
 
+    def _trend_buckets(self, from_date: date, to_date: date, granularity: str) -> List[Tuple[str, date]]:
+        """生成 (标签, 区间最后一天) 列表"""
+        if granularity == "day":
+            start, step, label_format = from_date, relativedelta(days=1), "%Y-%m-%d"
+        elif granularity == "week":
+            start, step, label_format = from_date - timedelta(days=from_date.weekday()), relativedelta(weeks=1), "%Y-%m-%d"
+        elif granularity == "month":
+            start, step, label_format = from_date.replace(day=1), relativedelta(months=1), "%Y-%m"
+        else:
+            raise ValueError(f"Invalid granularity: {granularity}")
+
+        buckets = []
+        while start <= to_date and len(buckets) <= MAX_TREND_BUCKETS:
+            buckets.append((start.strftime(label_format), start + step - timedelta(days=1)))
+            start += step
+        return buckets
+
     def get_creation_timeline(self) -> List[TimelineData]:
         """获取订阅创建时间线"""
         subscriptions = self.get_all_subscriptions()
+        if self.include_archived:
+            subscriptions += self.get_archived_subscriptions()
 
         # 按月分组统计创建的订阅
         timeline_stats = defaultdict(lambda: {'count': 0, 'amount': 0.0})
@@ -176,7 +279,7 @@ class AnalyticsService:
         for sub in subscriptions:
             month_key = sub.created_at.strftime("%Y-%m")
             timeline_stats[month_key]['count'] += 1
-            timeline_stats[month_key]['amount'] += sub.price
+            timeline_stats[month_key]['amount'] += base_price(sub)
 
         # 转换为时间线数据
         timeline_data = []
@@ -184,7 +287,7 @@ class AnalyticsService:
             timeline_data.append(TimelineData(
                 date=month,
                 count=stats['count'],
-                amount=stats['amount']
+                amount=round_amount(stats['amount'])
             ))
 
         return timeline_data
@@ -211,7 +314,7 @@ class AnalyticsService:
                 while current_due <= month_end:
                     if month_start <= current_due <= month_end:
                         timeline_stats[month_key]['count'] += 1
-                        timeline_stats[month_key]['amount'] += sub.price
+                        timeline_stats[month_key]['amount'] += base_price(sub)
                         break
 
                     # 计算下一个续费日期
@@ -230,16 +333,27 @@ class AnalyticsService:
             timeline_data.append(TimelineData(
                 date=month,
                 count=stats['count'],
-                amount=stats['amount']
+                amount=round_amount(stats['amount'])
             ))
 
         return timeline_data
 
-    def get_comprehensive_analysis(self) -> TrendAnalysis:
+    def get_comprehensive_analysis(self, renewal_fields: Optional[List[str]] = None) -> TrendAnalysis:
         """获取综合趋势分析"""
         return TrendAnalysis(
-            subscription_analytics=self.get_subscription_analytics(),
+            subscription_analytics=self.get_subscription_analytics(renewal_fields),
             price_trend=self.get_price_trend(),
             creation_timeline=self.get_creation_timeline(),
             renewal_timeline=self.get_renewal_timeline()
-        )
\ No newline at end of file
+        )
+
+    def get_analysis_sections(self, sections: List[str],
+                              renewal_fields: Optional[List[str]] = None) -> Dict[str, object]:
+        """只计算请求的综合分析部分"""
+        builders = {
+            "subscription_analytics": lambda: self.get_subscription_analytics(renewal_fields),
+            "price_trend": self.get_price_trend,
+            "creation_timeline": self.get_creation_timeline,
+            "renewal_timeline": self.get_renewal_timeline,
+        }
+        return {section: builders[section]() for section in sections}
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+订阅归档模块
+取消的订阅从 subscriptions 移到 archived_subscriptions，热表及其索引、汇总表、
+全文索引只保留活跃订阅；需要历史数据的分析可以按需合并归档表。
+"""
+import logging
+from datetime import datetime
+from typing import List, Optional
+from sqlmodel import Session, select
+from models import Subscription, ArchivedSubscription
+from event_log import record_subscription_change, snapshot
+from costs import apply_normalized_costs
+
+logger = logging.getLogger(__name__)
+
+# 归档表与订阅表共有的列
+SUBSCRIPTION_COLUMNS = list(Subscription.model_fields)
+
+
+def archive_subscription(session: Session, subscription_id: int,
+                         reason: Optional[str] = None) -> Optional[ArchivedSubscription]:
+    """在同一事务中把订阅移入归档表；订阅不存在时返回 None"""
+    subscription = session.get(Subscription, subscription_id)
+    if not subscription:
+        return None
+
+    archived = ArchivedSubscription(
+        **{column: getattr(subscription, column) for column in SUBSCRIPTION_COLUMNS},
+        archived_at=datetime.utcnow(),
+        archive_reason=reason,
+    )
+    before = snapshot(subscription)
+    session.add(archived)
+    session.delete(subscription)
+    record_subscription_change(session, subscription_id, before, None, event_type="archived")
+    session.commit()
+    session.refresh(archived)
+
+    logger.info(f"Archived subscription {subscription_id} ({archived.name})")
+    return archived
+
+
+def restore_subscription(session: Session, archive_id: int) -> Optional[Subscription]:
+    """把归档订阅移回 subscriptions；原 id 已被占用时分配新 id，归档记录不存在时返回 None"""
+    archived = session.get(ArchivedSubscription, archive_id)
+    if not archived:
+        return None
+
+    values = {column: getattr(archived, column) for column in SUBSCRIPTION_COLUMNS}
+    if session.get(Subscription, archived.id) is not None:
+        values.pop("id")
+    subscription = Subscription(**values)
+    # 归档期间基准货币或汇率可能已变化，恢复时重新折算
+    apply_normalized_costs(subscription)
+
+    session.add(subscription)
+    session.delete(archived)
+    session.flush()
+    record_subscription_change(session, subscription.id, None, snapshot(subscription), event_type="restored")
+    session.commit()
+    session.refresh(subscription)
+
+    logger.info(f"Restored archived subscription {archive_id} as subscription {subscription.id}")
+    return subscription
+
+
+def list_archived_subscriptions(session: Session, limit: int = 100, offset: int = 0) -> List[ArchivedSubscription]:
+    """按归档时间倒序列出归档订阅"""
+    stmt = (
+        select(ArchivedSubscription)
+        .order_by(ArchivedSubscription.archived_at.desc(), ArchivedSubscription.archive_id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    return list(session.exec(stmt).all())
@@ -0,0 +1,94 @@
+"""
+自动续费模块
+用一条基于集合的 UPDATE 把所有已过期且开启自动续费的订阅推进到下一个未来到期日。
+到期日按闭式公式计算：跳过 k 个周期，日期保持原来的几号（超出当月天数时取月末），
+与 cycles.nth_due_date 的规则相同，整条语句在 SQLite 内完成，不逐行回调 Python。
+"""
+import logging
+from datetime import date
+from typing import List
+from sqlalchemy import text
+from sqlmodel import Session
+from cycles import CYCLE_MONTHS
+from settings_registry import settings_registry, parse_bool
+
+logger = logging.getLogger(__name__)
+
+AUTO_RENEW_SETTING = "auto_renew"
+
+settings_registry.define(AUTO_RENEW_SETTING, parse_bool, False, "未单独设置的订阅是否自动续费")
+
+CYCLE_MONTHS_EXPRESSION = "CASE cycle " + " ".join(
+    f"WHEN '{cycle}' THEN {months}" for cycle, months in CYCLE_MONTHS.items()
+) + " END"
+
+
+def _days_in_month(month_index: str) -> str:
+    """month_index = 年 * 12 + (月 - 1) 对应月份的天数"""
+    return (
+        f"CAST(strftime('%d', date(printf('%04d-%02d-01', ({month_index}) / 12, ({month_index}) % 12 + 1), "
+        "'+1 month', '-1 day')) AS INTEGER)"
+    )
+
+
+def _date_from_month_index(month_index: str, day: str) -> str:
+    return (
+        f"printf('%04d-%02d-%02d', ({month_index}) / 12, ({month_index}) % 12 + 1, "
+        f"min({day}, {_days_in_month(month_index)}))"
+    )
+
+
+AUTO_RENEW_SQL = f"""
+WITH due AS (
+    SELECT id,
+           CAST(strftime('%Y', next_due_date) AS INTEGER) * 12
+               + CAST(strftime('%m', next_due_date) AS INTEGER) - 1 AS month_index,
+           CAST(strftime('%d', next_due_date) AS INTEGER) AS day,
+           {CYCLE_MONTHS_EXPRESSION} AS months
+    FROM subscriptions
+    WHERE next_due_date < :today
+      AND COALESCE(auto_renew, :global_auto_renew) = 1
+      AND cycle IN ({", ".join(f"'{cycle}'" for cycle in CYCLE_MONTHS)})
+),
+candidate AS (
+    SELECT id, month_index, day, months,
+           month_index + ((:today_month_index - month_index) / months) * months AS candidate_index
+    FROM due
+),
+advanced AS (
+    SELECT id,
+           candidate_index + CASE
+               WHEN candidate_index < :today_month_index
+                 OR min(day, {_days_in_month("candidate_index")}) <= :today_day
+               THEN months ELSE 0 END AS new_index,
+           day
+    FROM candidate
+)
+UPDATE subscriptions
+SET next_due_date = {_date_from_month_index("advanced.new_index", "advanced.day")}
+FROM advanced
+WHERE subscriptions.id = advanced.id
+RETURNING subscriptions.id, subscriptions.name, subscriptions.price, subscriptions.currency,
+          subscriptions.cycle, subscriptions.next_due_date
+"""
+
+
+def is_auto_renew_enabled() -> bool:
+    """全局自动续费开关（默认关闭）"""
+    return settings_registry.get(AUTO_RENEW_SETTING)
+
+
+def auto_renew_overdue(session: Session, today: date) -> List[dict]:
+    """推进所有已过期的自动续费订阅并提交，返回被推进的订阅（含新的到期日）"""
+    params = {
+        "today": today.isoformat(),
+        "today_month_index": today.year * 12 + today.month - 1,
+        "today_day": today.day,
+        "global_auto_renew": 1 if is_auto_renew_enabled() else 0,
+    }
+    renewed = [dict(row._mapping) for row in session.execute(text(AUTO_RENEW_SQL), params)]
+    session.commit()
+
+    if renewed:
+        logger.info(f"Auto-renewed {len(renewed)} overdue subscriptions")
+    return renewed
@@ -0,0 +1,333 @@
+"""
+在线备份模块
+用 SQLite 的 online backup API 按页分步复制数据库，每步之间释放读锁并短暂休眠，
+备份期间写入不会被阻塞；快照经过 quick_check 后 gzip 压缩，按数量轮转。
+也可作为命令行工具使用: python backup.py create|list|verify <file>|restore <file>
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+from database import engine, project_root
+from models import BackupSnapshot, BackupResult, BackupStatus, BackupVerification
+from settings_registry import settings_registry
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(project_root, "data", "backups"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "10"))
+# 源库在两步之间被其他连接修改时备份会从头开始；重启次数过多时改为一次性复制
+MAX_RESTARTS = 10
+
+# 文件名带微秒，同一秒内的两次备份（如恢复前的安全快照）不会互相覆盖；不带微秒的是旧版本的快照
+SNAPSHOT_PATTERN = re.compile(r"^subscription-\d{8}-\d{6}(-\d{6})?\.db\.gz$")
+
+
+class BackupInProgressError(RuntimeError):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _database_file() -> str:
+    """当前引擎对应的数据库文件路径"""
+    if engine.url.get_backend_name() != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        raise ValueError("Backups are only supported for file-based SQLite databases")
+    return engine.url.database
+
+
+def snapshot_path(file_name: str) -> str:
+    """校验快照文件名并返回完整路径，防止路径穿越"""
+    if not SNAPSHOT_PATTERN.match(file_name):
+        raise ValueError(f"Invalid backup file name: {file_name}")
+    path = os.path.join(BACKUP_DIR, file_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(file_name)
+    return path
+
+
+def list_snapshots() -> List[BackupSnapshot]:
+    """按时间倒序列出备份目录中的快照"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    snapshots = []
+    for name in os.listdir(BACKUP_DIR):
+        if not SNAPSHOT_PATTERN.match(name):
+            continue
+        stat = os.stat(os.path.join(BACKUP_DIR, name))
+        snapshots.append(BackupSnapshot(
+            file_name=name,
+            size_bytes=stat.st_size,
+            created_at=datetime.fromtimestamp(stat.st_mtime),
+        ))
+    # 文件名中的时间戳可排序
+    return sorted(snapshots, key=lambda snapshot: snapshot.file_name, reverse=True)
+
+
+def _copy_database(source: sqlite3.Connection, target: sqlite3.Connection, pages: int,
+                   status: Optional[BackupStatus] = None):
+    """分步执行 backup API；progress 回调在每步后调用，在此休眠让出锁给写入方"""
+    sleep_seconds = BACKUP_STEP_SLEEP_MS / 1000
+    last_remaining = None
+    last_logged = -1
+
+    def progress(rc, remaining, total):
+        nonlocal last_remaining, last_logged
+        if status is not None:
+            if last_remaining is not None and remaining > last_remaining:
+                status.restarts += 1
+                logger.info(f"Source database changed during backup, restarting copy ({status.restarts})")
+                if status.restarts > MAX_RESTARTS:
+                    raise _TooManyRestarts()
+            status.pages_total = total
+            status.pages_remaining = remaining
+        last_remaining = remaining
+
+        done = (total - remaining) * 100 // total if total else 100
+        if done // 10 > last_logged:
+            last_logged = done // 10
+            logger.info(f"Backup progress: {done}% ({total - remaining}/{total} pages)")
+        if remaining and sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        logger.warning("Too many restarts under concurrent writes, copying remaining backup in one step")
+        source.backup(target, pages=-1)
+
+
+def _quick_check(connection: sqlite3.Connection) -> str:
+    return connection.execute("PRAGMA quick_check").fetchone()[0]
+
+
+def _rotate(keep: int) -> List[str]:
+    """只保留最新的 keep 个快照，返回被删除的文件名"""
+    removed = []
+    for snapshot in list_snapshots()[keep:]:
+        os.remove(os.path.join(BACKUP_DIR, snapshot.file_name))
+        removed.append(snapshot.file_name)
+    if removed:
+        logger.info(f"Rotated old backups: {', '.join(removed)}")
+    return removed
+
+
+def _decompress(path: str, target_path: str):
+    with gzip.open(path, "rb") as src, open(target_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+class BackupService:
+    """在线备份、校验与恢复；同一时间只运行一个备份"""
+
+    def __init__(self):
+        self.status = BackupStatus()
+        self.lock = threading.Lock()
+        self.tasks = set()
+
+    def _acquire(self):
+        if not self.lock.acquire(blocking=False):
+            raise BackupInProgressError("A backup is already in progress")
+        self.status = BackupStatus(
+            running=True, started_at=datetime.utcnow(), last_result=self.status.last_result
+        )
+
+    def create_backup(self, keep: int = BACKUP_KEEP, pages_per_step: int = BACKUP_PAGES_PER_STEP) -> BackupResult:
+        """复制数据库到临时文件、校验、压缩并轮转；已有备份在运行时抛出 BackupInProgressError"""
+        self._acquire()
+        return self._run_backup(keep, pages_per_step)
+
+    def start_backup(self) -> BackupStatus:
+        """在后台线程中开始备份并立即返回状态（供接口调用）"""
+        self._acquire()
+        task = asyncio.create_task(asyncio.to_thread(self._run_backup, BACKUP_KEEP, BACKUP_PAGES_PER_STEP))
+        # 保留任务引用直到完成，失败已记录在 status 中
+        self.tasks.add(task)
+        task.add_done_callback(self._discard_task)
+        return self.status
+
+    def _discard_task(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def _run_backup(self, keep: int, pages_per_step: int) -> BackupResult:
+        """持有锁时执行备份，结束后释放锁"""
+        try:
+            started = time.perf_counter()
+            file_name = f"subscription-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db.gz"
+            final_path = os.path.join(BACKUP_DIR, file_name)
+            raw_path = f"{final_path[:-3]}.tmp"
+            compressed_path = f"{final_path}.tmp"
+
+            try:
+                source_path = _database_file()
+                os.makedirs(BACKUP_DIR, exist_ok=True)
+                source = sqlite3.connect(source_path)
+                target = sqlite3.connect(raw_path)
+                try:
+                    _copy_database(source, target, pages_per_step, self.status)
+                    pages = target.execute("PRAGMA page_count").fetchone()[0]
+                    integrity = _quick_check(target)
+                finally:
+                    target.close()
+                    source.close()
+                if integrity != "ok":
+                    raise RuntimeError(f"Backup failed quick_check: {integrity}")
+
+                size_bytes = os.path.getsize(raw_path)
+                with open(raw_path, "rb") as src, gzip.open(compressed_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(compressed_path, final_path)
+            except BaseException as e:
+                self.status.running = False
+                self.status.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Backup failed: {e}")
+                raise
+            finally:
+                for path in (raw_path, compressed_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            result = BackupResult(
+                file_name=file_name,
+                pages=pages,
+                size_bytes=size_bytes,
+                compressed_bytes=os.path.getsize(final_path),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                restarts=self.status.restarts,
+                finished_at=datetime.utcnow(),
+            )
+            self.status.running = False
+            self.status.pages_remaining = 0
+            self.status.last_result = result
+            self.status.last_error = None
+            _rotate(keep)
+
+            logger.info(
+                f"Backup {file_name} completed in {result.duration_ms:.0f}ms "
+                f"({pages} pages, {size_bytes} -> {result.compressed_bytes} bytes, {result.restarts} restarts)"
+            )
+            return result
+        finally:
+            self.lock.release()
+
+    def verify_backup(self, file_name: str) -> BackupVerification:
+        """解压到临时文件并执行 integrity_check"""
+        path = snapshot_path(file_name)
+        started = time.perf_counter()
+        temp_path = f"{path[:-3]}.verify"
+        try:
+            _decompress(path, temp_path)
+            connection = sqlite3.connect(temp_path)
+            try:
+                integrity = "; ".join(row[0] for row in connection.execute("PRAGMA integrity_check"))
+                try:
+                    subscriptions = connection.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+                except sqlite3.Error:
+                    subscriptions = None
+            finally:
+                connection.close()
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            integrity = f"{type(e).__name__}: {e}"
+            subscriptions = None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return BackupVerification(
+            file_name=file_name,
+            ok=integrity == "ok",
+            integrity=integrity,
+            subscriptions=subscriptions,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+
+    def restore_backup(self, file_name: str, keep: int = BACKUP_KEEP) -> BackupVerification:
+        """校验快照后先备份当前数据库，再用 backup API 写回；运行中的服务可继续使用同一文件"""
+        verification = self.verify_backup(file_name)
+        if not verification.ok:
+            raise ValueError(f"Backup {file_name} failed verification: {verification.integrity}")
+
+        path = snapshot_path(file_name)
+        temp_path = f"{path[:-3]}.restore"
+        try:
+            # 先解压，避免安全快照的轮转删掉正在恢复的文件
+            _decompress(path, temp_path)
+            safety = self.create_backup(keep=max(keep, len(list_snapshots()) + 1))
+            logger.info(f"Saved current database as {safety.file_name} before restoring")
+
+            source = sqlite3.connect(temp_path)
+            target = sqlite3.connect(_database_file())
+            try:
+                current_version = _read_data_version(target)
+                source.backup(target, pages=-1)
+                # 恢复出的版本号可能小于进程内缓存见过的版本，必须继续递增
+                restored_version = _read_data_version(target)
+                if current_version is not None and restored_version is not None:
+                    target.execute(
+                        "UPDATE data_version SET version = ? WHERE id = 1",
+                        (max(current_version, restored_version) + 1,)
+                    )
+                    target.commit()
+            finally:
+                target.close()
+                source.close()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # 恢复绕过了设置缓存，重新加载并通知 Telegram 服务等订阅者
+        settings_registry.reload()
+        logger.info(f"Restored database from {file_name}")
+        return verification
+
+
+def _read_data_version(connection: sqlite3.Connection) -> Optional[int]:
+    try:
+        row = connection.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+# 全局实例
+backup_service = BackupService()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online backups of the subscription database")
+    parser.add_argument("command", choices=["create", "list", "verify", "restore"])
+    parser.add_argument("file", nargs="?", help="Snapshot file name for verify/restore")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command in ("verify", "restore") and not args.file:
+        parser.error(f"{args.command} requires a snapshot file name")
+
+    if args.command == "create":
+        result = backup_service.create_backup()
+        print(f"{result.file_name}: {result.pages} pages, {result.compressed_bytes} bytes, {result.duration_ms:.0f}ms")
+    elif args.command == "list":
+        for snapshot in list_snapshots():
+            print(f"{snapshot.file_name}\t{snapshot.size_bytes}\t{snapshot.created_at:%Y-%m-%d %H:%M:%S}")
+    elif args.command == "verify":
+        verification = backup_service.verify_backup(args.file)
+        print(f"{verification.file_name}: {verification.integrity} ({verification.subscriptions} subscriptions)")
+        sys.exit(0 if verification.ok else 1)
+    else:
+        backup_service.restore_backup(args.file)
+        print(f"Restored {args.file}")
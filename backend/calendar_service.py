@@ -0,0 +1,199 @@
+"""
+续费日历服务模块
+按续费规则在服务端展开指定区间内的续费日期，并生成 iCalendar 订阅源
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+from sqlmodel import Session, select
+from models import Subscription, CalendarOccurrence
+from cycles import iter_due_dates
+from data_version import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# 单次查询允许的最大区间天数
+MAX_CALENDAR_DAYS = 731
+
+# iCal 订阅源默认覆盖的天数
+DEFAULT_FEED_DAYS = 365
+
+# 缓存的 iCal 文档数量上限
+FEED_CACHE_SIZE = 16
+
+CYCLE_TEXT = {
+    "monthly": "月度",
+    "quarterly": "季度",
+    "yearly": "年度"
+}
+
+
+def resolve_range(from_date: Optional[date], to_date: Optional[date],
+                  default_days: int) -> Tuple[date, date]:
+    """补全默认区间并校验区间长度"""
+    from_date = from_date or date.today()
+    to_date = to_date or from_date + timedelta(days=default_days)
+    if from_date > to_date:
+        raise ValueError("from must not be later than to")
+    if (to_date - from_date).days > MAX_CALENDAR_DAYS:
+        raise ValueError(f"Range too large: at most {MAX_CALENDAR_DAYS} days per request")
+    return from_date, to_date
+
+
+class CalendarService:
+    """续费日历服务类"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def _subscriptions_due_by(self, to_date: date) -> List[Subscription]:
+        """只有下次到期日不晚于区间终点的订阅才可能在区间内续费"""
+        stmt = (
+            select(Subscription)
+            .where(Subscription.next_due_date <= to_date)
+            .order_by(Subscription.next_due_date)
+        )
+        return list(self.session.exec(stmt).all())
+
+    def _iter_occurrences(self, subscription: Subscription, from_date: date,
+                          to_date: date) -> Iterator[date]:
+        for due_date in iter_due_dates(subscription.next_due_date, subscription.cycle, to_date):
+            if due_date >= from_date:
+                yield due_date
+
+    def get_occurrences(self, from_date: date, to_date: date) -> List[CalendarOccurrence]:
+        """获取区间内的所有续费日期，按日期排序"""
+        occurrences = []
+        for sub in self._subscriptions_due_by(to_date):
+            for due_date in self._iter_occurrences(sub, from_date, to_date):
+                occurrences.append(CalendarOccurrence(
+                    date=due_date,
+                    subscription_id=sub.id,
+                    name=sub.name,
+                    price=sub.price,
+                    currency=sub.currency,
+                    cycle=sub.cycle,
+                    next_due_date=sub.next_due_date
+                ))
+        occurrences.sort(key=lambda item: (item.date, item.subscription_id))
+        return occurrences
+
+    def iter_ical(self, from_date: date, to_date: date,
+                  subscriptions: Optional[List[Subscription]] = None) -> Iterator[str]:
+        """逐个订阅增量生成 iCalendar 文本；传入 subscriptions 时不再访问会话"""
+        if subscriptions is None:
+            subscriptions = self._subscriptions_due_by(to_date)
+        yield _ical_lines([
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Subscription Manager//Renewal Calendar//ZH",
+            "CALSCALE:GREGORIAN",
+            "X-WR-CALNAME:订阅续费",
+        ])
+
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        for sub in subscriptions:
+            lines = []
+            cycle = getattr(sub.cycle, "value", sub.cycle)
+            for due_date in self._iter_occurrences(sub, from_date, to_date):
+                lines.extend([
+                    "BEGIN:VEVENT",
+                    f"UID:subscription-{sub.id}-{due_date:%Y%m%d}@subscription-manager",
+                    f"DTSTAMP:{stamp}",
+                    f"DTSTART;VALUE=DATE:{due_date:%Y%m%d}",
+                    f"DTEND;VALUE=DATE:{due_date + timedelta(days=1):%Y%m%d}",
+                    f"SUMMARY:{_escape(f'{sub.name} {sub.price} {sub.currency}')}",
+                    f"DESCRIPTION:{_escape(f'续费周期: {CYCLE_TEXT.get(cycle, cycle)}')}",
+                    "END:VEVENT",
+                ])
+            if lines:
+                yield _ical_lines(lines)
+
+        yield _ical_lines(["END:VCALENDAR"])
+
+
+class ICalFeedCache:
+    """按 (数据版本, 区间) 缓存已生成的 iCal 文档；端点和流式响应的迭代都在线程池中执行，读写需加锁"""
+
+    def __init__(self, max_entries: int = FEED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[int, date, date], str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[int, date, date]) -> Optional[str]:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[int, date, date], body: str):
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stream(self, session: Session, from_date: date, to_date: date) -> Tuple[str, Iterator[str]]:
+        """返回 (ETag, 文本分块迭代器)；命中缓存时直接返回完整文档。
+        订阅行在返回前读取完毕，迭代器在请求会话关闭后执行也不会再访问会话"""
+        version = get_data_version(session)
+        key = (version, from_date, to_date)
+        etag = f'"{version}-{from_date:%Y%m%d}-{to_date:%Y%m%d}"'
+
+        cached = self.get(key)
+        if cached is not None:
+            return etag, iter([cached])
+
+        service = CalendarService(session)
+        subscriptions = service._subscriptions_due_by(to_date)
+
+        def generate() -> Iterator[str]:
+            chunks = []
+            for chunk in service.iter_ical(from_date, to_date, subscriptions):
+                chunks.append(chunk)
+                yield chunk
+            self.put(key, "".join(chunks))
+            logger.info(f"Cached iCal feed for data version {version}")
+
+        return etag, generate()
+
+
+def _escape(value: str) -> str:
+    """按 RFC 5545 转义文本属性值"""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """按 RFC 5545 将超过 75 字节的行折叠"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = char
+            limit = 74  # 续行以一个空格开头
+        else:
+            current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _ical_lines(lines: List[str]) -> str:
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+# 全局实例
+ical_feed_cache = ICalFeedCache()
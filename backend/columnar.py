@@ -0,0 +1,296 @@
+"""
+列式分析引擎
+把活跃订阅的价格、周期、货币、到期日、创建日期和基准货币月度成本一次性载入 NumPy 数组，
+在数据版本（data_version）不变期间跨请求复用；统计、时间线和假设分析都用向量化运算完成。
+"""
+import logging
+import threading
+import time
+from datetime import date
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import text
+from sqlmodel import Session
+from models import (
+    CycleAnalysis, TimelineData, SubscriptionAnalytics,
+    ScenarioFilter, ScenarioRequest, ScenarioTotals, ScenarioResult
+)
+from analytics import AnalyticsService, PRICE_RANGE_LABELS
+from cycles import CYCLE_MONTHS
+from costs import get_base_currency, round_amount
+from data_version import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# cycle_code -> 周期名称；未知周期编码为 len(CYCLE_NAMES)，保证编码非负可直接 bincount
+CYCLE_NAMES = list(CYCLE_MONTHS)
+UNKNOWN_CYCLE = len(CYCLE_NAMES)
+# 末尾追加 0，使未知周期查到 0 个月
+CYCLE_MONTHS_LOOKUP = np.array([CYCLE_MONTHS[name] for name in CYCLE_NAMES] + [0], dtype=np.int64)
+
+# 价格区间的右边界，与 PRICE_RANGE_LABELS 对应（左闭右开）
+PRICE_RANGE_EDGES = np.array([50.0, 100.0, 300.0, 500.0])
+
+LOAD_SQL = (
+    "SELECT price, CASE cycle "
+    + " ".join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(CYCLE_NAMES))
+    + f" ELSE {UNKNOWN_CYCLE} END, currency, next_due_date, substr(created_at, 1, 10), monthly_cost_base "
+    "FROM subscriptions"
+)
+
+
+class ColumnarFrame:
+    """某一数据版本下活跃订阅的列式快照"""
+
+    def __init__(self, version: int, rows: list):
+        self.version = version
+        columns = list(zip(*rows)) if rows else [()] * 6
+        price, cycle_code, currency, next_due, created, monthly_base = columns
+
+        self.price = np.array(price, dtype=np.float64)
+        self.cycle_code = np.array(cycle_code, dtype=np.intp)
+        self.cycle_months = CYCLE_MONTHS_LOOKUP[self.cycle_code]
+        currencies, currency_code = np.unique(np.array(currency, dtype=str), return_inverse=True)
+        self.currencies: List[str] = [str(name) for name in currencies]
+        self.currency_code = currency_code.reshape(-1).astype(np.intp)
+        self.price_bucket = _price_buckets(self.price)
+        self.next_due = np.array(next_due, dtype="datetime64[D]")
+        self.created = np.array(created, dtype="datetime64[D]")
+        # 汇率缺失时成本列为 NULL，与汇总表一样按 0 计
+        self.monthly_base = np.nan_to_num(np.array(monthly_base, dtype=np.float64), nan=0.0)
+        # 按基准货币计的单期价格，时间线金额用它求和
+        self.price_base = self.monthly_base * self.cycle_months
+        self._baseline: Optional[ScenarioTotals] = None
+
+    @property
+    def baseline(self) -> ScenarioTotals:
+        """未做任何调整的汇总，同一快照只计算一次"""
+        if self._baseline is None:
+            self._baseline = _totals(self, None, self.price_bucket, self.monthly_base)
+        return self._baseline
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+
+class ColumnarCache:
+    """按数据版本缓存列式快照，版本变化时整体重新载入"""
+
+    def __init__(self):
+        self.frame: Optional[ColumnarFrame] = None
+        self.lock = threading.Lock()
+
+    def get(self, session: Session) -> ColumnarFrame:
+        version = get_data_version(session)
+        frame = self.frame
+        if frame is not None and frame.version == version:
+            return frame
+
+        with self.lock:
+            if self.frame is None or self.frame.version != version:
+                started = time.perf_counter()
+                rows = session.execute(text(LOAD_SQL)).all()
+                self.frame = ColumnarFrame(version, rows)
+                logger.info(
+                    f"Loaded {len(self.frame)} subscriptions into columnar frame "
+                    f"(data version {version}) in {(time.perf_counter() - started) * 1000:.0f}ms"
+                )
+            return self.frame
+
+
+def _price_buckets(price: np.ndarray) -> np.ndarray:
+    """价格 -> PRICE_RANGE_LABELS 下标（边界很少，逐个比较比 searchsorted 快）"""
+    bucket = np.zeros(len(price), dtype=np.intp)
+    for edge in PRICE_RANGE_EDGES:
+        bucket += price >= edge
+    return bucket
+
+
+def _code_mask(codes: np.ndarray, size: int, selected: List[int]) -> np.ndarray:
+    """编码列的成员判断：查表比 np.isin 快得多"""
+    table = np.zeros(size + 1, dtype=bool)  # 多出的一位对应未知周期
+    table[selected] = True
+    return table[codes]
+
+
+def _filter_mask(frame: ColumnarFrame, where: ScenarioFilter) -> np.ndarray:
+    """按调整前的数据计算匹配条件的行"""
+    mask = np.ones(len(frame), dtype=bool)
+    if where.cycles is not None:
+        codes = [CYCLE_NAMES.index(cycle.value) for cycle in where.cycles]
+        mask &= _code_mask(frame.cycle_code, len(CYCLE_NAMES), codes)
+    if where.currencies is not None:
+        wanted = {currency.upper() for currency in where.currencies}
+        codes = [code for code, currency in enumerate(frame.currencies) if currency.upper() in wanted]
+        mask &= _code_mask(frame.currency_code, len(frame.currencies), codes)
+    if where.min_price is not None:
+        mask &= frame.price >= where.min_price
+    if where.max_price is not None:
+        mask &= frame.price < where.max_price
+    return mask
+
+
+def _cycle_breakdown(cycle_code: np.ndarray, monthly_base: np.ndarray) -> List[CycleAnalysis]:
+    """单期金额 = 基准货币月度成本 × 周期月数"""
+    counts = np.bincount(cycle_code, minlength=UNKNOWN_CYCLE + 1)
+    monthly_totals = np.bincount(cycle_code, weights=monthly_base, minlength=UNKNOWN_CYCLE + 1)
+
+    breakdown = []
+    for code in np.flatnonzero(counts[:UNKNOWN_CYCLE]):
+        name = CYCLE_NAMES[code]
+        total_amount = float(monthly_totals[code]) * CYCLE_MONTHS[name]
+        breakdown.append(CycleAnalysis(
+            cycle=name,
+            count=int(counts[code]),
+            total_amount=round_amount(total_amount),
+            average_price=round_amount(total_amount / int(counts[code]))
+        ))
+    return sorted(breakdown, key=lambda item: item.cycle)
+
+
+def _totals(frame: ColumnarFrame, mask: Optional[np.ndarray], price_bucket: np.ndarray,
+            monthly_base: np.ndarray) -> ScenarioTotals:
+    """汇总 mask 选中的行（None 表示全部）"""
+    cycle_code = frame.cycle_code
+    currency_code = frame.currency_code
+    if mask is not None:
+        cycle_code = cycle_code[mask]
+        currency_code = currency_code[mask]
+        price_bucket = price_bucket[mask]
+        monthly_base = monthly_base[mask]
+
+    currency_counts = np.bincount(currency_code, minlength=len(frame.currencies))
+    currency_monthly = np.bincount(currency_code, weights=monthly_base, minlength=len(frame.currencies))
+    currency_breakdown = {
+        frame.currencies[code]: {
+            "monthly": round_amount(float(currency_monthly[code])),
+            "yearly": round_amount(float(currency_monthly[code]) * 12)
+        }
+        for code in np.flatnonzero(currency_counts)
+    }
+
+    price_counts = np.bincount(price_bucket, minlength=len(PRICE_RANGE_LABELS))
+    total_monthly = float(monthly_base.sum())
+    return ScenarioTotals(
+        subscription_count=len(monthly_base),
+        total_monthly_cost=round_amount(total_monthly),
+        total_yearly_cost=round_amount(total_monthly * 12),
+        cycle_breakdown=_cycle_breakdown(cycle_code, monthly_base),
+        currency_breakdown=currency_breakdown,
+        price_ranges={label: int(count) for label, count in zip(PRICE_RANGE_LABELS, price_counts)}
+    )
+
+
+class ColumnarAnalyticsService(AnalyticsService):
+    """基于列式快照的分析服务；包含归档订阅的查询回退到逐行实现"""
+
+    def __init__(self, session: Session, include_archived: bool = False):
+        super().__init__(session, include_archived)
+        self._frame: Optional[ColumnarFrame] = None
+
+    @property
+    def frame(self) -> ColumnarFrame:
+        if self._frame is None:
+            self._frame = columnar_cache.get(self.session)
+        return self._frame
+
+    def get_subscription_analytics(self, renewal_fields: Optional[List[str]] = None) -> SubscriptionAnalytics:
+        """获取订阅数据综合分析（成本按基准货币计）"""
+        if self.include_archived:
+            return super().get_subscription_analytics(renewal_fields)
+
+        totals = self.frame.baseline
+        return SubscriptionAnalytics(
+            total_subscriptions=totals.subscription_count,
+            active_subscriptions=totals.subscription_count,
+            base_currency=get_base_currency(),
+            total_monthly_cost=totals.total_monthly_cost,
+            total_yearly_cost=totals.total_yearly_cost,
+            cycle_breakdown=totals.cycle_breakdown,
+            upcoming_renewals=self.get_upcoming_renewals(renewal_fields),
+            price_ranges=totals.price_ranges
+        )
+
+    def get_creation_timeline(self) -> List[TimelineData]:
+        """按创建月份分组统计数量与基准货币价格"""
+        if self.include_archived:
+            return super().get_creation_timeline()
+
+        frame = self.frame
+        months, month_index = np.unique(frame.created.astype("datetime64[M]"), return_inverse=True)
+        month_index = month_index.reshape(-1)
+        counts = np.bincount(month_index, minlength=len(months))
+        amounts = np.bincount(month_index, weights=frame.price_base, minlength=len(months))
+        return [
+            TimelineData(date=str(month), count=int(count), amount=round_amount(float(amount)))
+            for month, count, amount in zip(months, counts, amounts)
+        ]
+
+    def get_renewal_timeline(self) -> List[TimelineData]:
+        """未来 12 个月每月续费的订阅数与金额：到期月份之后相隔整数个周期的月份有续费"""
+        frame = self.frame
+        due_month = frame.next_due.astype("datetime64[M]").astype(np.int64)
+        known = frame.cycle_months > 0
+        months = np.where(known, frame.cycle_months, 1)
+        this_month = np.datetime64(date.today(), "M")
+
+        timeline_data = []
+        for offset in range(12):
+            month = this_month + offset
+            elapsed = month.astype(np.int64) - due_month
+            renews = known & (elapsed >= 0) & (elapsed % months == 0)
+            count = int(renews.sum())
+            if count:
+                timeline_data.append(TimelineData(
+                    date=str(month), count=count, amount=round_amount(float(frame.price_base[renews].sum()))
+                ))
+        return timeline_data
+
+    def run_scenario(self, request: ScenarioRequest) -> ScenarioResult:
+        """在当前数据上应用筛选、剔除、调价和汇率调整，返回调整前后的汇总对比"""
+        started = time.perf_counter()
+        frame = self.frame
+
+        mask = None
+        if request.include is not None:
+            mask = _filter_mask(frame, request.include)
+        for where in request.exclude:
+            excluded = _filter_mask(frame, where)
+            mask = ~excluded if mask is None else mask & ~excluded
+
+        # 只有存在调整时才生成新的价格/成本列
+        price_bucket = frame.price_bucket
+        monthly_base = frame.monthly_base
+        if request.price_adjustments:
+            factor = np.ones(len(frame))
+            for adjustment in request.price_adjustments:
+                if adjustment.percent <= -100:
+                    raise ValueError("Price adjustments must be greater than -100%")
+                factor[_filter_mask(frame, adjustment.where)] *= 1 + adjustment.percent / 100
+            price_bucket = _price_buckets(frame.price * factor)
+            monthly_base = monthly_base * factor
+
+        if request.rate_adjustments:
+            rate_factor = np.ones(len(frame.currencies))
+            for currency, percent in request.rate_adjustments.items():
+                if percent <= -100:
+                    raise ValueError("Rate adjustments must be greater than -100%")
+                for code, name in enumerate(frame.currencies):
+                    if name.upper() == currency.upper():
+                        rate_factor[code] *= 1 + percent / 100
+            monthly_base = monthly_base * rate_factor[frame.currency_code]
+
+        baseline = frame.baseline
+        scenario = _totals(frame, mask, price_bucket, monthly_base)
+        return ScenarioResult(
+            base_currency=get_base_currency(),
+            baseline=baseline,
+            scenario=scenario,
+            monthly_delta=round_amount(scenario.total_monthly_cost - baseline.total_monthly_cost),
+            yearly_delta=round_amount(scenario.total_yearly_cost - baseline.total_yearly_cost),
+            computed_ms=(time.perf_counter() - started) * 1000
+        )
+
+
+# 全局实例
+columnar_cache = ColumnarCache()
@@ -0,0 +1,136 @@
+"""
+订阅成本折算模块
+新建、更新、续费时计算原币种与基准货币下的月度/年度成本并写入订阅行（只用已缓存的汇率，
+请求中不访问汇率接口），汇率或基准货币变化时由后台任务按货币批量刷新（归档订阅一并刷新）。
+"""
+import logging
+import os
+from typing import Dict
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from models import Subscription, SubscriptionAggregate
+from cycles import monthly_cost, CYCLE_MONTHS
+from aggregates import MONTHLY_COST_EXPRESSION
+from currency_service import currency_service
+from settings_registry import settings_registry
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY_SETTING = "base_currency"
+DEFAULT_BASE_CURRENCY = os.getenv("BASE_CURRENCY", "CNY")
+
+# 统计接口返回的金额保留的小数位
+AMOUNT_DECIMALS = 2
+
+
+def parse_currency_code(value: str) -> str:
+    code = value.strip().upper()
+    if len(code) != 3 or not code.isalpha():
+        raise ValueError(f"Expected a three-letter currency code, got {value!r}")
+    return code
+
+
+settings_registry.define(
+    BASE_CURRENCY_SETTING, parse_currency_code, DEFAULT_BASE_CURRENCY.upper(),
+    "统计与成本折算使用的基准货币"
+)
+
+
+def get_base_currency() -> str:
+    """读取基准货币设置，未设置时使用 BASE_CURRENCY 环境变量（默认 CNY）"""
+    return settings_registry.get(BASE_CURRENCY_SETTING)
+
+
+def apply_normalized_costs(subscription: Subscription) -> bool:
+    """根据价格、周期和缓存的汇率填充订阅的成本列；
+    汇率不在缓存中时基准货币成本留空并返回 False，由后台刷新任务补齐"""
+    subscription.monthly_cost = monthly_cost(subscription.price, subscription.cycle)
+    subscription.yearly_cost = subscription.monthly_cost * 12
+
+    rate = currency_service.cached_conversion_rate(subscription.currency, get_base_currency())
+    # 没有汇率时留空，汇总表和 base_rates 都按缺失处理，不把原币金额当作基准货币
+    subscription.monthly_cost_base = subscription.monthly_cost * rate if rate is not None else None
+    subscription.yearly_cost_base = subscription.yearly_cost * rate if rate is not None else None
+    return rate is not None
+
+
+def base_rates(session: Session) -> Dict[str, float]:
+    """由成本列反推各货币到基准货币的当前汇率（基准货币成本 / 原币种成本）；
+    活跃订阅取汇总表，只在归档中出现的货币取归档表，无法得出汇率的货币不在结果中"""
+    rates = {get_base_currency(): 1.0}
+    rows = session.execute(text(
+        "SELECT currency, TOTAL(monthly_cost_base), TOTAL(monthly_cost) FROM archived_subscriptions "
+        "WHERE monthly_cost_base IS NOT NULL GROUP BY currency"
+    )).all()
+    aggregates = session.exec(
+        select(SubscriptionAggregate).where(SubscriptionAggregate.dimension == "currency")
+    ).all()
+    rows += [(row.bucket, row.monthly_base_total, row.monthly_total) for row in aggregates]
+    # 汇总表在后，覆盖归档表得出的汇率
+    for currency, monthly_base_total, monthly_total in rows:
+        if monthly_total and monthly_base_total:
+            rates[currency] = monthly_base_total / monthly_total
+    return rates
+
+
+def round_amount(value: float) -> float:
+    """统计金额统一在返回前舍入：汇总表按写入顺序累加、列式路径按数组求和，
+    浮点误差不同，舍入后两条路径的结果一致"""
+    return round(value, AMOUNT_DECIMALS)
+
+
+def base_price(subscription) -> float:
+    """按基准货币计的单期价格；汇率缺失时与汇总表一样按 0 计"""
+    months = CYCLE_MONTHS.get(getattr(subscription.cycle, "value", subscription.cycle), 0)
+    return (subscription.monthly_cost_base or 0.0) * months
+
+
+# 保存成本列、需要随基准货币刷新的表
+COST_TABLES = ("subscriptions", "archived_subscriptions")
+
+
+async def refresh_base_costs(session: Session) -> int:
+    """按货币逐个用一条 UPDATE 刷新活跃与归档订阅的基准货币成本，返回更新的行数"""
+    base_currency = get_base_currency()
+    # 活跃订阅的货币取汇总表，归档表只有少量行，直接去重
+    currencies = set(session.exec(
+        select(SubscriptionAggregate.bucket).where(SubscriptionAggregate.dimension == "currency")
+    ).all())
+    currencies.update(session.execute(text("SELECT DISTINCT currency FROM archived_subscriptions")).scalars())
+
+    updated = 0
+    for currency in sorted(currencies):
+        rate = await currency_service.get_conversion_rate(currency, base_currency)
+        for table in COST_TABLES:
+            if rate is None:
+                # 汇率未知：清空之前按其他基准折算的成本
+                result = session.execute(text(
+                    f"UPDATE {table} SET monthly_cost_base = NULL, yearly_cost_base = NULL "
+                    "WHERE currency = :currency AND monthly_cost_base IS NOT NULL"
+                ), {"currency": currency})
+                updated += result.rowcount
+                continue
+            result = session.execute(text(
+                f"UPDATE {table} "
+                "SET monthly_cost_base = monthly_cost * :rate, yearly_cost_base = yearly_cost * :rate "
+                "WHERE currency = :currency AND (monthly_cost_base IS NULL "
+                "OR ABS(monthly_cost_base - monthly_cost * :rate) > 1e-9)"
+            ), {"rate": rate, "currency": currency})
+            updated += result.rowcount
+    session.commit()
+
+    logger.info(f"Refreshed base-currency costs ({base_currency}) for {updated} subscriptions")
+    return updated
+
+
+def backfill_original_costs(engine: Engine):
+    """为迁移前的旧数据补算原币种成本（基准货币成本由刷新任务补齐）"""
+    monthly = MONTHLY_COST_EXPRESSION.format(r="subscriptions")
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            f"UPDATE subscriptions SET monthly_cost = {monthly}, yearly_cost = ({monthly}) * 12 "
+            "WHERE monthly_cost IS NULL"
+        ))
+        if result.rowcount:
+            logger.info(f"Backfilled original-currency costs for {result.rowcount} subscriptions")
@@ -1,23 +1,36 @@
-import asyncio
 import logging
+import os
 import aiohttp
 from typing import Dict, Optional
+from tracing import tracer, traced
+from job_runs import timed
 from datetime import datetime, timedelta
 import json
 
 logger = logging.getLogger(__name__)
 
+# 设置 STUB_SERVER_URL 后改用本地替身服务器（见 stub_servers.py）
+STUB_SERVER_URL = os.getenv("STUB_SERVER_URL", "").rstrip("/")
+
 
 class CurrencyService:
     """货币转换服务 - 使用免费汇率API"""
 
     def __init__(self):
         # 使用 exchangerate-api.com 的免费API
-        self.base_url = "https://api.exchangerate-api.com/v4/latest"
+        self.base_url = os.getenv(
+            "EXCHANGE_RATE_API_URL",
+            f"{STUB_SERVER_URL}/v4/latest" if STUB_SERVER_URL else "https://api.exchangerate-api.com/v4/latest"
+        )
+        self.secondary_url = os.getenv(
+            "EXCHANGE_RATE_SECONDARY_API_URL",
+            f"{STUB_SERVER_URL}/v6/latest" if STUB_SERVER_URL else "https://open.er-api.com/v6/latest"
+        )
         self.fallback_url = "https://api.fixer.io/latest"  # 备用API
         self.cache: Dict[str, Dict] = {}
         self.cache_duration = timedelta(hours=1)  # 缓存1小时
 
+    @traced("currency.get_exchange_rates")
     async def get_exchange_rates(self, base_currency: str = "USD") -> Dict[str, float]:
         """获取汇率数据，带缓存机制"""
         cache_key = f"rates_{base_currency}"
@@ -32,7 +45,8 @@ class CurrencyService:
 
         # 获取新的汇率数据
         try:
-            rates = await self._fetch_rates(base_currency)
+            with timed("fx"):
+                rates = await self._fetch_rates(base_currency)
             # 缓存数据
             self.cache[cache_key] = {
                 "rates": rates,
@@ -53,18 +67,21 @@ class CurrencyService:
         """从API获取汇率数据"""
         urls = [
             f"{self.base_url}/{base_currency}",
-            f"https://open.er-api.com/v6/latest/{base_currency}",  # 另一个免费API
+            f"{self.secondary_url}/{base_currency}",  # 另一个免费API
         ]
 
         async with aiohttp.ClientSession() as session:
             for url in urls:
                 try:
-                    async with session.get(url, timeout=10) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            rates = data.get("rates", {})
-                            if rates:
-                                return rates
+                    with tracer.span("GET exchange-rate", "client", {"http.url": url}) as span:
+                        async with session.get(url, timeout=10) as response:
+                            if span is not None:
+                                span.set_attribute("http.status_code", response.status)
+                            if response.status == 200:
+                                data = await response.json()
+                                rates = data.get("rates", {})
+                                if rates:
+                                    return rates
                 except Exception as e:
                     logger.warning(f"Failed to fetch from {url}: {e}")
                     continue
@@ -116,6 +133,37 @@ class CurrencyService:
             # 如果转换失败，返回原金额
             return amount
 
+    def cached_conversion_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """只用已缓存的汇率（过期也用）换算，不发起请求；没有缓存或汇率未知时返回 None"""
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
+        if from_currency == to_currency:
+            return 1.0
+
+        cached = self.cache.get("rates_USD")
+        if not cached:
+            return None
+        from_rate = cached["rates"].get(from_currency)
+        to_rate = cached["rates"].get(to_currency)
+        if not from_rate or not to_rate:
+            return None
+        return to_rate / from_rate
+
+    async def get_conversion_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """获取 1 单位 from_currency 折合多少 to_currency；汇率表中没有其中一种货币时返回 None"""
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
+        if from_currency == to_currency:
+            return 1.0
+
+        usd_rates = await self.get_exchange_rates("USD")
+        from_rate = usd_rates.get(from_currency)
+        to_rate = usd_rates.get(to_currency)
+        if not from_rate or not to_rate:
+            logger.warning(f"Unknown currency pair {from_currency}->{to_currency}, leaving base costs empty")
+            return None
+        return to_rate / from_rate
+
     async def convert_multiple_to_cny(self, amounts: Dict[str, float]) -> float:
         """将多种货币的金额转换为CNY总额"""
         total_cny = 0.0
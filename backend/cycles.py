@@ -0,0 +1,47 @@
+"""
+订阅周期计算工具
+续费、自动续费、日历展开与成本折算共用的周期规则。
+第 k 期到期日从当前保存的到期日直接跳过 k 个周期计算，保持它的几号（超出当月天数时取月末），
+因此日历展开和一次跨越多期的自动续费不会逐期漂移：1 月 31 日的月付订阅依次为 2 月 28 日、3 月 31 日。
+数据库只保存下一次到期日而不保存原始的几号，手动续费一次后保存的是 2 月 28 日，
+之后的续费和展开都从 28 号起算（3 月 28 日……）；跳过的几号不会恢复。
+"""
+from datetime import date
+from typing import Iterator
+from dateutil.relativedelta import relativedelta
+
+CYCLE_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+
+def cycle_months(cycle: str) -> int:
+    """返回周期对应的月数，未知周期抛出 ValueError"""
+    months = CYCLE_MONTHS.get(getattr(cycle, "value", cycle))
+    if months is None:
+        raise ValueError(f"Invalid subscription cycle: {cycle}")
+    return months
+
+
+def nth_due_date(first_due_date: date, cycle: str, k: int) -> date:
+    """从 first_due_date 起第 k 期的到期日（k = 0 即 first_due_date）"""
+    return first_due_date + relativedelta(months=k * cycle_months(cycle))
+
+
+def next_due_date(current_due_date: date, cycle: str) -> date:
+    """计算续费一次后的下次到期日；从当前到期日起算，31 日续费到 2 月后之后按 28 号继续"""
+    return nth_due_date(current_due_date, cycle, 1)
+
+
+def iter_due_dates(first_due_date: date, cycle: str, until: date) -> Iterator[date]:
+    """从 first_due_date 起逐期展开，直到 until（含）"""
+    k = 0
+    due_date = first_due_date
+    while due_date <= until:
+        yield due_date
+        k += 1
+        due_date = nth_due_date(first_due_date, cycle, k)
+
+
+def monthly_cost(price: float, cycle: str) -> float:
+    """按周期折算月度成本"""
+    months = CYCLE_MONTHS.get(getattr(cycle, "value", cycle))
+    return price / months if months else 0.0
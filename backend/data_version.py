@@ -0,0 +1,34 @@
+"""
+订阅数据版本模块
+subscriptions 上的任何插入、更新、删除都会通过触发器递增 data_version，
+进程内缓存以此判断是否失效（同样覆盖命令行和批量 SQL 写入）。
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+from models import DataVersion
+
+VERSION_TRIGGERS = {
+    "subscriptions_version_insert": "AFTER INSERT ON subscriptions",
+    "subscriptions_version_update": "AFTER UPDATE ON subscriptions",
+    "subscriptions_version_delete": "AFTER DELETE ON subscriptions",
+}
+
+
+def install_data_version_triggers(engine: Engine):
+    """初始化版本行并安装递增触发器"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)"))
+        for name, event in VERSION_TRIGGERS.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(
+                f"CREATE TRIGGER {name} {event} BEGIN "
+                "UPDATE data_version SET version = version + 1 WHERE id = 1; "
+                "END"
+            ))
+
+
+def get_data_version(session: Session) -> int:
+    """读取当前数据版本"""
+    row = session.get(DataVersion, 1)
+    return row.version if row else 0
@@ -1,18 +1,66 @@
 import os
+from sqlalchemy import inspect, text
 from sqlmodel import create_engine, SQLModel, Session
-from models import Subscription, Setting
+from models import (
+    Subscription, Setting, SubscriptionAggregate, SubscriptionEvent, DataVersion, ArchivedSubscription,
+    AnalyticsSnapshot, JobRun
+)
+from aggregates import install_aggregate_triggers
+from event_log import backfill_event_log
+from search import install_search_index
+from data_version import install_data_version_triggers
+from costs import backfill_original_costs
+from tracing import instrument_engine
+from slow_query_log import TimedConnection, install_slow_query_log
 
 # Get the project root directory (parent of backend folder)
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 database_path = os.path.join(project_root, "data", "subscription.db")
 database_url = os.getenv("DATABASE_URL", f"sqlite:///{database_path}")
-engine = create_engine(database_url, echo=True)
+# SQL_ECHO=true logs every statement; slow ones are always captured by the slow-query log
+sql_echo = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+connect_args = {"factory": TimedConnection} if database_url.startswith("sqlite") else {}
+engine = create_engine(database_url, echo=sql_echo, connect_args=connect_args)
+instrument_engine(engine)
+install_slow_query_log(engine)
+
+
+def add_missing_columns():
+    """create_all 不会给已存在的表加列，这里补齐模型中新增的列"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    # create_all skips indexes added to tables that already exist
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    backfill_original_costs(engine)
+    install_aggregate_triggers(engine)
+    backfill_event_log(engine)
+    install_search_index(engine)
+    install_data_version_triggers(engine)
+    # Pooled connections that had the FTS table open before the triggers were
+    # re-created fail with "no such table" on the next write (SQLite 3.40), so
+    # start from fresh connections after the schema work
+    engine.dispose()
 
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
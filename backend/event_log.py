@@ -0,0 +1,126 @@
+"""
+订阅变更事件日志模块
+CRUD 接口在同一事务中追加事件（新建、改价、改周期、改货币、删除、归档、恢复），
+每条事件保存写入后的累计值，价格趋势通过前缀和做区间查询。
+occurred_at 与其他时间戳一样按 UTC 存储；按本地日期分桶时用 utc_day_start 换算区间边界。
+"""
+import json
+import logging
+from datetime import date, datetime, time, timezone
+from typing import Optional, Dict, List
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from models import Subscription, SubscriptionEvent
+from cycles import monthly_cost
+
+logger = logging.getLogger(__name__)
+
+
+def utc_day_start(day: date) -> datetime:
+    """本地日期零点对应的 UTC 时间（不带时区，与 occurred_at 可直接比较）"""
+    return datetime.combine(day, time.min).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def snapshot(subscription: Subscription) -> dict:
+    """提取事件日志关心的订阅字段"""
+    return {
+        "price": subscription.price,
+        "currency": subscription.currency,
+        "cycle": subscription.cycle,
+    }
+
+
+def _last_event(session: Session) -> Optional[SubscriptionEvent]:
+    stmt = select(SubscriptionEvent).order_by(SubscriptionEvent.id.desc()).limit(1)
+    return session.exec(stmt).first()
+
+
+def _diff_events(before: Optional[dict], after: Optional[dict],
+                 event_type: Optional[str] = None) -> List[dict]:
+    """把一次变更拆成若干单一变更事件；event_type 覆盖新增/移除事件的默认类型"""
+    if before is None and after is None:
+        return []
+    if before is None:
+        return [dict(after, event_type=event_type or "created", count_delta=1,
+                     monthly_delta=monthly_cost(after["price"], after["cycle"]))]
+    if after is None:
+        return [dict(before, event_type=event_type or "deleted", count_delta=-1,
+                     monthly_delta=-monthly_cost(before["price"], before["cycle"]))]
+
+    old_monthly = monthly_cost(before["price"], before["cycle"])
+    if before["currency"] != after["currency"]:
+        # 货币变更：从旧货币移出，再计入新货币
+        return [
+            dict(before, event_type="currency_changed", count_delta=-1, monthly_delta=-old_monthly),
+            dict(after, event_type="currency_changed", count_delta=1,
+                 monthly_delta=monthly_cost(after["price"], after["cycle"])),
+        ]
+
+    events = []
+    if before["price"] != after["price"]:
+        repriced_monthly = monthly_cost(after["price"], before["cycle"])
+        events.append(dict(after, cycle=before["cycle"], event_type="price_changed",
+                           count_delta=0, monthly_delta=repriced_monthly - old_monthly))
+        old_monthly = repriced_monthly
+    if before["cycle"] != after["cycle"]:
+        events.append(dict(after, event_type="cycle_changed", count_delta=0,
+                           monthly_delta=monthly_cost(after["price"], after["cycle"]) - old_monthly))
+    return events
+
+
+def _append(session: Session, previous: Optional[SubscriptionEvent], subscription_id: int,
+            change: dict, occurred_at: datetime) -> SubscriptionEvent:
+    """在上一条事件的累计值基础上追加一条事件"""
+    currency_totals: Dict[str, Dict] = json.loads(previous.running_currency_totals) if previous else {}
+    totals = currency_totals.setdefault(change["currency"], {"monthly": 0.0, "count": 0})
+    totals["monthly"] += change["monthly_delta"]
+    totals["count"] += change["count_delta"]
+    if totals["count"] <= 0:
+        del currency_totals[change["currency"]]
+
+    event = SubscriptionEvent(
+        subscription_id=subscription_id,
+        event_type=change["event_type"],
+        occurred_at=occurred_at,
+        currency=change["currency"],
+        price=change["price"],
+        cycle=change["cycle"],
+        monthly_delta=change["monthly_delta"],
+        count_delta=change["count_delta"],
+        running_monthly=(previous.running_monthly if previous else 0.0) + change["monthly_delta"],
+        running_count=(previous.running_count if previous else 0) + change["count_delta"],
+        running_currency_totals=json.dumps(currency_totals),
+    )
+    session.add(event)
+    return event
+
+
+def record_subscription_change(session: Session, subscription_id: int,
+                               before: Optional[dict], after: Optional[dict],
+                               event_type: Optional[str] = None):
+    """记录订阅变更事件，需在业务写入的同一事务内、commit 之前调用"""
+    changes = _diff_events(before, after, event_type)
+    if not changes:
+        return
+
+    previous = _last_event(session)
+    now = datetime.utcnow()
+    for change in changes:
+        previous = _append(session, previous, subscription_id, change, now)
+
+
+def backfill_event_log(engine: Engine):
+    """事件日志为空时，用现有订阅的创建时间和当前价格补录 created 事件"""
+    with Session(engine) as session:
+        if _last_event(session) is not None:
+            return
+        subscriptions = session.exec(select(Subscription).order_by(Subscription.created_at)).all()
+        if not subscriptions:
+            return
+
+        previous = None
+        for sub in subscriptions:
+            change = _diff_events(None, snapshot(sub))[0]
+            previous = _append(session, previous, sub.id, change, sub.created_at)
+        session.commit()
+        logger.info(f"Backfilled event log with {len(subscriptions)} creation events")
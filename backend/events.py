@@ -0,0 +1,108 @@
+"""
+变更事件流
+写接口和定时任务发布精简的变更事件，GET /api/events 以 server-sent events 推送给所有连接的客户端。
+每个事件只序列化一次，存入固定大小的环形缓冲区；所有客户端共享同一个唤醒 future，
+按 Last-Event-ID 从缓冲区续传，落后超过缓冲区容量时收到 reset 事件，需要重新加载完整数据。
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+KEEPALIVE_SECONDS = 15
+RETRY_MS = 3000
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
+def _frame(event_id: int, event_type: str, data: Any) -> bytes:
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class EventBroker:
+    """事件环形缓冲区与客户端唤醒"""
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        # 事件 ID 连续递增，ID 对 buffer_size 取模即为缓冲区位置
+        self.frames: List[Optional[bytes]] = [None] * buffer_size
+        # 以启动时的毫秒时间戳起始，重启前的旧 ID 会被识别为过期并触发 reset
+        self.first_id = int(time.time() * 1000)
+        self.last_id = self.first_id
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.clients = 0
+
+    def publish(self, event_type: str, data: Any) -> int:
+        """记录事件并唤醒所有客户端；可在事件循环或工作线程中调用"""
+        with self.lock:
+            event_id = self.last_id + 1
+            self.frames[event_id % self.buffer_size] = _frame(event_id, event_type, data)
+            self.last_id = event_id
+
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._wake()
+            else:
+                loop.call_soon_threadsafe(self._wake)
+        return event_id
+
+    def _wake(self):
+        waiter, self.waiter = self.waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def events_since(self, last_id: int) -> Tuple[bytes, int]:
+        """返回 last_id 之后的事件帧（拼接为一块）和新的游标；已被覆盖或未知的 ID 返回 reset 事件"""
+        with self.lock:
+            current = self.last_id
+            oldest = max(self.first_id, current - self.buffer_size) + 1
+            if last_id > current or last_id < oldest - 1:
+                return _frame(current, "reset", {}), current
+            frames = [self.frames[event_id % self.buffer_size] for event_id in range(last_id + 1, current + 1)]
+        return b"".join(frames), current
+
+    async def _wait(self, timeout: float):
+        if self.waiter is None:
+            self.waiter = asyncio.get_running_loop().create_future()
+        # shield：一个客户端超时或断开不会取消其他客户端共享的 future
+        await asyncio.wait_for(asyncio.shield(self.waiter), timeout)
+
+    async def stream(self, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """单个客户端的事件流；没有 Last-Event-ID 时只推送连接之后的事件"""
+        self.loop = asyncio.get_running_loop()
+        self.clients += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+            cursor = self.last_id if last_event_id is None else last_event_id
+            while True:
+                chunk, cursor = self.events_since(cursor)
+                if chunk:
+                    yield chunk
+                # yield 期间可能有新事件发布，此时唤醒已经发生过，直接继续读取而不是等待下一次唤醒
+                if self.last_id != cursor:
+                    continue
+                try:
+                    await self._wait(KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE_FRAME
+        finally:
+            self.clients -= 1
+
+
+# 全局实例
+event_broker = EventBroker()
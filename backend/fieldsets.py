@@ -0,0 +1,45 @@
+"""
+稀疏字段集（fields= 参数）工具
+解析逗号分隔的字段列表，并据此只查询、只序列化需要的列
+"""
+from typing import Iterable, List, Optional
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from models import Subscription
+
+SUBSCRIPTION_FIELDS = list(Subscription.model_fields)
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """解析 fields 参数；未指定时返回 None，包含未知字段时返回 400"""
+    if fields is None:
+        return None
+    allowed = list(allowed)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    # 保持模型中的字段顺序并去重
+    return [name for name in allowed if name in requested]
+
+
+def parse_subscription_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """订阅字段集总是包含 id，方便客户端按 id 合并数据"""
+    parsed = parse_fields(fields, SUBSCRIPTION_FIELDS)
+    if parsed is not None and "id" not in parsed:
+        parsed.insert(0, "id")
+    return parsed
+
+
+def select_subscription_fields(fields: List[str]):
+    """只 SELECT 指定的列"""
+    return select(*[getattr(Subscription, name) for name in fields])
+
+
+def fetch_subscription_rows(session: Session, stmt) -> List[dict]:
+    """执行列投影查询，返回字段名到值的字典列表"""
+    # 用 execute 而非 exec：单列查询时 exec 会返回标量而不是行
+    return [dict(row._mapping) for row in session.execute(stmt).all()]
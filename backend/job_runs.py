@@ -0,0 +1,222 @@
+"""
+定时任务运行记录
+track() 装饰器为每次运行写入一行 job_runs：起止时间、耗时、结果、扫描的行数、发送的提醒数，
+以及等待 Telegram 和汇率接口的时间（任务内通过 add_counts / timed 记入当前运行；
+timed 嵌套时只记各自独占的时间，例如发送提醒期间的汇率请求只计入 fx_ms）。
+同一任务的上一次运行尚未结束时，新的运行不会叠加执行，直接记为 skipped；
+APScheduler 因错过调度时间或达到实例上限而放弃的运行由监听器记为 missed / skipped。
+"""
+import functools
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set
+from apscheduler.events import EVENT_JOB_MISSED, JobEvent
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from models import JobRun, JobRunStats, JobRunHistory
+
+logger = logging.getLogger(__name__)
+
+JOB_RUN_RETENTION_DAYS = int(os.getenv("JOB_RUN_RETENTION_DAYS", "30"))
+# 单次查询允许的最大窗口（天）
+MAX_HISTORY_DAYS = 90
+
+ALREADY_RUNNING = "Previous run still in progress"
+
+
+class _RunMetrics:
+    """当前运行的计数与外部调用耗时"""
+
+    def __init__(self):
+        self.rows_scanned: Optional[int] = None
+        self.reminders_sent: Optional[int] = None
+        self.telegram_ms = 0.0
+        self.fx_ms = 0.0
+
+
+_current_run: ContextVar[Optional[_RunMetrics]] = ContextVar("current_job_run", default=None)
+# 最内层 timed 代码块中已被嵌套代码块计时的毫秒数；用列表以便 gather 出的子任务累加到同一个代码块
+_enclosing_block: ContextVar[Optional[List[float]]] = ContextVar("enclosing_timed_block", default=None)
+
+
+def add_counts(rows_scanned: Optional[int] = None, reminders_sent: Optional[int] = None):
+    """累加到当前运行；不在被跟踪的任务中调用时忽略"""
+    run = _current_run.get()
+    if run is None:
+        return
+    if rows_scanned is not None:
+        run.rows_scanned = (run.rows_scanned or 0) + rows_scanned
+    if reminders_sent is not None:
+        run.reminders_sent = (run.reminders_sent or 0) + reminders_sent
+
+
+@contextmanager
+def timed(kind: str) -> Iterator[None]:
+    """把代码块的耗时记入当前运行的 telegram_ms 或 fx_ms，扣除其中嵌套的 timed 代码块"""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    nested = [0.0]
+    token = _enclosing_block.set(nested)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        _enclosing_block.reset(token)
+        attribute = f"{kind}_ms"
+        # 并发的嵌套代码块之和可能超过墙钟时间
+        setattr(run, attribute, getattr(run, attribute) + max(0.0, elapsed - nested[0]))
+        enclosing = _enclosing_block.get()
+        if enclosing is not None:
+            enclosing[0] += elapsed
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+class JobRunTracker:
+    def __init__(self):
+        self.running: Set[str] = set()
+        self.last_pruned: Optional[datetime] = None
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self.running
+
+    def track(self, job_id: str):
+        """记录异步任务的每次运行；同一任务正在运行时跳过并返回 None"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                now = datetime.utcnow()
+                if job_id in self.running:
+                    logger.warning(f"Skipping {job_id}, the previous run is still in progress")
+                    self._save(JobRun(
+                        job_id=job_id, started_at=now, finished_at=now, status="skipped", error=ALREADY_RUNNING
+                    ))
+                    return None
+
+                self.running.add(job_id)
+                run = _RunMetrics()
+                token = _current_run.set(run)
+                started = time.perf_counter()
+                status, error = "success", None
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    status, error = "failed", f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    _current_run.reset(token)
+                    self.running.discard(job_id)
+                    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+                    self._save(JobRun(
+                        job_id=job_id,
+                        started_at=now,
+                        finished_at=datetime.utcnow(),
+                        duration_ms=duration_ms,
+                        status=status,
+                        rows_scanned=run.rows_scanned,
+                        reminders_sent=run.reminders_sent,
+                        telegram_ms=round(run.telegram_ms, 2),
+                        fx_ms=round(run.fx_ms, 2),
+                        error=error,
+                    ))
+                    logger.info(f"Job {job_id} finished with {status} in {duration_ms:.0f}ms")
+            return wrapper
+        return decorator
+
+    def on_scheduler_event(self, event: JobEvent):
+        """APScheduler 监听器：记录错过调度时间或因实例上限被放弃的运行；
+        错过时是带 scheduled_run_time 的 JobExecutionEvent，达到实例上限时是带
+        scheduled_run_times 列表的 JobSubmissionEvent，每个被放弃的调度时间记一行"""
+        missed = event.code == EVENT_JOB_MISSED
+        run_times = [event.scheduled_run_time] if missed else event.scheduled_run_times
+        for run_time in run_times:
+            scheduled_at = _utc(run_time)
+            logger.warning(f"Job {event.job_id} {'missed' if missed else 'skipped'} its run at {scheduled_at}")
+            self._save(JobRun(
+                job_id=event.job_id,
+                started_at=scheduled_at,
+                finished_at=datetime.utcnow(),
+                status="missed" if missed else "skipped",
+                error="Missed the scheduled run time" if missed else ALREADY_RUNNING,
+            ))
+
+    def _save(self, job_run: JobRun):
+        """写入运行记录并每天清理一次过期记录；写入失败只记日志，不影响任务本身"""
+        # database 导入的模块会调用 timed()，这里延迟导入避免循环依赖
+        from database import engine
+        try:
+            with Session(engine) as session:
+                session.add(job_run)
+                now = datetime.utcnow()
+                if self.last_pruned is None or now - self.last_pruned > timedelta(days=1):
+                    session.execute(delete(JobRun).where(
+                        JobRun.started_at < now - timedelta(days=JOB_RUN_RETENTION_DAYS)
+                    ))
+                    self.last_pruned = now
+                session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record run of {job_run.job_id}: {e}")
+
+
+def get_job_run_history(session: Session, job_id: Optional[str] = None, days: int = 7,
+                        limit: int = 50) -> JobRunHistory:
+    """窗口内按任务汇总，并返回最近 limit 条运行记录"""
+    if days < 1 or days > MAX_HISTORY_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_HISTORY_DAYS}")
+    since = datetime.utcnow() - timedelta(days=days)
+    stmt = select(JobRun).where(JobRun.started_at >= since)
+    if job_id:
+        stmt = stmt.where(JobRun.job_id == job_id)
+    runs = session.exec(stmt.order_by(JobRun.started_at.desc(), JobRun.id.desc())).all()
+
+    by_job: Dict[str, List[JobRun]] = {}
+    for run in runs:
+        by_job.setdefault(run.job_id, []).append(run)
+
+    stats = []
+    for name, job_runs in sorted(by_job.items()):
+        statuses = [run.status for run in job_runs]
+        # 只统计真正执行过的运行的耗时
+        durations = [run.duration_ms for run in job_runs if run.status in ("success", "failed")]
+        stats.append(JobRunStats(
+            job_id=name,
+            runs=len(job_runs),
+            succeeded=statuses.count("success"),
+            failed=statuses.count("failed"),
+            skipped=statuses.count("skipped"),
+            missed=statuses.count("missed"),
+            avg_ms=round(sum(durations) / len(durations), 2) if durations else 0.0,
+            p95_ms=_percentile(durations, 95),
+            max_ms=max(durations, default=0.0),
+            rows_scanned=sum(run.rows_scanned or 0 for run in job_runs),
+            reminders_sent=sum(run.reminders_sent or 0 for run in job_runs),
+            telegram_ms=round(sum(run.telegram_ms for run in job_runs), 2),
+            fx_ms=round(sum(run.fx_ms for run in job_runs), 2),
+            last_status=job_runs[0].status,
+            last_started_at=job_runs[0].started_at,
+        ))
+
+    return JobRunHistory(since=since, stats=stats, runs=runs[:limit])
+
+
+# 全局实例
+job_run_tracker = JobRunTracker()
@@ -1,20 +1,48 @@
+import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
-from typing import List
-from datetime import date, timedelta
-from dateutil.relativedelta import relativedelta
-from fastapi import FastAPI, Depends, HTTPException
+from typing import List, Optional
+from datetime import date
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import Session, select
 from database import create_db_and_tables, get_session
 from models import (
     Subscription, SubscriptionCreate, SubscriptionUpdate,
     Setting, SettingCreate, SettingUpdate,
-    TrendAnalysis, SubscriptionAnalytics, PriceTrend
+    TrendAnalysis, SubscriptionAnalytics, PriceTrend, GranularityEnum,
+    CycleEnum, SearchOrderEnum, SubscriptionSearchHit, CalendarOccurrence,
+    ArchivedSubscription, SubscriptionArchiveRequest, ScenarioRequest, ScenarioResult,
+    SlowQueryStat, SlowQueryOrderEnum, BackupSnapshot, BackupStatus, BackupVerification,
+    SnapshotResult, SnapshotHistory, AdmissionPoolStats, JobRunHistory,
+    SubscriptionOrderEnum, ReplicaStatus
+)
+from scheduler import (
+    scheduler_service, check_subscription_reminders, run_auto_renew_sweep, REMINDER_JOB_ID, AUTO_RENEW_JOB_ID
 )
-from scheduler import scheduler_service, check_subscription_reminders
 from telegram_service import telegram_service
 from analytics import AnalyticsService
+from columnar import ColumnarAnalyticsService
+from event_log import record_subscription_change, snapshot
+from search import search_subscriptions
+from archive import archive_subscription, restore_subscription, list_archived_subscriptions
+from fieldsets import parse_fields, parse_subscription_fields, select_subscription_fields, fetch_subscription_rows
+from compression import CompressionMiddleware, etag_matches
+from tracing import TracingMiddleware
+from slow_query_log import slow_query_log
+from backup import backup_service, list_snapshots, BackupInProgressError
+from events import event_broker
+from settings_registry import settings_registry
+from snapshots import take_snapshot, snapshot_result, get_snapshot_history
+from admission import admitted, analytics_pool, crud_pool, write_pool, AdmissionRejected
+from job_runs import job_run_tracker, get_job_run_history
+from subscription_replica import subscription_replica, sql_order
+from cycles import next_due_date
+from costs import apply_normalized_costs
+from calendar_service import CalendarService, ical_feed_cache, resolve_range, DEFAULT_FEED_DAYS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +53,7 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     create_db_and_tables()
+    subscription_replica.load()
     await telegram_service.initialize()
     scheduler_service.start()
     logger.info("Application started")
@@ -50,39 +79,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses in-app so deployments without nginx benefit too
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+)
+
+# Outermost, so request spans cover the whole middleware stack
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed load instead of queueing without bound when a route class is saturated"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+async def notify_operation(operation: str, subscription, old_data: Optional[dict] = None):
+    """Send a real-time operation notification as a background task, after the response,
+    so a slow or unreachable Telegram API never delays a write; failures are only logged"""
+    try:
+        await telegram_service.send_operation_notification(operation, subscription, old_data)
+    except Exception as e:
+        logger.warning(f"Failed to send {operation} notification: {e}")
+
 
 # Subscription endpoints
 @app.get("/api/subscriptions", response_model=List[Subscription])
-def get_subscriptions(session: Session = Depends(get_session)):
-    """Get all subscriptions"""
-    stmt = select(Subscription).order_by(Subscription.next_due_date)
+@admitted(crud_pool)
+def get_subscriptions(
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. name,price"),
+    order_by: SubscriptionOrderEnum = SubscriptionOrderEnum.next_due_date,
+    desc: bool = False,
+    session: Session = Depends(get_session)
+):
+    """Get all subscriptions, from the in-memory replica when it is enabled"""
+    selected = parse_subscription_fields(fields)
+    if subscription_replica.enabled:
+        subscriptions = subscription_replica.list(order_by.value, desc)
+        if selected:
+            rows = [{name: getattr(subscription, name) for name in selected} for subscription in subscriptions]
+            return JSONResponse(jsonable_encoder(rows))
+        return subscriptions
+
+    order = sql_order(order_by.value, desc)
+    if selected:
+        stmt = select_subscription_fields(selected).order_by(*order)
+        return JSONResponse(jsonable_encoder(fetch_subscription_rows(session, stmt)))
+
+    stmt = select(Subscription).order_by(*order)
     subscriptions = session.exec(stmt).all()
     return subscriptions
 
 
 @app.post("/api/subscriptions", response_model=Subscription)
-async def create_subscription(
+@admitted(write_pool)
+def create_subscription(
     subscription: SubscriptionCreate,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """Create a new subscription"""
     db_subscription = Subscription(**subscription.model_dump())
+    if not apply_normalized_costs(db_subscription):
+        scheduler_service.refresh_costs_soon()
     session.add(db_subscription)
+    session.flush()
+    record_subscription_change(session, db_subscription.id, None, snapshot(db_subscription))
     session.commit()
     session.refresh(db_subscription)
+    subscription_replica.upsert(db_subscription)
+    event_broker.publish("created", db_subscription)
 
     # Send real-time notification
-    try:
-        await telegram_service.send_operation_notification("created", db_subscription)
-    except Exception as e:
-        logger.warning(f"Failed to send creation notification: {e}")
+    background_tasks.add_task(notify_operation, "created", db_subscription)
 
     return db_subscription
 
 
+@app.get("/api/subscriptions/search", response_model=List[SubscriptionSearchHit])
+@admitted(crud_pool)
+def search_subscriptions_endpoint(
+    q: str = Query(..., min_length=1),
+    cycle: Optional[CycleEnum] = None,
+    currency: Optional[str] = None,
+    order_by: SearchOrderEnum = SearchOrderEnum.rank,
+    desc: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_session)
+):
+    """Full-text search over subscription names and notes with prefix matching"""
+    return search_subscriptions(
+        session, q,
+        cycle=cycle.value if cycle else None,
+        currency=currency,
+        order_by=order_by.value,
+        descending=desc,
+        limit=limit,
+        offset=offset
+    )
+
+
 @app.get("/api/subscriptions/{subscription_id}", response_model=Subscription)
-def get_subscription(subscription_id: int, session: Session = Depends(get_session)):
+@admitted(crud_pool)
+def get_subscription(
+    subscription_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. name,price"),
+    session: Session = Depends(get_session)
+):
     """Get a specific subscription by ID"""
+    selected = parse_subscription_fields(fields)
+    if subscription_replica.enabled:
+        subscription = subscription_replica.get(subscription_id)
+        if not subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        if selected:
+            return JSONResponse(jsonable_encoder({name: getattr(subscription, name) for name in selected}))
+        return subscription
+
+    if selected:
+        stmt = select_subscription_fields(selected).where(Subscription.id == subscription_id)
+        rows = fetch_subscription_rows(session, stmt)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        return JSONResponse(jsonable_encoder(rows[0]))
+
     subscription = session.get(Subscription, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
@@ -90,9 +216,11 @@ def get_subscription(subscription_id: int, session: Session = Depends(get_sessio
 
 
 @app.put("/api/subscriptions/{subscription_id}", response_model=Subscription)
-async def update_subscription(
+@admitted(write_pool)
+def update_subscription(
     subscription_id: int,
     subscription_update: SubscriptionUpdate,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """Update a specific subscription"""
@@ -110,25 +238,35 @@ async def update_subscription(
         "notes": subscription.notes
     }
 
+    before = subscription.model_dump()
     update_data = subscription_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(subscription, key, value)
+    if not apply_normalized_costs(subscription):
+        scheduler_service.refresh_costs_soon()
 
     session.add(subscription)
+    record_subscription_change(session, subscription.id, old_data, snapshot(subscription))
     session.commit()
     session.refresh(subscription)
+    subscription_replica.upsert(subscription)
+    # Only the changed columns, so clients can patch their copy
+    changed = {key: value for key, value in subscription.model_dump().items() if before.get(key) != value}
+    event_broker.publish("updated", {"id": subscription.id, **changed})
 
     # Send real-time notification with change details
-    try:
-        await telegram_service.send_operation_notification("updated", subscription, old_data)
-    except Exception as e:
-        logger.warning(f"Failed to send update notification: {e}")
+    background_tasks.add_task(notify_operation, "updated", subscription, old_data)
 
     return subscription
 
 
 @app.delete("/api/subscriptions/{subscription_id}")
-async def delete_subscription(subscription_id: int, session: Session = Depends(get_session)):
+@admitted(write_pool)
+def delete_subscription(
+    subscription_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session)
+):
     """Delete a specific subscription"""
     subscription = session.get(Subscription, subscription_id)
     if not subscription:
@@ -147,19 +285,24 @@ async def delete_subscription(subscription_id: int, session: Session = Depends(g
     )
 
     session.delete(subscription)
+    record_subscription_change(session, subscription_data.id, snapshot(subscription_data), None)
     session.commit()
+    subscription_replica.remove(subscription_data.id)
+    event_broker.publish("deleted", {"id": subscription_data.id})
 
     # Send real-time notification
-    try:
-        await telegram_service.send_operation_notification("deleted", subscription_data)
-    except Exception as e:
-        logger.warning(f"Failed to send deletion notification: {e}")
+    background_tasks.add_task(notify_operation, "deleted", subscription_data)
 
     return {"message": "Subscription deleted successfully"}
 
 
 @app.post("/api/subscriptions/{subscription_id}/renew", response_model=Subscription)
-async def renew_subscription(subscription_id: int, session: Session = Depends(get_session)):
+@admitted(write_pool)
+def renew_subscription(
+    subscription_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session)
+):
     """Renew a subscription by extending the next due date based on its cycle"""
     subscription = session.get(Subscription, subscription_id)
     if not subscription:
@@ -169,87 +312,196 @@ async def renew_subscription(subscription_id: int, session: Session = Depends(ge
     old_due_date = subscription.next_due_date
 
     # Calculate the new due date based on cycle
-    current_due_date = subscription.next_due_date
-
-    if subscription.cycle == "monthly":
-        new_due_date = current_due_date + relativedelta(months=1)
-    elif subscription.cycle == "quarterly":
-        new_due_date = current_due_date + relativedelta(months=3)
-    elif subscription.cycle == "yearly":
-        new_due_date = current_due_date + relativedelta(years=1)
-    else:
+    try:
+        subscription.next_due_date = next_due_date(subscription.next_due_date, subscription.cycle)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid subscription cycle")
+    if not apply_normalized_costs(subscription):
+        scheduler_service.refresh_costs_soon()
 
-    subscription.next_due_date = new_due_date
     session.add(subscription)
     session.commit()
     session.refresh(subscription)
+    subscription_replica.upsert(subscription)
+    event_broker.publish("renewed", {"id": subscription.id, "next_due_date": subscription.next_due_date})
 
     # Send real-time notification
-    try:
-        await telegram_service.send_operation_notification("renewed", subscription, {"next_due_date": old_due_date})
-    except Exception as e:
-        logger.warning(f"Failed to send renewal notification: {e}")
+    background_tasks.add_task(notify_operation, "renewed", subscription, {"next_due_date": old_due_date})
+
+    return subscription
+
+
+# Archive endpoints
+@app.post("/api/subscriptions/{subscription_id}/archive", response_model=ArchivedSubscription)
+@admitted(write_pool)
+def archive_subscription_endpoint(
+    subscription_id: int,
+    background_tasks: BackgroundTasks,
+    request: Optional[SubscriptionArchiveRequest] = None,
+    session: Session = Depends(get_session)
+):
+    """Cancel a subscription and move it to the archive, keeping its history"""
+    archived = archive_subscription(session, subscription_id, request.reason if request else None)
+    if not archived:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    subscription_replica.remove(subscription_id)
+    event_broker.publish("archived", {"id": subscription_id, "archive_id": archived.archive_id})
+
+    # Send real-time notification
+    background_tasks.add_task(notify_operation, "archived", archived)
+
+    return archived
+
+
+@app.get("/api/archived-subscriptions", response_model=List[ArchivedSubscription])
+@admitted(crud_pool)
+def get_archived_subscriptions(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_session)
+):
+    """List archived subscriptions, most recently archived first"""
+    return list_archived_subscriptions(session, limit, offset)
+
+
+@app.post("/api/archived-subscriptions/{archive_id}/restore", response_model=Subscription)
+@admitted(write_pool)
+def restore_archived_subscription(
+    archive_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session)
+):
+    """Move an archived subscription back to the active table"""
+    subscription = restore_subscription(session, archive_id)
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Archived subscription not found")
+    if subscription.monthly_cost_base is None:
+        scheduler_service.refresh_costs_soon()
+    subscription_replica.upsert(subscription)
+    event_broker.publish("restored", {"archive_id": archive_id, **subscription.model_dump()})
+
+    # Send real-time notification
+    background_tasks.add_task(notify_operation, "restored", subscription)
 
     return subscription
 
 
+# Change stream
+@app.get("/api/events")
+async def stream_events(
+    since: Optional[int] = Query(None, description="Resume after this event id (for clients that cannot set Last-Event-ID)"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Server-sent events stream of subscription and settings changes"""
+    resume_from = since
+    if last_event_id is not None:
+        try:
+            resume_from = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return StreamingResponse(
+        event_broker.stream(resume_from),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Calendar endpoints
+@app.get("/api/calendar", response_model=List[CalendarOccurrence])
+@admitted(crud_pool)
+def get_calendar(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    session: Session = Depends(get_session)
+):
+    """Get renewal occurrences within a date range (defaults to the next 31 days)"""
+    try:
+        from_date, to_date = resolve_range(from_date, to_date, 31)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CalendarService(session).get_occurrences(from_date, to_date)
+
+
+@app.get("/api/calendar.ics")
+def get_calendar_feed(
+    request: Request,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    session: Session = Depends(get_session)
+):
+    """iCalendar feed of renewal occurrences (defaults to the next year)"""
+    try:
+        from_date, to_date = resolve_range(from_date, to_date, DEFAULT_FEED_DAYS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    etag, chunks = ical_feed_cache.stream(session, from_date, to_date)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return StreamingResponse(
+        chunks,
+        media_type="text/calendar; charset=utf-8",
+        headers={"ETag": etag, "Content-Disposition": 'inline; filename="subscriptions.ics"'}
+    )
+
+
 # Settings endpoints
 @app.get("/api/settings", response_model=List[Setting])
-def get_settings(session: Session = Depends(get_session)):
+@admitted(crud_pool)
+def get_settings():
     """Get all settings"""
-    stmt = select(Setting)
-    settings = session.exec(stmt).all()
-    return settings
+    return [Setting(key=key, value=value) for key, value in settings_registry.all_raw().items()]
 
 
 @app.post("/api/settings")
+@admitted(write_pool)
 def update_settings(
     settings: List[SettingCreate],
     session: Session = Depends(get_session)
 ):
-    """Update multiple settings"""
-    for setting_data in settings:
-        # Check if setting exists
-        existing_setting = session.get(Setting, setting_data.key)
-        if existing_setting:
-            existing_setting.value = setting_data.value
-            session.add(existing_setting)
-        else:
-            new_setting = Setting(**setting_data.model_dump())
-            session.add(new_setting)
+    """Update multiple settings in a single upsert statement"""
+    try:
+        changed = settings_registry.update(session, {setting.key: setting.value for setting in settings})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    session.commit()
+    if changed:
+        # Keys only: values such as the bot token must not be broadcast
+        event_broker.publish("settings_changed", {"keys": sorted(changed)})
+
+    # A base currency change is picked up by the scheduler, which re-normalizes stored costs
+    # in the background and publishes costs_refreshed when done
     return {"message": "Settings updated successfully"}
 
 
 @app.get("/api/settings/{key}", response_model=Setting)
-def get_setting(key: str, session: Session = Depends(get_session)):
+@admitted(crud_pool)
+def get_setting(key: str):
     """Get a specific setting by key"""
-    setting = session.get(Setting, key)
-    if not setting:
+    value = settings_registry.get_raw(key)
+    if value is None:
         raise HTTPException(status_code=404, detail="Setting not found")
-    return setting
+    return Setting(key=key, value=value)
 
 
 @app.put("/api/settings/{key}", response_model=Setting)
+@admitted(write_pool)
 def update_setting(
     key: str,
     setting_update: SettingUpdate,
     session: Session = Depends(get_session)
 ):
-    """Update a specific setting"""
-    setting = session.get(Setting, key)
-    if not setting:
-        # Create new setting if it doesn't exist
-        setting = Setting(key=key, value=setting_update.value)
-    else:
-        setting.value = setting_update.value
-
-    session.add(setting)
-    session.commit()
-    session.refresh(setting)
-    return setting
+    """Update a specific setting (created if it doesn't exist)"""
+    try:
+        changed = settings_registry.update(session, {key: setting_update.value})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if changed:
+        event_broker.publish("settings_changed", {"keys": [key]})
+
+    return Setting(key=key, value=setting_update.value)
 
 
 # Telegram test endpoint
@@ -271,6 +523,8 @@ async def test_telegram_notification():
 @app.post("/api/reminders/check")
 async def check_reminders():
     """Manually trigger reminder check for testing"""
+    if job_run_tracker.is_running(REMINDER_JOB_ID):
+        raise HTTPException(status_code=409, detail="A reminder check is already running")
     try:
         await check_subscription_reminders()
         return {"status": "success", "message": "Reminder check completed"}
@@ -279,45 +533,109 @@ async def check_reminders():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Manual auto-renew sweep endpoint
+@app.post("/api/auto-renew/run")
+async def run_auto_renew():
+    """Advance every overdue auto-renew subscription to its next future due date"""
+    if job_run_tracker.is_running(AUTO_RENEW_JOB_ID):
+        raise HTTPException(status_code=409, detail="An auto-renew sweep is already running")
+    try:
+        renewed = await run_auto_renew_sweep()
+        return {"status": "success", "renewed": renewed}
+    except Exception as e:
+        logger.error(f"Error running auto-renew sweep: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # 趋势分析端点
 @app.get("/api/analytics/comprehensive", response_model=TrendAnalysis)
-def get_comprehensive_analytics(session: Session = Depends(get_session)):
-    """获取综合趋势分析数据"""
+@admitted(analytics_pool)
+def get_comprehensive_analytics(
+    fields: Optional[str] = Query(None, description="Sections to compute, e.g. subscription_analytics,price_trend"),
+    renewal_fields: Optional[str] = Query(None, description="Columns of upcoming_renewals, e.g. name,next_due_date"),
+    include_archived: bool = Query(False, description="Include archived subscriptions in counts and timelines"),
+    session: Session = Depends(get_session)
+):
+    """获取综合趋势分析数据，可通过 fields 只计算部分内容"""
+    sections = parse_fields(fields, TrendAnalysis.model_fields)
+    selected_renewal_fields = parse_subscription_fields(renewal_fields)
     try:
-        analytics_service = AnalyticsService(session)
-        return analytics_service.get_comprehensive_analysis()
+        analytics_service = ColumnarAnalyticsService(session, include_archived)
+        if sections:
+            result = analytics_service.get_analysis_sections(sections, selected_renewal_fields)
+            return JSONResponse(jsonable_encoder(result))
+        return analytics_service.get_comprehensive_analysis(selected_renewal_fields)
     except Exception as e:
         logger.error(f"Error getting comprehensive analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/analytics/subscription", response_model=SubscriptionAnalytics)
-def get_subscription_analytics(session: Session = Depends(get_session)):
+@admitted(analytics_pool)
+def get_subscription_analytics(
+    fields: Optional[str] = Query(None, description="Keys to return, e.g. total_monthly_cost,price_ranges"),
+    renewal_fields: Optional[str] = Query(None, description="Columns of upcoming_renewals, e.g. name,next_due_date"),
+    include_archived: bool = Query(False, description="Include archived subscriptions in counts and breakdowns"),
+    session: Session = Depends(get_session)
+):
     """获取订阅数据分析"""
+    keys = parse_fields(fields, SubscriptionAnalytics.model_fields)
+    selected_renewal_fields = parse_subscription_fields(renewal_fields)
+    if keys and "upcoming_renewals" not in keys:
+        # 不需要即将到期列表时只取 id 列，避免加载整行
+        selected_renewal_fields = ["id"]
     try:
-        analytics_service = AnalyticsService(session)
-        return analytics_service.get_subscription_analytics()
+        analytics_service = AnalyticsService(session, include_archived)
+        analytics = analytics_service.get_subscription_analytics(selected_renewal_fields)
+        if keys:
+            return JSONResponse(jsonable_encoder(analytics, include=set(keys)))
+        return analytics
     except Exception as e:
         logger.error(f"Error getting subscription analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/analytics/price-trend", response_model=PriceTrend)
-def get_price_trend(session: Session = Depends(get_session)):
-    """获取价格趋势分析"""
+@admitted(analytics_pool)
+def get_price_trend(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    granularity: GranularityEnum = GranularityEnum.month,
+    session: Session = Depends(get_session)
+):
+    """获取价格趋势分析，支持 from/to 区间和 day/week/month 粒度"""
     try:
         analytics_service = AnalyticsService(session)
-        return analytics_service.get_price_trend()
+        return analytics_service.get_price_trend(from_date, to_date, granularity.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting price trend: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/analytics/scenario", response_model=ScenarioResult)
+@admitted(analytics_pool)
+def run_analytics_scenario(request: ScenarioRequest, session: Session = Depends(get_session)):
+    """假设分析：剔除/筛选订阅并调整价格或汇率后重新计算汇总"""
+    try:
+        return ColumnarAnalyticsService(session).run_scenario(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error running analytics scenario: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/analytics/timeline/creation")
-def get_creation_timeline(session: Session = Depends(get_session)):
+@admitted(analytics_pool)
+def get_creation_timeline(
+    include_archived: bool = Query(False, description="Include archived subscriptions"),
+    session: Session = Depends(get_session)
+):
     """获取订阅创建时间线"""
     try:
-        analytics_service = AnalyticsService(session)
+        analytics_service = ColumnarAnalyticsService(session, include_archived)
         return analytics_service.get_creation_timeline()
     except Exception as e:
         logger.error(f"Error getting creation timeline: {e}")
@@ -325,16 +643,128 @@ def get_creation_timeline(session: Session = Depends(get_session)):
 
 
 @app.get("/api/analytics/timeline/renewal")
+@admitted(analytics_pool)
 def get_renewal_timeline(session: Session = Depends(get_session)):
     """获取续费时间线预测"""
     try:
-        analytics_service = AnalyticsService(session)
+        analytics_service = ColumnarAnalyticsService(session)
         return analytics_service.get_renewal_timeline()
     except Exception as e:
         logger.error(f"Error getting renewal timeline: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/analytics/history", response_model=SnapshotHistory)
+@admitted(analytics_pool)
+def get_analytics_history(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    granularity: GranularityEnum = GranularityEnum.day,
+    session: Session = Depends(get_session)
+):
+    """基于每日快照的历史趋势，按日期区间读取并按 day/week/month 汇总"""
+    try:
+        return get_snapshot_history(session, from_date, to_date, granularity.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting analytics history: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/analytics/snapshots", response_model=SnapshotResult)
+@admitted(analytics_pool)
+def create_analytics_snapshot(session: Session = Depends(get_session)):
+    """立即生成（覆盖）今天的分析快照，返回结果中包含生成耗时"""
+    try:
+        return snapshot_result(take_snapshot(session))
+    except Exception as e:
+        logger.error(f"Error taking analytics snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Admin endpoints
+@app.get("/api/admin/slow-queries", response_model=List[SlowQueryStat])
+def get_slow_queries(
+    limit: int = Query(10, ge=1, le=100),
+    order_by: SlowQueryOrderEnum = SlowQueryOrderEnum.max_ms
+):
+    """Top-N slowest normalized SQL statements with their query plans"""
+    return slow_query_log.top(limit, order_by.value)
+
+
+@app.delete("/api/admin/slow-queries")
+def reset_slow_queries():
+    """Clear the collected slow-query statistics"""
+    slow_query_log.reset()
+    return {"message": "Slow-query log cleared"}
+
+
+@app.get("/api/admin/admission", response_model=List[AdmissionPoolStats])
+def get_admission_stats():
+    """Concurrency, queue depth and rejection counts of the per-route-class executors"""
+    return [analytics_pool.stats(), crud_pool.stats(), write_pool.stats()]
+
+
+@app.get("/api/admin/job-runs", response_model=JobRunHistory)
+def get_job_runs(
+    job_id: Optional[str] = None,
+    days: int = Query(7, ge=1, le=90),
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_session)
+):
+    """Recent scheduler job runs with per-job duration, outcome and work counts"""
+    try:
+        return get_job_run_history(session, job_id, days, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/admin/replica", response_model=ReplicaStatus)
+def get_replica_status():
+    """Size of the in-memory subscription replica and its last consistency check"""
+    return subscription_replica.status()
+
+
+@app.post("/api/admin/replica/check", response_model=ReplicaStatus)
+async def check_replica():
+    """Compare the replica with the database now, replacing it if they differ"""
+    await asyncio.to_thread(subscription_replica.check)
+    return subscription_replica.status()
+
+
+@app.get("/api/admin/backups", response_model=List[BackupSnapshot])
+def get_backups():
+    """List compressed database snapshots, newest first"""
+    return list_snapshots()
+
+
+@app.get("/api/admin/backups/status", response_model=BackupStatus)
+def get_backup_status():
+    """Progress of the running backup and the result of the last one"""
+    return backup_service.status
+
+
+@app.post("/api/admin/backups", response_model=BackupStatus, status_code=202)
+async def create_backup():
+    """Start an on-demand online backup; poll /api/admin/backups/status for progress"""
+    try:
+        return backup_service.start_backup()
+    except BackupInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/api/admin/backups/{file_name}/verify", response_model=BackupVerification)
+async def verify_backup(file_name: str):
+    """Decompress a snapshot and run PRAGMA integrity_check on it"""
+    try:
+        return await asyncio.to_thread(backup_service.verify_backup, file_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Backup not found")
+
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
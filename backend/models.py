@@ -1,6 +1,6 @@
 from datetime import datetime, date
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Union, Dict, Any
 from sqlmodel import SQLModel, Field
 from sqlalchemy import Text
 from pydantic import BaseModel
@@ -20,9 +20,60 @@ class Subscription(SQLModel, table=True):
     price: float
     currency: str = Field(default="CNY")
     cycle: CycleEnum
-    next_due_date: date
+    next_due_date: date = Field(index=True)
     notes: Optional[str] = Field(default=None, sa_column=Text)
+    auto_renew: Optional[bool] = None  # None 表示跟随全局 auto_renew 设置
+    tags: Optional[str] = None  # 逗号分隔的标签，用于提醒路由
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # 写入时计算的成本：原币种与基准货币（base_currency 设置）
+    monthly_cost: Optional[float] = None
+    yearly_cost: Optional[float] = None
+    monthly_cost_base: Optional[float] = Field(default=None, index=True)
+    yearly_cost_base: Optional[float] = None
+
+
+class ArchivedSubscription(SQLModel, table=True):
+    """已取消的订阅，归档后从 subscriptions 移到这里，热表只保留活跃订阅"""
+    __tablename__ = "archived_subscriptions"
+
+    # 订阅 id 在删除最大行后可能被 SQLite 复用，归档表使用独立主键
+    archive_id: Optional[int] = Field(default=None, primary_key=True)
+    id: int = Field(index=True)  # 原订阅 id
+    name: str
+    price: float
+    currency: str = Field(default="CNY")
+    cycle: CycleEnum
+    next_due_date: date
+    notes: Optional[str] = Field(default=None, sa_column=Text)
+    auto_renew: Optional[bool] = None
+    tags: Optional[str] = None
+    created_at: datetime
+    monthly_cost: Optional[float] = None
+    yearly_cost: Optional[float] = None
+    monthly_cost_base: Optional[float] = None
+    yearly_cost_base: Optional[float] = None
+    archived_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    archive_reason: Optional[str] = None
+
+
+class GranularityEnum(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+class SearchOrderEnum(str, Enum):
+    rank = "rank"
+    name = "name"
+    price = "price"
+    next_due_date = "next_due_date"
+    created_at = "created_at"
+
+
+class SubscriptionOrderEnum(str, Enum):
+    next_due_date = "next_due_date"
+    name = "name"
+    id = "id"
 
 
 class SubscriptionCreate(BaseModel):
@@ -32,6 +83,8 @@ class SubscriptionCreate(BaseModel):
     cycle: CycleEnum
     next_due_date: date
     notes: Optional[str] = None
+    auto_renew: Optional[bool] = None
+    tags: Optional[str] = None
 
 
 class SubscriptionUpdate(BaseModel):
@@ -41,6 +94,31 @@ class SubscriptionUpdate(BaseModel):
     cycle: Optional[CycleEnum] = None
     next_due_date: Optional[date] = None
     notes: Optional[str] = None
+    auto_renew: Optional[bool] = None
+    tags: Optional[str] = None
+
+
+class SubscriptionArchiveRequest(BaseModel):
+    reason: Optional[str] = None
+
+
+class SubscriptionSearchHit(BaseModel):
+    """全文搜索结果"""
+    subscription: Subscription
+    rank: float  # bm25 得分，越小越相关
+    name_highlight: str  # 已转义的 HTML，命中部分包在 <mark> 中
+    notes_snippet: Optional[str] = None
+
+
+class CalendarOccurrence(BaseModel):
+    """日历中的一次续费"""
+    date: date
+    subscription_id: int
+    name: str
+    price: float
+    currency: str
+    cycle: CycleEnum
+    next_due_date: date
 
 
 class Setting(SQLModel, table=True):
@@ -50,6 +128,85 @@ class Setting(SQLModel, table=True):
     value: str
 
 
+class SubscriptionAggregate(SQLModel, table=True):
+    """订阅汇总表，由 subscriptions 上的触发器按增量维护"""
+    __tablename__ = "subscription_aggregates"
+
+    dimension: str = Field(primary_key=True)  # total / cycle / currency / price_range
+    bucket: str = Field(primary_key=True)
+    count: int = 0
+    price_total: float = 0.0
+    monthly_total: float = 0.0
+    yearly_total: float = 0.0
+    monthly_base_total: float = Field(default=0.0, sa_column_kwargs={"server_default": "0"})
+    yearly_base_total: float = Field(default=0.0, sa_column_kwargs={"server_default": "0"})
+
+
+class SubscriptionEvent(SQLModel, table=True):
+    """订阅变更事件日志（只追加），每行携带写入后的累计值用于前缀和查询"""
+    __tablename__ = "subscription_events"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    subscription_id: int = Field(index=True)
+    event_type: str  # created / price_changed / cycle_changed / currency_changed / deleted / archived / restored
+    occurred_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    currency: str
+    price: float
+    cycle: CycleEnum
+    monthly_delta: float
+    count_delta: int
+    running_monthly: float  # 事件发生后所有订阅的月度成本累计
+    running_count: int
+    running_currency_totals: str = "{}"  # JSON: {货币: {"monthly": 月度成本, "count": 数量}}
+
+
+class DataVersion(SQLModel, table=True):
+    """订阅数据版本号，subscriptions 每次写入都会由触发器递增，用于缓存失效"""
+    __tablename__ = "data_version"
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+
+
+class AnalyticsSnapshot(SQLModel, table=True):
+    """每日分析快照，由定时任务写入，历史趋势直接按日期区间读取"""
+    __tablename__ = "analytics_snapshots"
+
+    snapshot_date: date = Field(primary_key=True)
+    captured_at: datetime = Field(default_factory=datetime.utcnow)
+    base_currency: str
+    active_count: int = 0
+    archived_count: int = 0
+    monthly_total_base: float = 0.0
+    yearly_total_base: float = 0.0
+    upcoming_30d_count: int = 0  # 30 天内到期
+    overdue_count: int = 0
+    created_count: int = 0  # 当天新建（含恢复）
+    removed_count: int = 0  # 当天删除或归档
+    price_change_count: int = 0
+    cycle_counts: str = "{}"  # JSON: {周期: 数量}
+    currency_breakdown: str = "{}"  # JSON: {货币: {"count": 数量, "monthly": 原币月度成本, "monthly_base": 基准货币月度成本}}
+    duration_ms: float = 0.0  # 生成快照本身的耗时
+    rows_read: int = 0  # 生成快照读取的行数
+
+
+class JobRun(SQLModel, table=True):
+    """定时任务的一次运行记录（手动触发的同名任务也会记录）"""
+    __tablename__ = "job_runs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(index=True)
+    started_at: datetime = Field(index=True)
+    finished_at: datetime
+    duration_ms: float = 0.0
+    status: str  # success / failed / skipped（上一次运行尚未结束）/ missed（错过调度时间）
+    rows_scanned: Optional[int] = None
+    reminders_sent: Optional[int] = None
+    telegram_ms: float = 0.0  # 等待 Telegram API 的时间
+    fx_ms: float = 0.0  # 拉取汇率的时间
+    error: Optional[str] = None
+
+
 class SettingCreate(BaseModel):
     key: str
     value: str
@@ -62,7 +219,7 @@ class SettingUpdate(BaseModel):
 # 趋势分析相关的数据模型
 class MonthlySpending(BaseModel):
     """月度支出统计"""
-    month: str  # YYYY-MM格式
+    month: str  # 统计区间: month 为 YYYY-MM，day/week 为 YYYY-MM-DD（周以周一为起点）
     total_amount: float
     currency: str
     subscription_count: int
@@ -70,6 +227,7 @@ class MonthlySpending(BaseModel):
 
 class PriceTrend(BaseModel):
     """价格趋势数据"""
+    granularity: str = "month"
     monthly_spending: List[MonthlySpending]
     total_monthly: float
     total_yearly: float
@@ -88,10 +246,12 @@ class SubscriptionAnalytics(BaseModel):
     """订阅数据分析"""
     total_subscriptions: int
     active_subscriptions: int
+    base_currency: str = "CNY"  # 以下成本均折算为基准货币
     total_monthly_cost: float
     total_yearly_cost: float
     cycle_breakdown: List[CycleAnalysis]
-    upcoming_renewals: List[Subscription]  # 即将到期的订阅
+    # 即将到期的订阅；按 renewal_fields 裁剪时为只含所选列的字典
+    upcoming_renewals: List[Union[Dict[str, Any], Subscription]]
     price_ranges: dict  # 价格区间统计
 
 
@@ -107,4 +267,199 @@ class TrendAnalysis(BaseModel):
     subscription_analytics: SubscriptionAnalytics
     price_trend: PriceTrend
     creation_timeline: List[TimelineData]  # 订阅创建时间线
-    renewal_timeline: List[TimelineData]  # 续费时间线
\ No newline at end of file
+    renewal_timeline: List[TimelineData]  # 续费时间线
+
+
+class ScenarioFilter(BaseModel):
+    """假设分析中的订阅筛选条件，各条件同时满足才算匹配"""
+    cycles: Optional[List[CycleEnum]] = None
+    currencies: Optional[List[str]] = None
+    min_price: Optional[float] = None  # 含
+    max_price: Optional[float] = None  # 不含，与价格区间统计一致
+
+
+class PriceAdjustment(BaseModel):
+    """对匹配的订阅调价（百分比，10 表示涨价 10%）"""
+    where: ScenarioFilter = ScenarioFilter()
+    percent: float
+
+
+class ScenarioRequest(BaseModel):
+    """假设分析：先筛选/剔除订阅，再调整价格和汇率"""
+    include: Optional[ScenarioFilter] = None  # 只保留匹配的订阅
+    exclude: List[ScenarioFilter] = []  # 剔除匹配任一条件的订阅
+    price_adjustments: List[PriceAdjustment] = []
+    rate_adjustments: Dict[str, float] = {}  # 货币 -> 相对基准货币的升值百分比
+
+
+class ScenarioTotals(BaseModel):
+    """假设分析的汇总结果（成本按基准货币计）"""
+    subscription_count: int
+    total_monthly_cost: float
+    total_yearly_cost: float
+    cycle_breakdown: List[CycleAnalysis]
+    currency_breakdown: Dict[str, Dict[str, float]]
+    price_ranges: Dict[str, int]
+
+
+class ScenarioResult(BaseModel):
+    """假设分析结果：当前数据与调整后的对比"""
+    base_currency: str
+    baseline: ScenarioTotals
+    scenario: ScenarioTotals
+    monthly_delta: float
+    yearly_delta: float
+    computed_ms: float
+
+
+class SlowQueryOrderEnum(str, Enum):
+    max_ms = "max_ms"
+    total_ms = "total_ms"
+    avg_ms = "avg_ms"
+    count = "count"
+
+
+class SlowQueryStat(BaseModel):
+    """按归一化语句汇总的慢查询"""
+    statement: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    avg_ms: float = 0.0
+    last_ms: float = 0.0
+    rows: int = 0  # 最近一次返回或影响的行数
+    parameters: List[str] = []  # 最近一次的参数（已脱敏）
+    plan: List[str] = []  # EXPLAIN QUERY PLAN
+    full_scan: bool = False  # 是否全表扫描 subscriptions
+    last_seen: Optional[datetime] = None
+
+
+class BackupSnapshot(BaseModel):
+    """备份目录中的一个压缩快照"""
+    file_name: str
+    size_bytes: int
+    created_at: datetime
+
+
+class BackupResult(BaseModel):
+    """一次备份的结果"""
+    file_name: str
+    pages: int
+    size_bytes: int  # 未压缩的数据库大小
+    compressed_bytes: int
+    duration_ms: float
+    restarts: int = 0  # 源库被并发修改导致复制重启的次数
+    finished_at: datetime
+
+
+class BackupStatus(BaseModel):
+    """当前备份进度和最近一次结果"""
+    running: bool = False
+    started_at: Optional[datetime] = None
+    pages_total: int = 0
+    pages_remaining: int = 0
+    restarts: int = 0
+    last_result: Optional[BackupResult] = None
+    last_error: Optional[str] = None
+
+
+class BackupVerification(BaseModel):
+    """快照校验结果"""
+    file_name: str
+    ok: bool
+    integrity: str
+    subscriptions: Optional[int] = None
+    duration_ms: float
+
+
+class ReminderRoute(BaseModel):
+    """提醒路由：带有任一标签的订阅提醒发送到 chat_id（标签 "*" 匹配所有订阅）"""
+    chat_id: str
+    tags: List[str]
+    name: Optional[str] = None
+
+
+class SnapshotPoint(BaseModel):
+    """历史趋势中的一个点：存量取区间内最后一个快照，当天流量按区间求和"""
+    period: str  # month 为 YYYY-MM，day/week 为 YYYY-MM-DD（周以周一为起点）
+    snapshot_date: date
+    active_count: int
+    archived_count: int
+    monthly_total_base: float
+    yearly_total_base: float
+    upcoming_30d_count: int
+    overdue_count: int
+    created_count: int
+    removed_count: int
+    price_change_count: int
+    cycle_counts: Dict[str, int]
+    currency_breakdown: Dict[str, Dict[str, Any]]
+
+
+class SnapshotHistory(BaseModel):
+    """按日期区间读取的快照时间序列"""
+    granularity: str
+    base_currency: Optional[str] = None  # 最新快照的基准货币
+    points: List[SnapshotPoint]
+
+
+class SnapshotResult(SnapshotPoint):
+    """手动生成的单个快照（period 为快照日期），附带生成耗时"""
+    base_currency: str
+    captured_at: datetime
+    duration_ms: float
+    rows_read: int
+
+
+class AdmissionPoolStats(BaseModel):
+    """一类路由执行器的当前负载与累计计数"""
+    name: str
+    workers: int
+    max_queue: int
+    active: int
+    queued: int
+    max_queued: int  # 启动以来的最大排队数
+    admitted: int
+    rejected: int  # 因排队已满返回 503 的请求数
+    completed: int
+    failed: int
+    avg_wait_ms: float  # 排队等待时间的指数移动平均
+    avg_run_ms: float
+
+
+class JobRunStats(BaseModel):
+    """一个任务在查询窗口内的运行汇总"""
+    job_id: str
+    runs: int
+    succeeded: int
+    failed: int
+    skipped: int
+    missed: int
+    avg_ms: float
+    p95_ms: float
+    max_ms: float
+    rows_scanned: int
+    reminders_sent: int
+    telegram_ms: float
+    fx_ms: float
+    last_status: str
+    last_started_at: datetime
+
+
+class JobRunHistory(BaseModel):
+    """最近的运行记录和按任务的汇总"""
+    since: datetime
+    stats: List[JobRunStats]
+    runs: List[JobRun]
+
+
+class ReplicaStatus(BaseModel):
+    """订阅内存副本的状态与最近一次一致性检查"""
+    enabled: bool
+    rows: int
+    loaded_at: Optional[datetime] = None
+    writes: int  # 启动以来 write-through 的次数
+    last_check_at: Optional[datetime] = None
+    last_check_ms: float = 0.0
+    last_mismatches: int = 0  # 最近一次检查发现的不一致行数
+    repairs: int = 0
\ No newline at end of file
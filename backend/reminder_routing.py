@@ -0,0 +1,89 @@
+"""
+提醒路由
+settings 中的 reminder_routes（JSON 列表）按订阅标签把提醒分发到多个 Telegram 会话，例如:
+[{"chat_id": "-100123", "tags": ["ops", "infra"], "name": "运维群"}, {"chat_id": "42", "tags": ["*"]}]
+订阅发给标签匹配的所有路由；没有匹配任何路由的订阅发给默认的 telegram_chat_id。
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+from pydantic import ValidationError
+from models import Subscription, ReminderRoute
+from settings_registry import settings_registry
+
+logger = logging.getLogger(__name__)
+
+REMINDER_ROUTES_SETTING = "reminder_routes"
+WILDCARD = "*"
+
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    """逗号分隔的标签，去空白、转小写、去重"""
+    if not tags:
+        return []
+    return list(dict.fromkeys(tag.strip().lower() for tag in tags.split(",") if tag.strip()))
+
+
+def parse_routes(value: str) -> List[ReminderRoute]:
+    """解析 reminder_routes 设置；格式错误时抛出 ValueError"""
+    try:
+        items = json.loads(value) if value.strip() else []
+    except json.JSONDecodeError as e:
+        raise ValueError(f"reminder_routes is not valid JSON: {e}")
+    if not isinstance(items, list):
+        raise ValueError("reminder_routes must be a JSON list")
+
+    routes = []
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("chat_id"), int):
+            item = {**item, "chat_id": str(item["chat_id"])}
+        try:
+            routes.append(ReminderRoute.model_validate(item))
+        except ValidationError as e:
+            raise ValueError(f"Invalid reminder route {item!r}: {e.errors()[0]['msg']}")
+    return routes
+
+
+settings_registry.define(REMINDER_ROUTES_SETTING, parse_routes, [], "按标签把提醒分发到多个会话")
+
+
+class ReminderRouter:
+    """标签到接收会话的查找表"""
+
+    def __init__(self, routes: Iterable[ReminderRoute], default_chat_id: Optional[str] = None):
+        self.default_chat_id = default_chat_id
+        self.by_tag: Dict[str, List[str]] = {}
+        self.catch_all: List[str] = []
+        for route in routes:
+            for tag in parse_tags(",".join(route.tags)):
+                targets = self.catch_all if tag == WILDCARD else self.by_tag.setdefault(tag, [])
+                if route.chat_id not in targets:
+                    targets.append(route.chat_id)
+
+    @classmethod
+    def from_settings(cls, default_chat_id: Optional[str] = None) -> "ReminderRouter":
+        return cls(settings_registry.get(REMINDER_ROUTES_SETTING), default_chat_id)
+
+    def recipients(self, subscription: Subscription) -> List[str]:
+        """订阅应发送到的会话（保持路由顺序并去重）"""
+        chat_ids = list(self.catch_all)
+        matched = False
+        for tag in parse_tags(subscription.tags):
+            for chat_id in self.by_tag.get(tag, ()):
+                matched = True
+                if chat_id not in chat_ids:
+                    chat_ids.append(chat_id)
+        if not matched and self.default_chat_id and self.default_chat_id not in chat_ids:
+            chat_ids.append(self.default_chat_id)
+        return chat_ids
+
+    def route(self, subscriptions: Iterable[Subscription]) -> Dict[str, List[Subscription]]:
+        """一次遍历到期订阅，按接收会话分组"""
+        batches: Dict[str, List[Subscription]] = {}
+        for subscription in subscriptions:
+            chat_ids = self.recipients(subscription)
+            if not chat_ids:
+                logger.warning(f"No reminder recipient for subscription {subscription.name} (tags: {subscription.tags})")
+            for chat_id in chat_ids:
+                batches.setdefault(chat_id, []).append(subscription)
+        return batches
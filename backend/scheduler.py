@@ -1,55 +1,168 @@
 import asyncio
 import logging
+import os
 from datetime import datetime, timedelta
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from sqlmodel import Session, select
 from database import engine
 from models import Subscription
 from telegram_service import telegram_service
+from costs import refresh_base_costs, BASE_CURRENCY_SETTING
+from auto_renew import auto_renew_overdue, is_auto_renew_enabled, AUTO_RENEW_SETTING
+from tracing import traced
+from backup import backup_service, BackupInProgressError
+from events import event_broker
+from reminder_routing import ReminderRouter
+from settings_registry import settings_registry
+from snapshots import take_snapshot
+from job_runs import job_run_tracker, add_counts, timed
+from subscription_replica import subscription_replica, REPLICA_CHECK_SECONDS
 
 logger = logging.getLogger(__name__)
 
+REMINDER_JOB_ID = "subscription_reminder_check"
+SNAPSHOT_JOB_ID = "analytics_snapshot"
+COST_REFRESH_JOB_ID = "normalized_cost_refresh"
+AUTO_RENEW_JOB_ID = "auto_renew_sweep"
+BACKUP_JOB_ID = "database_backup"
+REPLICA_CHECK_JOB_ID = "subscription_replica_check"
 
+# A run that starts late (e.g. the event loop was busy) still runs within this window;
+# several missed runs are coalesced into one, and a job never overlaps with itself
+JOB_DEFAULTS = {
+    "coalesce": True,
+    "max_instances": 1,
+    "misfire_grace_time": int(os.getenv("JOB_MISFIRE_GRACE_SECONDS", "300")),
+}
+
+
+@job_run_tracker.track(REMINDER_JOB_ID)
+@traced("scheduler.check_subscription_reminders")
 async def check_subscription_reminders():
-    """Check for subscriptions that need reminders and send batch Telegram notification"""
+    """Check for subscriptions that need reminders and send one batch per recipient"""
     logger.info("Starting subscription reminder check")
 
-    # Reinitialize Telegram service to get latest settings
-    await telegram_service.initialize()
-
     today = datetime.now().date()
-    reminders_to_send = []
 
+    # Overdue, due today, or due within 3 days
+    if subscription_replica.enabled:
+        reminders_to_send = subscription_replica.due_on_or_before(today + timedelta(days=3))
+    else:
+        with Session(engine) as session:
+            stmt = select(Subscription).where(Subscription.next_due_date <= today + timedelta(days=3))
+            reminders_to_send = session.exec(stmt).all()
+    add_counts(rows_scanned=len(reminders_to_send))
+
+    # Route each due subscription to its recipients in a single pass
+    batches = ReminderRouter.from_settings(telegram_service.chat_id).route(reminders_to_send)
+
+    if batches:
+        with timed("telegram"):
+            results = await telegram_service.send_routed_reminders(batches)
+        add_counts(reminders_sent=sum(len(batches[chat_id]) for chat_id, success in results.items() if success))
+        for chat_id, success in results.items():
+            if success:
+                logger.info(f"Batch reminder sent to chat {chat_id} for {len(batches[chat_id])} subscriptions")
+            else:
+                logger.error(f"Failed to send batch reminder to chat {chat_id} for {len(batches[chat_id])} subscriptions")
+    else:
+        logger.info("No subscriptions require reminders at this time")
+
+    logger.info("Subscription reminder check completed")
+
+
+@job_run_tracker.track(SNAPSHOT_JOB_ID)
+@traced("scheduler.take_analytics_snapshot")
+async def take_analytics_snapshot():
+    """Write today's analytics snapshot (re-running the same day overwrites it)"""
     with Session(engine) as session:
-        # Get all subscriptions
-        stmt = select(Subscription)
-        subscriptions = session.exec(stmt).all()
+        snapshot = take_snapshot(session)
+    add_counts(rows_scanned=snapshot.rows_read)
 
-        for subscription in subscriptions:
-            days_until_due = (subscription.next_due_date - today).days
 
-            # Collect subscriptions that need reminders (overdue, due today, or due within 3 days)
-            if days_until_due <= 3:  # Includes overdue (negative), today (0), and upcoming (1-3)
-                reminders_to_send.append(subscription)
-                logger.info(f"Added to reminder batch: {subscription.name} (due in {days_until_due} days)")
+@job_run_tracker.track(COST_REFRESH_JOB_ID)
+@traced("scheduler.refresh_normalized_costs")
+async def refresh_normalized_costs():
+    """Refresh base-currency cost columns with the latest exchange rates"""
+    logger.info("Starting base-currency cost refresh")
+    with Session(engine) as session:
+        updated = await refresh_base_costs(session)
+    if updated:
+        subscription_replica.load()
+        event_broker.publish("costs_refreshed", {"updated": updated})
 
-        # Send batch reminder if there are any subscriptions to remind about
-        if reminders_to_send:
-            success = await telegram_service.send_batch_reminders(reminders_to_send)
-            if success:
-                logger.info(f"Batch reminder sent successfully for {len(reminders_to_send)} subscriptions")
-            else:
-                logger.error(f"Failed to send batch reminder for {len(reminders_to_send)} subscriptions")
-        else:
-            logger.info("No subscriptions require reminders at this time")
 
-    logger.info("Subscription reminder check completed")
+@job_run_tracker.track(AUTO_RENEW_JOB_ID)
+@traced("scheduler.run_auto_renew_sweep")
+async def run_auto_renew_sweep() -> int:
+    """Advance overdue auto-renew subscriptions in one UPDATE and send a summary"""
+    logger.info("Starting auto-renew sweep")
+
+    with Session(engine) as session:
+        renewed = auto_renew_overdue(session, datetime.now().date())
+        subscription_replica.refresh([row["id"] for row in renewed])
+    add_counts(rows_scanned=len(renewed))
+
+    if renewed:
+        event_broker.publish("auto_renewed", {"subscriptions": [
+            {"id": row["id"], "next_due_date": row["next_due_date"]} for row in renewed
+        ]})
+        try:
+            with timed("telegram"):
+                await telegram_service.send_auto_renew_summary(renewed)
+        except Exception as e:
+            logger.warning(f"Failed to send auto-renew summary: {e}")
+    else:
+        logger.info("No overdue auto-renew subscriptions")
+
+    return len(renewed)
+
+
+@job_run_tracker.track(BACKUP_JOB_ID)
+@traced("scheduler.run_scheduled_backup")
+async def run_scheduled_backup():
+    """Take a compressed online snapshot of the database without blocking writers"""
+    logger.info("Starting scheduled database backup")
+    try:
+        await asyncio.to_thread(backup_service.create_backup)
+    except BackupInProgressError:
+        logger.info("Skipping scheduled backup, another backup is in progress")
+    except ValueError as e:
+        logger.info(f"Skipping scheduled backup: {e}")
+
+
+@job_run_tracker.track(REPLICA_CHECK_JOB_ID)
+@traced("scheduler.check_subscription_replica")
+async def check_subscription_replica():
+    """Compare the in-memory replica and the settings cache with the database and repair any drift"""
+    rows = await asyncio.to_thread(subscription_replica.check)
+    # Settings are few; reloading them notifies subscribers of changes made outside the API
+    changed = settings_registry.reload()
+    add_counts(rows_scanned=rows + len(settings_registry.all_raw()))
+    if changed:
+        event_broker.publish("settings_changed", {"keys": sorted(changed)})
 
 
 class SchedulerService:
     def __init__(self):
-        self.scheduler = AsyncIOScheduler()
+        self.scheduler = AsyncIOScheduler(job_defaults=JOB_DEFAULTS)
+        settings_registry.subscribe(self.on_settings_changed)
+
+    def on_settings_changed(self, keys):
+        """Settings subscriber: run the auto-renew sweep right away when it gets enabled,
+        and re-normalize stored costs when the base currency changes"""
+        if AUTO_RENEW_SETTING in keys and is_auto_renew_enabled() and self.scheduler.running:
+            self.scheduler.modify_job(AUTO_RENEW_JOB_ID, next_run_time=datetime.now())
+        if BASE_CURRENCY_SETTING in keys:
+            self.refresh_costs_soon()
+
+    def refresh_costs_soon(self):
+        """Run the base-currency cost refresh now, e.g. after a write found no cached rate"""
+        if self.scheduler.running:
+            self.scheduler.modify_job(COST_REFRESH_JOB_ID, next_run_time=datetime.now())
 
     def start(self):
         """Start the scheduler with hourly reminder check"""
@@ -57,11 +170,64 @@ class SchedulerService:
         self.scheduler.add_job(
             check_subscription_reminders,
             CronTrigger(minute=0),
-            id="subscription_reminder_check",
+            id=REMINDER_JOB_ID,
             name="Hourly subscription reminder check",
             replace_existing=True
         )
 
+        # Late in the day so the snapshot captures the day's changes; once at startup
+        # so today has a data point even if the process was down at 23:55
+        self.scheduler.add_job(
+            take_analytics_snapshot,
+            CronTrigger(hour=23, minute=55),
+            id=SNAPSHOT_JOB_ID,
+            name="Daily analytics snapshot",
+            replace_existing=True,
+            next_run_time=datetime.now()
+        )
+
+        # Exchange rates are cached for an hour; also run once right after startup
+        self.scheduler.add_job(
+            refresh_normalized_costs,
+            CronTrigger(minute=30),
+            id=COST_REFRESH_JOB_ID,
+            name="Hourly base-currency cost refresh",
+            replace_existing=True,
+            next_run_time=datetime.now()
+        )
+
+        # Daily just after midnight, and once at startup to catch up
+        self.scheduler.add_job(
+            run_auto_renew_sweep,
+            CronTrigger(hour=0, minute=5),
+            id=AUTO_RENEW_JOB_ID,
+            name="Daily auto-renew sweep",
+            replace_existing=True,
+            next_run_time=datetime.now()
+        )
+
+        # Daily online backup, at a quiet hour by default
+        self.scheduler.add_job(
+            run_scheduled_backup,
+            CronTrigger(hour=int(os.getenv("BACKUP_HOUR", "3")), minute=15),
+            id=BACKUP_JOB_ID,
+            name="Daily database backup",
+            replace_existing=True
+        )
+
+        # Catches writes made outside this process, e.g. the backup CLI restoring a snapshot,
+        # both in the subscription replica and in the settings cache
+        self.scheduler.add_job(
+            check_subscription_replica,
+            IntervalTrigger(seconds=REPLICA_CHECK_SECONDS),
+            id=REPLICA_CHECK_JOB_ID,
+            name="Subscription replica and settings consistency check",
+            replace_existing=True
+        )
+
+        # Runs APScheduler drops never reach the job wrappers, so record them here
+        self.scheduler.add_listener(job_run_tracker.on_scheduler_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
         self.scheduler.start()
         logger.info("Scheduler started successfully")
 
@@ -0,0 +1,183 @@
+"""
+订阅全文搜索模块
+subscriptions_fts 是以 subscriptions 为外部内容的 FTS5 虚拟表，
+由触发器与主表保持同步，支持子串匹配、bm25 排序与高亮摘要。
+使用 trigram 分词器，中日韩文本没有空格分词也能按任意子串匹配；
+少于 3 个字符的词无法走索引，改用 LIKE 过滤（此时没有 bm25 得分）。
+高亮结果中的用户文本均已 HTML 转义，只有 <mark> 标签是标记。
+"""
+import html
+import logging
+import re
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from models import Subscription, SubscriptionSearchHit
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TRIGGERS = {
+    "subscriptions_fts_insert":
+        "CREATE TRIGGER subscriptions_fts_insert AFTER INSERT ON subscriptions BEGIN "
+        "INSERT INTO subscriptions_fts(rowid, name, notes) VALUES (NEW.id, NEW.name, NEW.notes); "
+        "END",
+    "subscriptions_fts_update":
+        "CREATE TRIGGER subscriptions_fts_update AFTER UPDATE OF name, notes ON subscriptions BEGIN "
+        "INSERT INTO subscriptions_fts(subscriptions_fts, rowid, name, notes) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.notes); "
+        "INSERT INTO subscriptions_fts(rowid, name, notes) VALUES (NEW.id, NEW.name, NEW.notes); "
+        "END",
+    "subscriptions_fts_delete":
+        "CREATE TRIGGER subscriptions_fts_delete AFTER DELETE ON subscriptions BEGIN "
+        "INSERT INTO subscriptions_fts(subscriptions_fts, rowid, name, notes) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.notes); "
+        "END",
+}
+
+# 允许的排序方式 -> ORDER BY 子句
+SEARCH_ORDERINGS = {
+    "rank": "rank",
+    "name": "s.name",
+    "price": "s.price",
+    "next_due_date": "s.next_due_date",
+    "created_at": "s.created_at",
+}
+
+# 名称命中的权重高于备注
+NAME_WEIGHT = 10.0
+NOTES_WEIGHT = 1.0
+
+# trigram 索引能匹配的最短词长
+MIN_INDEXED_LENGTH = 3
+
+# highlight / snippet 先用控制字符标记命中位置，转义文本后再替换为 <mark>
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+SEARCH_TABLE_DDL = (
+    "CREATE VIRTUAL TABLE subscriptions_fts USING fts5("
+    "name, notes, content='subscriptions', content_rowid='id', tokenize='trigram')"
+)
+
+
+def install_search_index(engine: Engine):
+    """创建 FTS5 索引表与同步触发器，首次创建时从主表重建索引"""
+    with engine.begin() as conn:
+        existing = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'subscriptions_fts'"
+        )).scalar()
+        if existing is not None and "trigram" not in existing:
+            # 旧版本使用 unicode61 分词，换分词器需要重建索引
+            conn.execute(text("DROP TABLE subscriptions_fts"))
+            existing = None
+            logger.info("Rebuilding full-text search index with the trigram tokenizer")
+        if existing is None:
+            conn.execute(text(SEARCH_TABLE_DDL))
+            conn.execute(text("INSERT INTO subscriptions_fts(subscriptions_fts) VALUES ('rebuild')"))
+            logger.info("Full-text search index created")
+
+        for name, ddl in SEARCH_TRIGGERS.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(ddl))
+
+
+def build_match_query(terms: List[str]) -> str:
+    """把可走索引的词转换为 FTS5 查询：每个词按子串匹配，词之间为 AND"""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _to_html(value: Optional[str]) -> Optional[str]:
+    """转义 FTS5 返回的文本，再把命中标记替换为 <mark>"""
+    if value is None:
+        return None
+    return html.escape(value).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def _mark_terms(value: Optional[str], terms: List[str]) -> Optional[str]:
+    """只有短词、没有 MATCH 时在 Python 中标记命中位置；与 LIKE 一致，只有 ASCII 字母不区分大小写"""
+    if not value:
+        return None
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE | re.ASCII)
+    marked, count = pattern.subn(lambda match: f"{MARK_START}{match.group(0)}{MARK_END}", value)
+    return marked if count else None
+
+
+def search_subscriptions(
+    session: Session,
+    query: str,
+    cycle: Optional[str] = None,
+    currency: Optional[str] = None,
+    order_by: str = "rank",
+    descending: bool = False,
+    limit: int = 50,
+    offset: int = 0
+) -> List[SubscriptionSearchHit]:
+    """全文搜索订阅，可与周期、货币过滤和常规排序组合使用"""
+    terms = query.split()
+    if not terms:
+        return []
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_LENGTH]
+    short = [term for term in terms if len(term) < MIN_INDEXED_LENGTH]
+
+    conditions = []
+    params = {"limit": limit, "offset": offset, "mark_start": MARK_START, "mark_end": MARK_END}
+    if indexed:
+        conditions.append("subscriptions_fts MATCH :match")
+        params["match"] = build_match_query(indexed)
+    for index, term in enumerate(short):
+        conditions.append(f"(s.name LIKE :short{index} ESCAPE '\\' OR s.notes LIKE :short{index} ESCAPE '\\')")
+        params[f"short{index}"] = _like_pattern(term)
+    if cycle:
+        conditions.append("s.cycle = :cycle")
+        params["cycle"] = cycle
+    if currency:
+        conditions.append("s.currency = :currency")
+        params["currency"] = currency.upper()
+
+    if indexed:
+        columns = (
+            f"bm25(subscriptions_fts, {NAME_WEIGHT}, {NOTES_WEIGHT}) AS rank, "
+            "highlight(subscriptions_fts, 0, :mark_start, :mark_end) AS name_highlight, "
+            "snippet(subscriptions_fts, 1, :mark_start, :mark_end, '…', 16) AS notes_snippet "
+            "FROM subscriptions_fts JOIN subscriptions s ON s.id = subscriptions_fts.rowid "
+        )
+    else:
+        # 只有短词时没有全文查询，不计算得分，命中位置在 Python 中标记
+        columns = "0.0 AS rank, s.name AS name_highlight, s.notes AS notes_snippet FROM subscriptions s "
+
+    direction = "DESC" if descending else "ASC"
+    stmt = text(
+        f"SELECT s.id AS id, {columns}"
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {SEARCH_ORDERINGS[order_by]} {direction}, s.id "
+        "LIMIT :limit OFFSET :offset"
+    )
+    rows = session.execute(stmt, params).all()
+    if not rows:
+        return []
+
+    subscriptions = {
+        sub.id: sub
+        for sub in session.exec(select(Subscription).where(Subscription.id.in_([row.id for row in rows]))).all()
+    }
+    hits = []
+    for row in rows:
+        if row.id not in subscriptions:
+            continue
+        name_highlight, notes_snippet = row.name_highlight, row.notes_snippet
+        if not indexed:
+            name_highlight = _mark_terms(name_highlight, short) or name_highlight
+            notes_snippet = _mark_terms(notes_snippet, short)
+        hits.append(SubscriptionSearchHit(
+            subscription=subscriptions[row.id],
+            rank=row.rank,
+            name_highlight=_to_html(name_highlight),
+            notes_snippet=_to_html(notes_snippet or None)
+        ))
+    return hits
@@ -0,0 +1,162 @@
+"""
+设置注册表
+各模块用 define() 声明自己的设置项（解析/校验函数与默认值），读取走进程内缓存：
+首次读取时一次性加载 settings 表，之后不再查询数据库。
+写入经过校验后用一条 INSERT ... ON CONFLICT DO UPDATE 完成整批 upsert，
+提交后更新缓存，并把实际变化的键通知给订阅者（如 Telegram 服务、定时任务）。
+数据库被绕过缓存替换时（备份恢复、其他进程写入）由 reload() 重新加载并同样通知订阅者。
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+from models import Setting
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off", "")
+
+
+def parse_str(value: str) -> str:
+    return value.strip()
+
+
+def parse_bool(value: str) -> bool:
+    normalized = value.strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ValueError(f"Expected a boolean ({', '.join(TRUE_VALUES)} / {', '.join(FALSE_VALUES[:-1])}), got {value!r}")
+
+
+class SettingDefinition:
+    """一个设置项：parse 把存储的字符串转换为类型化的值，格式错误时抛出 ValueError"""
+
+    def __init__(self, key: str, parse: Callable[[str], Any], default: Any = None, description: str = ""):
+        self.key = key
+        self.parse = parse
+        self.default = default
+        self.description = description
+
+
+class SettingsRegistry:
+    def __init__(self):
+        self.definitions: Dict[str, SettingDefinition] = {}
+        self.subscribers: List[Callable[[Set[str]], None]] = []
+        self.lock = threading.Lock()
+        self._raw: Optional[Dict[str, str]] = None
+        self._parsed: Dict[str, Any] = {}
+
+    def define(self, key: str, parse: Callable[[str], Any] = parse_str, default: Any = None,
+               description: str = "") -> SettingDefinition:
+        definition = SettingDefinition(key, parse, default, description)
+        self.definitions[key] = definition
+        return definition
+
+    def subscribe(self, callback: Callable[[Set[str]], None]):
+        """写入后以变化的键集合调用 callback（在写入方的线程中同步调用）"""
+        self.subscribers.append(callback)
+
+    def _load(self) -> Dict[str, str]:
+        # database 导入的模块（如 costs）会声明设置项，这里延迟导入避免循环依赖
+        from database import engine
+        with Session(engine) as session:
+            return {setting.key: setting.value for setting in session.exec(select(Setting)).all()}
+
+    def _values(self) -> Dict[str, str]:
+        raw = self._raw
+        if raw is None:
+            loaded = self._load()
+            with self.lock:
+                if self._raw is None:
+                    self._raw = loaded
+                    self._parsed = {}
+                raw = self._raw
+        return raw
+
+    def reload(self) -> Set[str]:
+        """从数据库重新加载缓存，通知并返回值发生变化的键；尚未加载过时只加载"""
+        loaded = self._load()
+        with self.lock:
+            previous, self._raw = self._raw, loaded
+            self._parsed = {}
+        if previous is None:
+            return set()
+
+        changed = {key for key in previous.keys() | loaded.keys() if previous.get(key) != loaded.get(key)}
+        if changed:
+            logger.info(f"Settings changed outside the API: {', '.join(sorted(changed))}")
+            self._notify(changed)
+        return changed
+
+    def get_raw(self, key: str) -> Optional[str]:
+        return self._values().get(key)
+
+    def all_raw(self) -> Dict[str, str]:
+        return dict(self._values())
+
+    def get(self, key: str) -> Any:
+        """类型化的设置值；未设置、为空或无法解析时返回默认值"""
+        definition = self.definitions[key]
+        raw = self._values()
+        with self.lock:
+            if key in self._parsed:
+                return self._parsed[key]
+
+        value = definition.default
+        stored = raw.get(key)
+        if stored is not None and stored.strip():
+            try:
+                value = definition.parse(stored)
+            except ValueError as e:
+                logger.error(f"Ignoring invalid stored setting {key}: {e}")
+
+        with self.lock:
+            if self._raw is raw:
+                self._parsed[key] = value
+        return value
+
+    def validate(self, key: str, value: str):
+        """注册过的键按其解析函数校验，未注册的键原样保存"""
+        definition = self.definitions.get(key)
+        if definition is not None and value.strip():
+            definition.parse(value)
+
+    def update(self, session: Session, values: Dict[str, str]) -> Set[str]:
+        """校验并用一条语句 upsert 整批设置，返回值实际发生变化的键"""
+        if not values:
+            return set()
+        for key, value in values.items():
+            self.validate(key, value)
+
+        current = self._values()
+        changed = {key for key, value in values.items() if current.get(key) != value}
+
+        stmt = insert(Setting).values([{"key": key, "value": value} for key, value in values.items()])
+        stmt = stmt.on_conflict_do_update(index_elements=[Setting.key], set_={"value": stmt.excluded.value})
+        session.execute(stmt)
+        session.commit()
+
+        with self.lock:
+            if self._raw is not None:
+                self._raw = {**self._raw, **values}
+                for key in changed:
+                    self._parsed.pop(key, None)
+
+        if changed:
+            self._notify(changed)
+        return changed
+
+    def _notify(self, keys: Set[str]):
+        for callback in self.subscribers:
+            try:
+                callback(keys)
+            except Exception as e:
+                logger.error(f"Settings subscriber {getattr(callback, '__qualname__', callback)} failed: {e}")
+
+
+# 全局实例
+settings_registry = SettingsRegistry()
@@ -0,0 +1,205 @@
+"""
+慢查询日志
+SQLAlchemy 的 cursor 事件记录语句和 execute 的耗时；SQLite 的 SELECT 在取数阶段才真正扫描数据，
+因此自定义 cursor 再累计每次 fetch 的耗时，在结果取完（或 cursor 关闭）时汇报总耗时与返回行数。
+调用方在两次 fetch 之间处理数据的时间不计入。
+超过 SLOW_QUERY_MS 的语句按归一化文本汇总，附带脱敏参数和 EXPLAIN QUERY PLAN，
+并标记对 subscriptions 的全表扫描。
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import SlowQueryStat
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+MAX_ENTRIES = 500
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# SCAN 表示逐行遍历（即使借助索引排序也会访问每一行），SEARCH 才是按索引定位
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (TABLE )?subscriptions\b")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """去掉字面量、合并空白和 IN 列表，使同一类语句归为一条"""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    return _IN_LIST.sub("IN (...)", normalized)
+
+
+def redact_parameters(parameters: Any) -> List[str]:
+    """只保留参数类型（字符串附带长度），避免 token 等敏感值进入日志"""
+    if isinstance(parameters, dict):
+        parameters = list(parameters.values())
+    if parameters and isinstance(parameters, (list, tuple)) and isinstance(parameters[0], (list, tuple, dict)):
+        parameters = parameters[0]  # executemany 只展示第一组
+        if isinstance(parameters, dict):
+            parameters = list(parameters.values())
+
+    redacted = []
+    for value in parameters or []:
+        if isinstance(value, str):
+            redacted.append(f"<str:{len(value)}>")
+        else:
+            redacted.append(f"<{type(value).__name__}>")
+    return redacted
+
+
+class SlowQueryLog:
+    """按归一化语句汇总的慢查询记录（进程内，最多保留 MAX_ENTRIES 条）"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, max_entries: int = MAX_ENTRIES):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self.entries: Dict[str, SlowQueryStat] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, connection: sqlite3.Connection, statement: str, parameters: Any,
+                duration_ms: float, rows: int):
+        if duration_ms < self.threshold_ms:
+            return
+
+        normalized = normalize_statement(statement)
+        with self.lock:
+            entry = self.entries.get(normalized)
+        plan = entry.plan if entry else self._explain(connection, statement, parameters)
+        full_scan = any(FULL_SCAN_PATTERN.search(step) for step in plan)
+        redacted = redact_parameters(parameters)
+
+        logger.warning(
+            f"Slow query ({duration_ms:.1f}ms, {rows} rows{', full scan of subscriptions' if full_scan else ''}): "
+            f"{normalized} params={redacted}"
+        )
+
+        with self.lock:
+            entry = self.entries.get(normalized)
+            if entry is None:
+                if len(self.entries) >= self.max_entries:
+                    fastest = min(self.entries, key=lambda key: self.entries[key].max_ms)
+                    del self.entries[fastest]
+                entry = SlowQueryStat(statement=normalized, plan=plan, full_scan=full_scan)
+                self.entries[normalized] = entry
+            entry.count += 1
+            entry.total_ms += duration_ms
+            entry.max_ms = max(entry.max_ms, duration_ms)
+            entry.avg_ms = entry.total_ms / entry.count
+            entry.last_ms = duration_ms
+            entry.rows = rows
+            entry.parameters = redacted
+            entry.last_seen = datetime.utcnow()
+
+    def _explain(self, connection: sqlite3.Connection, statement: str, parameters: Any) -> List[str]:
+        """在同一连接上获取 EXPLAIN QUERY PLAN 的 detail 列"""
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        if parameters and isinstance(parameters, list):
+            parameters = parameters[0]  # executemany
+        try:
+            cursor = connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def top(self, limit: int = 10, order_by: str = "max_ms") -> List[SlowQueryStat]:
+        """按 max_ms / total_ms / avg_ms / count 返回前 N 条"""
+        with self.lock:
+            entries = list(self.entries.values())
+        return sorted(entries, key=lambda entry: getattr(entry, order_by), reverse=True)[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """累计 execute 与每次 fetch 本身的耗时（不含调用方处理各行的时间），
+    结果取完或关闭时把总耗时和行数交给慢查询日志"""
+
+    _query: Optional[tuple] = None  # (语句, 参数)，由 before_cursor_execute 设置
+    _started: Optional[float] = None  # execute 的开始时间，after_cursor_execute 时计入 _elapsed
+    _elapsed = 0.0
+    _rows = 0
+
+    def _timed(self, fetch, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed(super().fetchmany, *args, **kwargs)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        query = self._query
+        if query is None:
+            return
+        self._query = None
+        statement, parameters = query
+        rows = self.rowcount if self.rowcount >= 0 else self._rows
+        slow_query_log.observe(self.connection, statement, parameters, self._elapsed * 1000, rows)
+
+
+class TimedConnection(sqlite3.Connection):
+    """通过 connect_args={"factory": TimedConnection} 让 SQLAlchemy 使用 TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+def install_slow_query_log(engine: Engine):
+    """记录语句并累计 execute 阶段的耗时，取数阶段的耗时由 TimedCursor 自己累计"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if isinstance(cursor, TimedCursor):
+            cursor._query = (statement, parameters)
+            cursor._elapsed = 0.0
+            cursor._rows = 0
+            cursor._started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if isinstance(cursor, TimedCursor) and cursor._started is not None:
+            cursor._elapsed += time.perf_counter() - cursor._started
+            cursor._started = None
+
+
+# 全局实例
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,175 @@
+"""
+每日分析快照模块
+定时任务把当天的关键指标（数量、基准货币成本、周期与货币分布、到期情况、当天的变更数）
+写入 analytics_snapshots，数据来自汇总表和索引上的计数查询，不扫描订阅表。
+历史趋势按日期区间读取快照：存量指标取区间内最后一个快照，当天流量按区间求和。
+"""
+import json
+import logging
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+from sqlmodel import Session, select
+from models import (
+    AnalyticsSnapshot, ArchivedSubscription, Subscription, SubscriptionAggregate, SubscriptionEvent,
+    SnapshotPoint, SnapshotHistory, SnapshotResult
+)
+from costs import get_base_currency
+from event_log import utc_day_start
+
+logger = logging.getLogger(__name__)
+
+# 单次历史查询允许的最大区间（天）
+MAX_HISTORY_DAYS = 3660
+
+CREATED_EVENTS = ("created", "restored")
+REMOVED_EVENTS = ("deleted", "archived")
+
+
+def take_snapshot(session: Session, snapshot_date: Optional[date] = None) -> AnalyticsSnapshot:
+    """计算并写入（覆盖）指定日期的快照，同时记录本次计算的耗时与读取行数"""
+    started = time.perf_counter()
+    snapshot_date = snapshot_date or date.today()
+    rows_read = 0
+
+    aggregates = session.exec(
+        select(SubscriptionAggregate).where(SubscriptionAggregate.dimension.in_(("total", "cycle", "currency")))
+    ).all()
+    rows_read += len(aggregates)
+    total = next((row for row in aggregates if row.dimension == "total"), None)
+    cycle_counts = {row.bucket: row.count for row in aggregates if row.dimension == "cycle" and row.count}
+    currency_breakdown = {
+        row.bucket: {"count": row.count, "monthly": row.monthly_total, "monthly_base": row.monthly_base_total}
+        for row in aggregates if row.dimension == "currency" and row.count
+    }
+
+    # 计数查询只走索引
+    archived_count = session.exec(select(func.count()).select_from(ArchivedSubscription)).one()
+    upcoming_30d_count = session.exec(
+        select(func.count()).select_from(Subscription).where(
+            Subscription.next_due_date >= snapshot_date,
+            Subscription.next_due_date <= snapshot_date + timedelta(days=30)
+        )
+    ).one()
+    overdue_count = session.exec(
+        select(func.count()).select_from(Subscription).where(Subscription.next_due_date < snapshot_date)
+    ).one()
+    rows_read += 3
+
+    # occurred_at 为 UTC，按本地日期的起止时间换算后比较
+    event_counts = Counter(dict(session.exec(
+        select(SubscriptionEvent.event_type, func.count())
+        .where(SubscriptionEvent.occurred_at >= utc_day_start(snapshot_date),
+               SubscriptionEvent.occurred_at < utc_day_start(snapshot_date + timedelta(days=1)))
+        .group_by(SubscriptionEvent.event_type)
+    ).all()))
+    rows_read += len(event_counts)
+
+    snapshot = AnalyticsSnapshot(
+        snapshot_date=snapshot_date,
+        captured_at=datetime.utcnow(),
+        base_currency=get_base_currency(),
+        active_count=total.count if total else 0,
+        archived_count=archived_count,
+        monthly_total_base=total.monthly_base_total if total else 0.0,
+        yearly_total_base=total.yearly_base_total if total else 0.0,
+        upcoming_30d_count=upcoming_30d_count,
+        overdue_count=overdue_count,
+        created_count=sum(event_counts[event_type] for event_type in CREATED_EVENTS),
+        removed_count=sum(event_counts[event_type] for event_type in REMOVED_EVENTS),
+        price_change_count=event_counts["price_changed"],
+        cycle_counts=json.dumps(cycle_counts, ensure_ascii=False),
+        currency_breakdown=json.dumps(currency_breakdown, ensure_ascii=False),
+        rows_read=rows_read,
+    )
+    snapshot.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    snapshot = session.merge(snapshot)
+    session.commit()
+    session.refresh(snapshot)
+
+    logger.info(
+        f"Analytics snapshot for {snapshot_date} written in {snapshot.duration_ms:.1f}ms "
+        f"({snapshot.active_count} active, {rows_read} rows read)"
+    )
+    return snapshot
+
+
+def _period(day: date, granularity: str) -> str:
+    if granularity == "day":
+        return day.isoformat()
+    if granularity == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == "month":
+        return day.strftime("%Y-%m")
+    raise ValueError(f"Invalid granularity: {granularity}")
+
+
+def _to_point(period: str, last: AnalyticsSnapshot, flows: Tuple[int, int, int]) -> SnapshotPoint:
+    created_count, removed_count, price_change_count = flows
+    return SnapshotPoint(
+        period=period,
+        snapshot_date=last.snapshot_date,
+        active_count=last.active_count,
+        archived_count=last.archived_count,
+        monthly_total_base=last.monthly_total_base,
+        yearly_total_base=last.yearly_total_base,
+        upcoming_30d_count=last.upcoming_30d_count,
+        overdue_count=last.overdue_count,
+        created_count=created_count,
+        removed_count=removed_count,
+        price_change_count=price_change_count,
+        cycle_counts=json.loads(last.cycle_counts),
+        currency_breakdown=json.loads(last.currency_breakdown),
+    )
+
+
+def snapshot_result(snapshot: AnalyticsSnapshot) -> SnapshotResult:
+    """单个快照的接口表示，cycle_counts / currency_breakdown 解码为对象"""
+    flows = (snapshot.created_count, snapshot.removed_count, snapshot.price_change_count)
+    point = _to_point(_period(snapshot.snapshot_date, "day"), snapshot, flows)
+    return SnapshotResult(
+        **point.model_dump(),
+        base_currency=snapshot.base_currency,
+        captured_at=snapshot.captured_at,
+        duration_ms=snapshot.duration_ms,
+        rows_read=snapshot.rows_read,
+    )
+
+
+def get_snapshot_history(session: Session, from_date: Optional[date] = None, to_date: Optional[date] = None,
+                         granularity: str = "day") -> SnapshotHistory:
+    """按主键区间读取快照并按 day/week/month 汇总；没有快照的区间不返回"""
+    to_date = to_date or date.today()
+    if from_date is None:
+        from_date = to_date - timedelta(days=29) if granularity == "day" else to_date.replace(day=1) - relativedelta(months=11)
+    if from_date > to_date:
+        raise ValueError("from must not be later than to")
+    if (to_date - from_date).days > MAX_HISTORY_DAYS:
+        raise ValueError(f"Range too large: at most {MAX_HISTORY_DAYS} days per request")
+    _period(to_date, granularity)  # 校验粒度
+
+    snapshots = session.exec(
+        select(AnalyticsSnapshot)
+        .where(AnalyticsSnapshot.snapshot_date >= from_date, AnalyticsSnapshot.snapshot_date <= to_date)
+        .order_by(AnalyticsSnapshot.snapshot_date)
+    ).all()
+
+    points: List[SnapshotPoint] = []
+    buckets: Dict[str, Tuple[AnalyticsSnapshot, List[int]]] = {}
+    for snapshot in snapshots:
+        period = _period(snapshot.snapshot_date, granularity)
+        _, flows = buckets.get(period, (None, [0, 0, 0]))
+        flows = [flows[0] + snapshot.created_count, flows[1] + snapshot.removed_count,
+                 flows[2] + snapshot.price_change_count]
+        buckets[period] = (snapshot, flows)  # 按日期升序，最后写入的即区间内最后一个快照
+    for period, (last, flows) in buckets.items():
+        points.append(_to_point(period, last, tuple(flows)))
+
+    return SnapshotHistory(
+        granularity=granularity,
+        base_currency=snapshots[-1].base_currency if snapshots else None,
+        points=points,
+    )
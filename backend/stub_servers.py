@@ -0,0 +1,237 @@
+"""
+本地替身服务器
+模拟 Telegram Bot API（sendMessage / getMe）和两个汇率接口
+（exchangerate-api.com 的 /v4/latest 与 open.er-api.com 的 /v6/latest），
+可配置延迟、错误率和 429/RetryAfter，用于离线压测提醒、通知与汇率转换。
+
+启动:
+    python stub_servers.py --port 8081 --latency-ms 50 --jitter-ms 20 --error-rate 0.01 --rate-limit-rate 0.05
+
+然后让后端指向它:
+    STUB_SERVER_URL=http://localhost:8081 uvicorn main:app
+"""
+import argparse
+import asyncio
+import random
+import time
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# 以 USD 为基准的静态汇率，与 CurrencyService 的备用汇率一致
+BASE_RATES = {
+    "USD": 1.0,
+    "CNY": 7.2,
+    "EUR": 0.85,
+    "GBP": 0.73,
+    "JPY": 110.0,
+    "HKD": 7.8,
+    "SGD": 1.35,
+    "KRW": 1200.0,
+}
+
+
+class StubConfig:
+    """运行参数，可通过命令行或 POST /stub/config 调整"""
+
+    def __init__(self):
+        self.latency_ms = 0.0
+        self.jitter_ms = 0.0
+        self.error_rate = 0.0
+        self.rate_limit_rate = 0.0
+        self.retry_after = 1
+        self.rate_drift = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+config = StubConfig()
+stats = Counter()
+latencies = deque(maxlen=10000)
+messages = deque(maxlen=200)
+
+app = FastAPI(title="Local API stubs", description="Stand-ins for Telegram and exchange-rate APIs")
+
+
+async def _simulate(kind: str):
+    """注入延迟；按概率返回 429 或 500 响应，否则返回 None"""
+    delay = max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+    if delay:
+        await asyncio.sleep(delay)
+    stats[f"{kind}_requests"] += 1
+
+    roll = random.random()
+    if roll < config.rate_limit_rate:
+        stats[f"{kind}_rate_limited"] += 1
+        return 429
+    if roll < config.rate_limit_rate + config.error_rate:
+        stats[f"{kind}_errors"] += 1
+        return 500
+    return None
+
+
+def _rates_for(base: str) -> dict:
+    base_rate = BASE_RATES.get(base.upper(), 1.0)
+    rates = {}
+    for currency, rate in BASE_RATES.items():
+        drift = random.uniform(-config.rate_drift, config.rate_drift)
+        rates[currency] = round(rate / base_rate * (1 + drift), 6)
+    return rates
+
+
+def _telegram_failure(status: int) -> JSONResponse:
+    if status == 429:
+        return JSONResponse(status_code=429, content={
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {config.retry_after}",
+            "parameters": {"retry_after": config.retry_after},
+        })
+    return JSONResponse(status_code=500, content={
+        "ok": False, "error_code": 500, "description": "Internal Server Error"
+    })
+
+
+async def _request_params(request: Request) -> dict:
+    """Bot API 同时接受 JSON、表单和查询参数"""
+    params = dict(request.query_params)
+    content_type = request.headers.get("content-type", "")
+    if "application/json" in content_type:
+        params.update(await request.json())
+    elif content_type:
+        params.update(dict(await request.form()))
+    return params
+
+
+@app.post("/bot{token}/getMe")
+@app.get("/bot{token}/getMe")
+async def telegram_get_me(token: str):
+    return {"ok": True, "result": {
+        "id": 1, "is_bot": True, "first_name": "Stub Bot", "username": "stub_bot"
+    }}
+
+
+@app.post("/bot{token}/sendMessage")
+async def telegram_send_message(token: str, request: Request):
+    started = time.perf_counter()
+    failure = await _simulate("telegram")
+    if failure:
+        return _telegram_failure(failure)
+
+    params = await _request_params(request)
+    chat_id = params.get("chat_id", 0)
+    text = params.get("text", "")
+    stats["telegram_messages"] += 1
+    message_id = stats["telegram_messages"]
+    messages.append({"chat_id": chat_id, "text": text, "received_at": datetime.utcnow().isoformat()})
+    latencies.append(("telegram", time.perf_counter() - started))
+
+    return {"ok": True, "result": {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": _telegram_chat(str(chat_id)),
+        "text": text,
+    }}
+
+
+def _telegram_chat(chat_id: str) -> dict:
+    """按 chat_id 构造返回的 chat；频道可以用 @username 作为 chat_id，此时给出固定的假数字 id"""
+    if chat_id.lstrip("-").isdigit():
+        return {"id": int(chat_id), "type": "group" if chat_id.startswith("-") else "private"}
+    return {"id": -1000000000000 - zlib.crc32(chat_id.encode()), "type": "channel", "username": chat_id.lstrip("@")}
+
+
+@app.get("/v4/latest/{base}")
+async def exchangerate_api_latest(base: str):
+    """exchangerate-api.com 格式"""
+    started = time.perf_counter()
+    failure = await _simulate("fx")
+    if failure:
+        return JSONResponse(status_code=failure, content={"result": "error"})
+    latencies.append(("fx", time.perf_counter() - started))
+    return {
+        "base": base.upper(),
+        "date": datetime.utcnow().strftime("%Y-%m-%d"),
+        "time_last_updated": int(time.time()),
+        "rates": _rates_for(base),
+    }
+
+
+@app.get("/v6/latest/{base}")
+async def open_er_api_latest(base: str):
+    """open.er-api.com 格式"""
+    started = time.perf_counter()
+    failure = await _simulate("fx")
+    if failure:
+        return JSONResponse(status_code=failure, content={"result": "error"})
+    latencies.append(("fx", time.perf_counter() - started))
+    return {
+        "result": "success",
+        "base_code": base.upper(),
+        "time_last_update_unix": int(time.time()),
+        "rates": _rates_for(base),
+    }
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    """请求计数与服务端延迟分位数"""
+    summary = {}
+    for kind in ("telegram", "fx"):
+        values = sorted(value for name, value in latencies if name == kind)
+        if values:
+            summary[kind] = {
+                "p50_ms": values[len(values) // 2] * 1000,
+                "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1000,
+            }
+    return {"counters": dict(stats), "latency": summary, "config": config.as_dict()}
+
+
+@app.get("/stub/messages")
+async def stub_messages():
+    """最近收到的 Telegram 消息"""
+    return list(messages)
+
+
+@app.post("/stub/config")
+async def update_stub_config(updates: dict):
+    """运行时调整延迟、错误率等参数"""
+    for key, value in updates.items():
+        if hasattr(config, key):
+            setattr(config, key, type(getattr(config, key))(value))
+    return config.as_dict()
+
+
+@app.post("/stub/reset")
+async def reset_stub_stats():
+    stats.clear()
+    latencies.clear()
+    messages.clear()
+    return {"status": "reset"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-ins for the Telegram and exchange-rate APIs")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in 429 responses")
+    parser.add_argument("--rate-drift", type=float, default=0.0, help="random relative drift applied to rates")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.retry_after = args.retry_after
+    config.rate_drift = args.rate_drift
+
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,237 @@
+"""
+订阅表的进程内只读副本
+启动时把 subscriptions 整表载入内存，维护按 id、next_due_date、name 排序的索引；
+写接口提交后立即更新副本中受影响的行（write-through），列表和按 id 读取不再经过 SQLAlchemy 和 SQLite。
+写接口在写入执行器的线程中运行，可能与其他写接口和定时任务交错提交，因此更新副本时在锁内
+按 id 重新读取已提交的行，而不是写入调用方手中的对象：无论提交和更新副本的先后如何交错，
+最后一次更新读到的都是最新提交的数据。
+命令行、备份恢复等进程外的写入由定时一致性检查发现：与数据库逐行比对，不一致时整体替换。
+设置项 subscription_replica 为 false 时关闭副本，读取回到数据库。
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from sqlmodel import Session, select
+from models import Subscription, ReplicaStatus
+from settings_registry import settings_registry, parse_bool
+
+logger = logging.getLogger(__name__)
+
+REPLICA_SETTING = "subscription_replica"
+REPLICA_CHECK_SECONDS = int(os.getenv("REPLICA_CHECK_SECONDS", "300"))
+LOAD_ATTEMPTS = 3
+
+# SQLite 的 lower() 只转换 ASCII 字母，内存中的名称索引使用同样的规则
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+settings_registry.define(
+    REPLICA_SETTING, parse_bool, parse_bool(os.getenv("SUBSCRIPTION_REPLICA", "true")),
+    "是否从内存副本读取订阅"
+)
+
+
+def sql_order(order_by: str, descending: bool = False) -> list:
+    """副本关闭时与内存索引顺序一致的 ORDER BY"""
+    columns = {
+        "next_due_date": [Subscription.next_due_date, Subscription.id],
+        "name": [func.lower(Subscription.name), Subscription.id],
+        "id": [Subscription.id],
+    }.get(order_by)
+    if columns is None:
+        raise ValueError(f"Invalid order: {order_by}")
+    return [column.desc() if descending else column for column in columns]
+
+
+def _copy(subscription: Subscription) -> Subscription:
+    """与会话无关的副本，之后对 ORM 对象的修改不会影响内存中的数据"""
+    return Subscription.model_validate(subscription.model_dump())
+
+
+def _due_key(subscription: Subscription) -> Tuple[date, int]:
+    return subscription.next_due_date, subscription.id
+
+
+def _name_key(subscription: Subscription) -> Tuple[str, int]:
+    return subscription.name.translate(ASCII_LOWER), subscription.id
+
+
+def _remove_key(index: list, key):
+    position = bisect_left(index, key)
+    if position < len(index) and index[position] == key:
+        del index[position]
+
+
+class SubscriptionReplica:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows: Dict[int, Subscription] = {}
+        # 排序索引；元组末尾带 id 保证唯一且顺序确定
+        self.ids: List[int] = []
+        self.by_due: List[Tuple[date, int]] = []
+        self.by_name: List[Tuple[str, int]] = []
+        self.loaded_at: Optional[datetime] = None
+        self.writes = 0
+        self.last_check_at: Optional[datetime] = None
+        self.last_check_ms = 0.0
+        self.last_mismatches = 0
+        self.repairs = 0
+        settings_registry.subscribe(self.on_settings_changed)
+
+    @property
+    def enabled(self) -> bool:
+        return self.loaded_at is not None and settings_registry.get(REPLICA_SETTING)
+
+    def on_settings_changed(self, keys):
+        """Settings subscriber：开启时载入，关闭时释放内存"""
+        if REPLICA_SETTING not in keys:
+            return
+        if settings_registry.get(REPLICA_SETTING):
+            self.load()
+        else:
+            self.clear()
+
+    def _build(self, subscriptions: Iterable[Subscription]):
+        rows = {subscription.id: subscription for subscription in subscriptions}
+        self.rows = rows
+        self.ids = sorted(rows)
+        self.by_due = sorted(_due_key(subscription) for subscription in rows.values())
+        self.by_name = sorted(_name_key(subscription) for subscription in rows.values())
+
+    def _fetch_all(self) -> List[Subscription]:
+        # database 导入的模块会读取设置注册表，这里延迟导入避免循环依赖
+        from database import engine
+        with Session(engine) as session:
+            return [_copy(subscription) for subscription in session.exec(select(Subscription)).all()]
+
+    def load(self):
+        """整表载入；设置为关闭时不载入"""
+        if not settings_registry.get(REPLICA_SETTING):
+            logger.info("Subscription replica is disabled")
+            return
+        started = time.perf_counter()
+        # 读取期间有写入更新过副本时，读到的数据可能比副本旧，重新读取；多次仍冲突时交给一致性检查
+        for _ in range(LOAD_ATTEMPTS):
+            writes = self.writes
+            subscriptions = self._fetch_all()
+            if self.writes == writes:
+                break
+        with self.lock:
+            self._build(subscriptions)
+            self.loaded_at = datetime.utcnow()
+        logger.info(
+            f"Loaded {len(subscriptions)} subscriptions into the replica in "
+            f"{(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def clear(self):
+        with self.lock:
+            self._build([])
+            self.loaded_at = None
+        logger.info("Subscription replica disabled and cleared")
+
+    def _remove_locked(self, subscription_id: int):
+        current = self.rows.pop(subscription_id, None)
+        if current is None:
+            return
+        _remove_key(self.ids, subscription_id)
+        _remove_key(self.by_due, _due_key(current))
+        _remove_key(self.by_name, _name_key(current))
+
+    def upsert(self, subscription: Subscription):
+        """写接口提交后调用"""
+        self.refresh([subscription.id])
+
+    def remove(self, subscription_id: int):
+        """删除或归档提交后调用"""
+        self.refresh([subscription_id])
+
+    def refresh(self, subscription_ids: Iterable[int]):
+        """提交后在锁内按 id 重新读取受影响的行，已不存在的行从副本中移除"""
+        subscription_ids = list(subscription_ids)
+        if self.loaded_at is None or not subscription_ids:
+            return
+        from database import engine
+        with self.lock:
+            with Session(engine) as session:
+                stmt = select(Subscription).where(Subscription.id.in_(subscription_ids))
+                found = {subscription.id: _copy(subscription) for subscription in session.exec(stmt).all()}
+            for subscription_id in subscription_ids:
+                self._remove_locked(subscription_id)
+                row = found.get(subscription_id)
+                if row is not None:
+                    self.rows[row.id] = row
+                    insort(self.ids, row.id)
+                    insort(self.by_due, _due_key(row))
+                    insort(self.by_name, _name_key(row))
+            self.writes += 1
+
+    def get(self, subscription_id: int) -> Optional[Subscription]:
+        return self.rows.get(subscription_id)
+
+    def list(self, order_by: str = "next_due_date", descending: bool = False) -> List[Subscription]:
+        """按索引顺序返回所有订阅"""
+        with self.lock:
+            rows = self.rows
+            if order_by == "next_due_date":
+                ordered = [rows[subscription_id] for _, subscription_id in self.by_due]
+            elif order_by == "name":
+                ordered = [rows[subscription_id] for _, subscription_id in self.by_name]
+            elif order_by == "id":
+                ordered = [rows[subscription_id] for subscription_id in self.ids]
+            else:
+                raise ValueError(f"Invalid order: {order_by}")
+        return ordered[::-1] if descending else ordered
+
+    def due_on_or_before(self, day: date) -> List[Subscription]:
+        """next_due_date <= day 的订阅（按到期日升序），二分查找截取索引前缀"""
+        with self.lock:
+            end = bisect_right(self.by_due, (day, float("inf")))
+            return [self.rows[subscription_id] for _, subscription_id in self.by_due[:end]]
+
+    def check(self) -> int:
+        """与数据库逐行比对，不一致时用数据库的数据替换副本；返回比对的数据库行数"""
+        if self.loaded_at is None:
+            return 0
+        started = time.perf_counter()
+        writes = self.writes
+        subscriptions = self._fetch_all()
+        database_rows = {subscription.id: subscription.model_dump() for subscription in subscriptions}
+
+        with self.lock:
+            memory_rows = {subscription_id: row.model_dump() for subscription_id, row in self.rows.items()}
+            mismatches = sum(
+                1 for subscription_id in database_rows.keys() | memory_rows.keys()
+                if database_rows.get(subscription_id) != memory_rows.get(subscription_id)
+            )
+            # 读取数据库期间发生过 write-through 时，读到的数据可能比副本旧，留到下一次检查
+            if mismatches and self.writes == writes:
+                self._build(subscriptions)
+                self.repairs += 1
+            self.last_check_at = datetime.utcnow()
+            self.last_check_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.last_mismatches = mismatches
+
+        if mismatches:
+            logger.warning(f"Subscription replica differed from the database in {mismatches} rows")
+        return len(subscriptions)
+
+    def status(self) -> ReplicaStatus:
+        return ReplicaStatus(
+            enabled=self.enabled,
+            rows=len(self.rows),
+            loaded_at=self.loaded_at,
+            writes=self.writes,
+            last_check_at=self.last_check_at,
+            last_check_ms=self.last_check_ms,
+            last_mismatches=self.last_mismatches,
+            repairs=self.repairs,
+        )
+
+
+# 全局实例
+subscription_replica = SubscriptionReplica()
@@ -0,0 +1,176 @@
+"""
+Telegram 消息投递管道
+- 令牌桶限流：全局与单个会话分别限速，遵守 Telegram 的频率限制
+- RetryAfter（429）按服务器要求等待并加随机抖动后重试，网络错误指数退避
+- 超过 4096 字符的消息按条目边界拆分，并按顺序逐条发送
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List
+from telegram import Bot
+from telegram.error import RetryAfter, NetworkError, TimedOut, BadRequest, TelegramError
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Telegram 单条消息上限（按 UTF-16 码元计）
+MAX_MESSAGE_LENGTH = 4096
+
+# 官方建议：全局约 30 条/秒，单个私聊约 1 条/秒，群组约 20 条/分钟
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+BURST = 3
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+
+def message_length(text: str) -> int:
+    """Telegram 按 UTF-16 码元计算长度，emoji 等占两个单位"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_split(block: str, limit: int) -> List[str]:
+    """单个条目本身超长时，先按行、再按字符切分"""
+    pieces = []
+    current = ""
+    for line in block.split("\n"):
+        while message_length(line) > limit:
+            cut = limit
+            while message_length(line[:cut]) > limit:
+                cut -= 1
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:cut])
+            line = line[cut:]
+        candidate = f"{current}\n{line}" if current else line
+        if message_length(candidate) > limit:
+            pieces.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_blocks(blocks: List[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """把条目依次装入不超过 limit 的消息，只在条目之间断开"""
+    messages = []
+    current = ""
+    for block in blocks:
+        pieces = [block] if message_length(block) <= limit else _hard_split(block, limit)
+        for piece in pieces:
+            candidate = f"{current}\n{piece}" if current else piece
+            if current and message_length(candidate) > limit:
+                messages.append(current)
+                current = piece
+            else:
+                current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+
+def split_message(blocks: List[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """拆分消息；多于一条时在每条开头标注序号，序号占用的长度预先扣除"""
+    messages = pack_blocks(blocks, limit)
+    if len(messages) <= 1:
+        return messages
+
+    reserve = len(f"({len(messages)}/{len(messages)})\n") + 2
+    messages = pack_blocks(blocks, limit - reserve)
+    total = len(messages)
+    return [f"({index}/{total})\n{text}" for index, text in enumerate(messages, start=1)]
+
+
+class TokenBucket:
+    """异步令牌桶，等待者按先来先得顺序获取令牌"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class DeliveryPipeline:
+    """带限流、重试与拆分的 Telegram 投递管道"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE, max_attempts: int = MAX_ATTEMPTS):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_attempts = max_attempts
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.chat_locks: Dict[str, asyncio.Lock] = {}
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            # 群组/频道的 chat_id 为负数，限额更低
+            rate = self.group_rate if str(chat_id).startswith("-") else self.chat_rate
+            self.chat_buckets[chat_id] = TokenBucket(rate, BURST)
+        return self.chat_buckets[chat_id]
+
+    async def _send_part(self, bot: Bot, chat_id: str, text: str):
+        """发送单条消息；RetryAfter 与网络错误会重试，其他错误直接抛出"""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                attributes = {"telegram.chat_id": str(chat_id), "telegram.attempt": attempt,
+                              "telegram.message_length": message_length(text)}
+                with tracer.span("telegram.send_message", "client", attributes):
+                    await bot.send_message(chat_id=chat_id, text=text)
+                return
+            except RetryAfter as e:
+                if attempt == self.max_attempts:
+                    raise
+                retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+                delay = float(retry_after) + random.uniform(0, 1)
+                logger.warning(f"Telegram rate limited, retrying in {delay:.1f}s (attempt {attempt})")
+            except BadRequest:
+                # BadRequest 继承自 NetworkError，但重试无意义
+                raise
+            except (TimedOut, NetworkError) as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                logger.warning(f"Telegram network error: {e}, retrying in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def deliver(self, bot: Bot, chat_id: str, blocks: List[str]) -> bool:
+        """拆分并按顺序发送；同一会话的多段消息不会与其他消息交错"""
+        parts = split_message(blocks)
+        lock = self.chat_locks.setdefault(chat_id, asyncio.Lock())
+        with tracer.span("telegram.deliver", attributes={"telegram.parts": len(parts)}) as span:
+            async with lock:
+                for index, part in enumerate(parts, start=1):
+                    try:
+                        await self._send_part(bot, chat_id, part)
+                    except TelegramError as e:
+                        logger.error(f"Failed to send Telegram message part {index}/{len(parts)}: {e}")
+                        if span is not None:
+                            span.record_error(e)
+                        return False
+        return True
@@ -1,65 +1,117 @@
 import asyncio
 import logging
-from typing import Optional, List
+import os
+from typing import Optional, List, Dict, Set
 from datetime import datetime
 from telegram import Bot
-from telegram.error import TelegramError
-from sqlmodel import Session, select
-from database import engine
-from models import Setting, Subscription
+from telegram.request import HTTPXRequest
+from models import Subscription
 from currency_service import currency_service
+from telegram_delivery import DeliveryPipeline
+from settings_registry import settings_registry
 
 logger = logging.getLogger(__name__)
 
+# 设置 STUB_SERVER_URL 后改用本地替身服务器（见 stub_servers.py）
+STUB_SERVER_URL = os.getenv("STUB_SERVER_URL", "").rstrip("/")
+TELEGRAM_API_BASE_URL = os.getenv(
+    "TELEGRAM_API_BASE_URL",
+    f"{STUB_SERVER_URL}/bot" if STUB_SERVER_URL else "https://api.telegram.org/bot"
+)
+# 多个接收会话并发发送提醒时的上限
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "10"))
+
+TELEGRAM_TOKEN_SETTING = "telegram_token"
+TELEGRAM_CHAT_ID_SETTING = "telegram_chat_id"
+
+settings_registry.define(TELEGRAM_TOKEN_SETTING, description="Telegram Bot Token")
+settings_registry.define(TELEGRAM_CHAT_ID_SETTING, description="默认接收提醒的会话")
+
 
 class TelegramService:
     def __init__(self):
         self.bot: Optional[Bot] = None
+        self.token: Optional[str] = None
         self.chat_id: Optional[str] = None
+        self.pipeline = DeliveryPipeline()
+        settings_registry.subscribe(self.on_settings_changed)
 
     async def initialize(self):
-        """Initialize Telegram bot with settings from database"""
-        with Session(engine) as session:
-            # Get Telegram bot token
-            token_stmt = select(Setting).where(Setting.key == "telegram_token")
-            token_setting = session.exec(token_stmt).first()
-
-            # Get chat ID
-            chat_id_stmt = select(Setting).where(Setting.key == "telegram_chat_id")
-            chat_id_setting = session.exec(chat_id_stmt).first()
-
-            if token_setting and chat_id_setting:
-                self.bot = Bot(token=token_setting.value)
-                self.chat_id = chat_id_setting.value
-                logger.info("Telegram service initialized successfully")
-            else:
-                logger.warning("Telegram settings not found in database")
+        """Initialize Telegram bot with the cached settings"""
+        self.configure()
+
+    def configure(self):
+        """(Re)build the bot when the token changes; the chat ID is read as is"""
+        token = settings_registry.get(TELEGRAM_TOKEN_SETTING)
+        self.chat_id = settings_registry.get(TELEGRAM_CHAT_ID_SETTING)
+
+        # Without a default chat ID the bot can still serve routed reminders
+        if not token:
+            self.bot = None
+            self.token = None
+        elif token != self.token:
+            # PTB's default request pool holds a single connection, which would serialize concurrent sends
+            self.bot = Bot(
+                token=token,
+                base_url=TELEGRAM_API_BASE_URL,
+                request=HTTPXRequest(connection_pool_size=REMINDER_CONCURRENCY)
+            )
+            self.token = token
+            logger.info("Telegram service initialized successfully")
+        if not token or not self.chat_id:
+            logger.warning("Telegram settings not found in database")
+
+    def on_settings_changed(self, keys: Set[str]):
+        """Settings subscriber: reconfigure as soon as the token or chat ID is saved"""
+        if keys & {TELEGRAM_TOKEN_SETTING, TELEGRAM_CHAT_ID_SETTING}:
+            self.configure()
 
     async def send_message(self, message: str) -> bool:
-        """Send message via Telegram bot"""
-        if not self.bot or not self.chat_id:
+        """Send message via Telegram bot (split on line boundaries if too long)"""
+        return await self.send_blocks(message.split("\n"))
+
+    async def send_blocks(self, blocks: List[str], chat_id: Optional[str] = None) -> bool:
+        """Send newline-joined blocks, splitting oversized messages only between blocks"""
+        chat_id = chat_id or self.chat_id
+        if not self.bot or not chat_id:
             logger.error("Telegram bot not properly initialized")
             return False
 
-        try:
-            await self.bot.send_message(chat_id=self.chat_id, text=message)
-            logger.info(f"Message sent successfully: {message[:50]}...")
-            return True
-        except TelegramError as e:
-            logger.error(f"Failed to send Telegram message: {e}")
-            return False
+        success = await self.pipeline.deliver(self.bot, chat_id, blocks)
+        if success:
+            logger.info(f"Message sent successfully: {blocks[0][:50]}...")
+        return success
 
     async def send_test_message(self) -> bool:
         """Send a test message to verify Telegram configuration"""
-        await self.initialize()  # Re-initialize to get latest settings
         test_message = "🔔 测试通知\n\n这是来自订阅管理系统的测试消息。如果您收到此消息，说明 Telegram 通知配置正确！"
         return await self.send_message(test_message)
 
-    async def send_batch_reminders(self, subscriptions: List[Subscription]) -> bool:
+    async def send_batch_reminders(self, subscriptions: List[Subscription], chat_id: Optional[str] = None) -> bool:
         """Send batch reminder message for multiple subscriptions"""
         if not subscriptions:
             return True
 
+        # Each subscription entry is one block so oversized digests split between entries
+        return await self.send_blocks(await self.build_reminder_blocks(subscriptions), chat_id)
+
+    async def send_routed_reminders(self, batches: Dict[str, List[Subscription]]) -> Dict[str, bool]:
+        """Send one reminder batch per recipient concurrently; a failing recipient does not affect the others"""
+        semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY)
+
+        async def send(chat_id: str, subscriptions: List[Subscription]) -> bool:
+            async with semaphore:
+                try:
+                    return await self.send_batch_reminders(subscriptions, chat_id)
+                except Exception as e:
+                    logger.error(f"Failed to send reminders to chat {chat_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(send(chat_id, subs) for chat_id, subs in batches.items()))
+        return dict(zip(batches, results))
+
+    async def build_reminder_blocks(self, subscriptions: List[Subscription]) -> List[str]:
+        """Build the reminder digest, one block per line or subscription entry"""
         # Group subscriptions by urgency
         today = datetime.now().date()
         overdue = []
@@ -84,23 +136,29 @@ class TelegramService:
             message_parts.append("🚨 已过期:")
             for sub in overdue:
                 days_overdue = abs((sub.next_due_date - today).days)
-                message_parts.append(f"  • {sub.name} - 已过期 {days_overdue} 天")
-                message_parts.append(f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}")
+                message_parts.append(
+                    f"  • {sub.name} - 已过期 {days_overdue} 天\n"
+                    f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}"
+                )
             message_parts.append("")
 
         if due_today:
             message_parts.append("⏰ 今日到期:")
             for sub in due_today:
-                message_parts.append(f"  • {sub.name}")
-                message_parts.append(f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}")
+                message_parts.append(
+                    f"  • {sub.name}\n"
+                    f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}"
+                )
             message_parts.append("")
 
         if due_soon:
             message_parts.append("📋 即将到期:")
             for sub in due_soon:
                 days_until_due = (sub.next_due_date - today).days
-                message_parts.append(f"  • {sub.name} - {days_until_due} 天后到期")
-                message_parts.append(f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}")
+                message_parts.append(
+                    f"  • {sub.name} - {days_until_due} 天后到期\n"
+                    f"    💰 {sub.price} {sub.currency} | 周期: {self._get_cycle_text(sub.cycle)}"
+                )
             message_parts.append("")
 
         # Add summary with currency conversion
@@ -131,8 +189,31 @@ class TelegramService:
                 logger.warning(f"Currency conversion failed: {e}")
                 message_parts.append(f"💳 涉及金额: {', '.join(amount_texts)}")
 
-        message = "\n".join(message_parts)
-        return await self.send_message(message)
+        return message_parts
+
+    async def send_auto_renew_summary(self, renewed: List[dict]) -> bool:
+        """Send one summary message for an auto-renew sweep"""
+        if not renewed:
+            return True
+
+        message_parts = ["🔄 自动续费汇总"]
+        message_parts.append(f"📅 执行时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        message_parts.append("")
+
+        currency_totals = {}
+        for sub in renewed:
+            message_parts.append(
+                f"  • {sub['name']} → 下次续费 {sub['next_due_date']}\n"
+                f"    💰 {sub['price']} {sub['currency']} | 周期: {self._get_cycle_text(sub['cycle'])}"
+            )
+            currency_totals[sub['currency']] = currency_totals.get(sub['currency'], 0) + sub['price']
+
+        message_parts.append("")
+        message_parts.append(f"📊 总计: 自动续费 {len(renewed)} 个订阅")
+        amount_texts = [f"{amount:.2f} {currency}" for currency, amount in currency_totals.items()]
+        message_parts.append(f"💳 单期金额: {', '.join(amount_texts)}")
+
+        return await self.send_blocks(message_parts)
 
     async def send_operation_notification(self, operation: str, subscription: Subscription, old_data: dict = None) -> bool:
         """Send real-time operation notification"""
@@ -140,14 +221,18 @@ class TelegramService:
             "created": "➕",
             "updated": "✏️",
             "deleted": "🗑️",
-            "renewed": "🔄"
+            "renewed": "🔄",
+            "archived": "📦",
+            "restored": "♻️"
         }
 
         operation_map = {
             "created": "新建订阅",
             "updated": "更新订阅",
             "deleted": "删除订阅",
-            "renewed": "续费订阅"
+            "renewed": "续费订阅",
+            "archived": "归档订阅",
+            "restored": "恢复订阅"
         }
 
         emoji = emoji_map.get(operation, "🔔")
@@ -166,7 +251,7 @@ class TelegramService:
             except Exception as e:
                 logger.warning(f"Currency conversion failed for notification: {e}")
 
-        if operation == "deleted":
+        if operation in ("deleted", "archived"):
             message_parts.append(f"📝 订阅名称: {subscription.name}")
             message_parts.append(f"💰 价格: {price_text}")
         else:
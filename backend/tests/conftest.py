@@ -0,0 +1,115 @@
+"""
+测试公共夹具
+database 在导入时按 DATABASE_URL 创建引擎，因此先把它指向临时目录中的数据库再导入。
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='subscription-tests-'), 'test.db')}"
+
+from sqlalchemy import text  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+from database import engine, create_db_and_tables  # noqa: E402
+from models import Subscription  # noqa: E402
+from cycles import monthly_cost  # noqa: E402
+
+# 测试中固定的汇率（折算到默认基准货币 CNY）
+RATES = {"CNY": 1.0, "USD": 7.0, "EUR": 8.0}
+
+RESET_TABLES = ("subscriptions", "archived_subscriptions", "subscription_events", "subscription_aggregates")
+
+
+def set_costs(subscription: Subscription) -> Subscription:
+    """按 RATES 填充成本列，代替依赖汇率缓存的 apply_normalized_costs"""
+    subscription.monthly_cost = monthly_cost(subscription.price, subscription.cycle)
+    subscription.yearly_cost = subscription.monthly_cost * 12
+    subscription.monthly_cost_base = subscription.monthly_cost * RATES[subscription.currency]
+    subscription.yearly_cost_base = subscription.yearly_cost * RATES[subscription.currency]
+    return subscription
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    create_db_and_tables()
+    return engine
+
+
+@pytest.fixture
+def session(database):
+    """每个测试从空的订阅、归档、事件和汇总表开始"""
+    with Session(database) as session:
+        for table in RESET_TABLES:
+            session.execute(text(f"DELETE FROM {table}"))
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def add_subscription(session):
+    def add(name: str, price: float, currency: str = "CNY", cycle: str = "monthly",
+            next_due_date: date = date(2026, 11, 1), **fields) -> Subscription:
+        subscription = set_costs(Subscription(
+            name=name, price=price, currency=currency, cycle=cycle, next_due_date=next_due_date, **fields
+        ))
+        session.add(subscription)
+        session.commit()
+        session.refresh(subscription)
+        return subscription
+    return add
+
+
+@pytest.fixture
+def update_subscription(session):
+    def update(subscription: Subscription, **changes) -> Subscription:
+        for field, value in changes.items():
+            setattr(subscription, field, value)
+        set_costs(subscription)
+        session.add(subscription)
+        session.commit()
+        session.refresh(subscription)
+        return subscription
+    return update
+
+
+@pytest.fixture
+def exchange_rates(monkeypatch):
+    """汇率接口返回与 RATES 一致的以 USD 为基准的汇率"""
+    from currency_service import currency_service
+
+    async def fetch_rates(base_currency: str = "USD"):
+        return {currency: RATES[base_currency] / RATES[currency] for currency in RATES}
+
+    monkeypatch.setattr(currency_service, "_fetch_rates", fetch_rates)
+    monkeypatch.setattr(currency_service, "cache", {})
+    return RATES
+
+
+@pytest.fixture
+def set_base_currency(session):
+    """切换基准货币，测试结束后恢复为默认值"""
+    from costs import BASE_CURRENCY_SETTING, DEFAULT_BASE_CURRENCY
+    from settings_registry import settings_registry
+
+    def set_currency(currency: str):
+        settings_registry.update(session, {BASE_CURRENCY_SETTING: currency})
+
+    yield set_currency
+    settings_registry.update(session, {BASE_CURRENCY_SETTING: DEFAULT_BASE_CURRENCY})
+
+
+@pytest.fixture
+def client(session, exchange_rates, monkeypatch):
+    """启动应用（不启动定时任务），副本在表清空之后重新载入"""
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main.scheduler_service, "start", lambda: None)
+    monkeypatch.setattr(main.scheduler_service, "stop", lambda: None)
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,41 @@
+"""准入控制：执行器运行和排队都已满时立即拒绝，写接口经写入执行器返回 503 和 Retry-After"""
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionPool, AdmissionRejected, write_pool
+
+
+def test_pool_rejects_beyond_workers_and_queue():
+    async def scenario():
+        pool = AdmissionPool("test", workers=1, max_queue=1)
+        release = threading.Event()
+        blocked = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert (pool.active, pool.queued) == (1, 1)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await pool.run(lambda: None)
+        assert rejected.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*blocked)
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats.admitted, stats.rejected, stats.completed, stats.failed) == (2, 1, 2, 0)
+
+
+def test_saturated_write_pool_returns_503(client, monkeypatch):
+    payload = {"name": "Video", "price": 10, "currency": "CNY", "cycle": "monthly", "next_due_date": "2026-11-01"}
+    admitted = write_pool.admitted
+    assert client.post("/api/subscriptions", json=payload).status_code == 200
+    assert write_pool.admitted == admitted + 1
+
+    monkeypatch.setattr(write_pool, "pending", write_pool.workers + write_pool.max_queue)
+    response = client.post("/api/subscriptions", json=payload)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    # 读取走独立的执行器，不受写入饱和影响
+    assert len(client.get("/api/subscriptions").json()) == 1
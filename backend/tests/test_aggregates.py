@@ -0,0 +1,72 @@
+"""触发器增量维护的汇总表应与全量重建的结果一致"""
+from datetime import date
+
+import pytest
+from sqlmodel import select
+
+from aggregates import check_aggregates, rebuild_aggregates
+from models import SubscriptionAggregate
+
+TOTAL_COLUMNS = ("count", "price_total", "monthly_total", "yearly_total", "monthly_base_total", "yearly_base_total")
+
+
+def _aggregate_rows(session):
+    session.expire_all()
+    return {
+        (row.dimension, row.bucket): tuple(getattr(row, column) for column in TOTAL_COLUMNS)
+        for row in session.exec(select(SubscriptionAggregate)).all()
+    }
+
+
+def assert_matches_rebuild(session):
+    incremental = _aggregate_rows(session)
+    assert check_aggregates(session) == []
+    rebuild_aggregates(session)
+    rebuilt = _aggregate_rows(session)
+    assert incremental.keys() == rebuilt.keys()
+    for key, totals in rebuilt.items():
+        assert incremental[key] == pytest.approx(totals), key
+
+
+def test_insert(session, add_subscription):
+    add_subscription("Netflix", 15.99, "USD", "monthly")
+    add_subscription("iCloud", 21, "CNY", "monthly")
+    add_subscription("Domain", 120, "EUR", "yearly")
+    add_subscription("Gym", 499, "CNY", "quarterly", date(2026, 12, 31))
+
+    assert_matches_rebuild(session)
+    assert _aggregate_rows(session)[("total", "all")][0] == 4
+
+
+def test_update_moves_rows_between_buckets(session, add_subscription, update_subscription):
+    music = add_subscription("Music", 49, "CNY", "monthly")
+    video = add_subscription("Video", 300, "USD", "yearly")
+    add_subscription("Cloud", 80, "EUR", "quarterly")
+
+    update_subscription(music, price=120)  # 0-50 -> 100-300
+    assert_matches_rebuild(session)
+    update_subscription(video, cycle="monthly")
+    assert_matches_rebuild(session)
+    update_subscription(video, currency="EUR", price=25)
+    assert_matches_rebuild(session)
+    update_subscription(music, name="Music Family", next_due_date=date(2027, 1, 15))  # 不影响汇总的列
+    assert_matches_rebuild(session)
+
+    buckets = _aggregate_rows(session)
+    assert ("currency", "USD") not in buckets
+    assert buckets[("currency", "EUR")][0] == 2
+
+
+def test_delete_removes_empty_buckets(session, add_subscription):
+    first = add_subscription("One", 10, "USD", "monthly")
+    second = add_subscription("Two", 600, "CNY", "yearly")
+
+    session.delete(first)
+    session.commit()
+    assert_matches_rebuild(session)
+    assert ("currency", "USD") not in _aggregate_rows(session)
+
+    session.delete(second)
+    session.commit()
+    assert_matches_rebuild(session)
+    assert _aggregate_rows(session) == {}
@@ -0,0 +1,75 @@
+"""归档与恢复：订阅在两张表之间移动，汇总表、全文索引和事件日志随之更新，恢复时按当前汇率重新折算"""
+import asyncio
+
+import pytest
+from sqlmodel import select
+
+from archive import archive_subscription, list_archived_subscriptions, restore_subscription
+from currency_service import currency_service
+from models import ArchivedSubscription, Subscription, SubscriptionAggregate, SubscriptionEvent
+from search import search_subscriptions
+
+
+def active_count(session):
+    total = session.exec(select(SubscriptionAggregate).where(
+        SubscriptionAggregate.dimension == "total", SubscriptionAggregate.bucket == "all"
+    )).first()
+    return total.count if total else 0
+
+
+def event_types(session, subscription_id):
+    stmt = select(SubscriptionEvent).where(SubscriptionEvent.subscription_id == subscription_id)
+    return [event.event_type for event in session.exec(stmt.order_by(SubscriptionEvent.id)).all()]
+
+
+def test_archive_and_restore_round_trip(session, add_subscription):
+    kept = add_subscription("Music", 15)
+    video = add_subscription("Netflix", 68, notes="family plan")
+    assert active_count(session) == 2
+
+    archived = archive_subscription(session, video.id, "too expensive")
+    assert archived.id == video.id and archived.archive_reason == "too expensive"
+    assert session.get(Subscription, video.id) is None
+    assert active_count(session) == 1
+    assert search_subscriptions(session, "Netflix") == []
+    assert [row.name for row in list_archived_subscriptions(session)] == ["Netflix"]
+
+    restored = restore_subscription(session, archived.archive_id)
+    assert restored.id == video.id
+    assert (restored.name, restored.price, restored.notes) == ("Netflix", 68, "family plan")
+    assert session.get(ArchivedSubscription, archived.archive_id) is None
+    assert active_count(session) == 2
+    assert [hit.subscription.id for hit in search_subscriptions(session, "Netflix")] == [video.id]
+    assert event_types(session, video.id) == ["archived", "restored"]
+
+    assert archive_subscription(session, 10_000) is None
+    assert restore_subscription(session, archived.archive_id) is None
+    assert session.get(Subscription, kept.id) is not None
+
+
+def test_restore_assigns_new_id_when_taken(session, add_subscription):
+    video = add_subscription("Netflix", 68)
+    archived = archive_subscription(session, video.id)
+    # 归档的是最大 id，新订阅会复用它
+    newcomer = add_subscription("Music", 15)
+    assert newcomer.id == video.id
+
+    restored = restore_subscription(session, archived.archive_id)
+    assert restored.id != newcomer.id
+    assert session.get(Subscription, newcomer.id).name == "Music"
+    assert active_count(session) == 2
+
+
+def test_restore_renormalizes_costs(client, session, exchange_rates, add_subscription, set_base_currency):
+    video = add_subscription("Netflix", 10, "EUR")
+    assert video.monthly_cost_base == pytest.approx(10 * exchange_rates["EUR"])
+    archive_id = client.post(f"/api/subscriptions/{video.id}/archive", json={"reason": "paused"}).json()["archive_id"]
+
+    set_base_currency("USD")
+    asyncio.run(currency_service.get_exchange_rates("USD"))
+    response = client.post(f"/api/archived-subscriptions/{archive_id}/restore")
+    assert response.status_code == 200
+    assert response.json()["monthly_cost_base"] == pytest.approx(10 * exchange_rates["EUR"] / exchange_rates["USD"])
+
+    assert client.post(f"/api/archived-subscriptions/{archive_id}/restore").status_code == 404
+    assert client.post("/api/subscriptions/10000/archive").status_code == 404
@@ -0,0 +1,75 @@
+"""自动续费的集合 UPDATE 应与 cycles 中的到期日规则一致，尤其是月末日期"""
+from datetime import date, timedelta
+
+import pytest
+
+from auto_renew import auto_renew_overdue
+from cycles import next_due_date, nth_due_date
+from models import Subscription
+
+TODAY = date(2026, 10, 19)
+
+
+def expected_due_date(first: date, cycle: str) -> date:
+    """逐期调用 cycles 的规则，取第一个晚于 TODAY 的到期日"""
+    due_date, k = next_due_date(first, cycle), 1
+    while due_date <= TODAY:
+        k += 1
+        due_date = nth_due_date(first, cycle, k)
+    return due_date
+
+
+@pytest.mark.parametrize("first, cycle, renewed", [
+    (date(2026, 1, 31), "monthly", date(2026, 10, 31)),
+    (date(2026, 8, 31), "monthly", date(2026, 10, 31)),
+    (date(2026, 9, 30), "monthly", date(2026, 10, 30)),
+    (date(2025, 11, 30), "quarterly", date(2026, 11, 30)),
+    (date(2025, 8, 31), "quarterly", date(2026, 11, 30)),
+    (date(2024, 2, 29), "yearly", date(2027, 2, 28)),
+    (date(2025, 10, 18), "yearly", date(2027, 10, 18)),
+])
+def test_month_end_dates_follow_cycle_rules(session, add_subscription, first, cycle, renewed):
+    subscription = add_subscription("Overdue", 10, cycle=cycle, next_due_date=first, auto_renew=True)
+
+    rows = auto_renew_overdue(session, TODAY)
+
+    assert [row["id"] for row in rows] == [subscription.id]
+    assert date.fromisoformat(rows[0]["next_due_date"]) == expected_due_date(first, cycle) == renewed
+    session.expire_all()
+    assert session.get(Subscription, subscription.id).next_due_date == renewed
+
+
+def test_one_period_overdue_equals_next_due_date(session, add_subscription):
+    first = date(2026, 9, 30)
+    add_subscription("Monthly", 10, cycle="monthly", next_due_date=first, auto_renew=True)
+
+    rows = auto_renew_overdue(session, TODAY)
+
+    assert date.fromisoformat(rows[0]["next_due_date"]) == next_due_date(first, "monthly")
+
+
+def test_only_overdue_auto_renew_subscriptions_advance(session, add_subscription):
+    add_subscription("Due today", 10, next_due_date=TODAY, auto_renew=True)
+    add_subscription("Opted out", 10, next_due_date=date(2026, 1, 31), auto_renew=False)
+    add_subscription("Follows global setting", 10, next_due_date=date(2026, 1, 31))
+
+    assert auto_renew_overdue(session, TODAY) == []
+
+
+def test_closed_form_matches_cycles_for_every_month_end(session, add_subscription):
+    """SQL 闭式公式与 cycles.nth_due_date 在两年内所有 28–31 号上结果一致"""
+    firsts = {}
+    day = date(2024, 1, 28)
+    while day < TODAY:
+        if day.day >= 28:
+            for cycle in ("monthly", "quarterly", "yearly"):
+                subscription = add_subscription(f"{cycle} {day}", 10, cycle=cycle, next_due_date=day, auto_renew=True)
+                firsts[subscription.id] = (day, cycle)
+        day += timedelta(days=1)
+
+    rows = auto_renew_overdue(session, TODAY)
+
+    assert len(rows) == len(firsts)
+    for row in rows:
+        first, cycle = firsts[row["id"]]
+        assert date.fromisoformat(row["next_due_date"]) == expected_due_date(first, cycle), (first, cycle)
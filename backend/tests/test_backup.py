@@ -0,0 +1,75 @@
+"""在线备份：快照可以校验并恢复出备份时的数据，恢复前先保存当前数据库，损坏的快照不会被恢复"""
+import gzip
+import os
+
+import pytest
+from sqlmodel import select
+
+import backup
+from backup import backup_service, list_snapshots, snapshot_path
+from models import Subscription
+
+
+@pytest.fixture
+def backup_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    return tmp_path
+
+
+def names(session):
+    session.expire_all()
+    return sorted(subscription.name for subscription in session.exec(select(Subscription)).all())
+
+
+def test_backup_verify_and_restore_round_trip(session, backup_dir, add_subscription):
+    add_subscription("Netflix", 68)
+    add_subscription("Spotify", 15, "USD")
+
+    result = backup_service.create_backup()
+    assert result.pages > 0 and result.compressed_bytes > 0
+    assert [snapshot.file_name for snapshot in list_snapshots()] == [result.file_name]
+
+    verification = backup_service.verify_backup(result.file_name)
+    assert verification.ok and verification.subscriptions == 2
+
+    add_subscription("Disney", 30)
+    session.delete(session.exec(select(Subscription).where(Subscription.name == "Netflix")).one())
+    session.commit()
+    assert names(session) == ["Disney", "Spotify"]
+
+    backup_service.restore_backup(result.file_name)
+    assert names(session) == ["Netflix", "Spotify"]
+
+    # 恢复前的数据库另存为一个新快照，原快照仍在
+    snapshots = [snapshot.file_name for snapshot in list_snapshots()]
+    assert len(snapshots) == 2 and result.file_name in snapshots
+    safety = next(name for name in snapshots if name != result.file_name)
+    assert backup_service.verify_backup(safety).subscriptions == 2
+
+
+def test_corrupt_snapshot_fails_verification_and_is_not_restored(session, backup_dir, add_subscription):
+    add_subscription("Netflix", 68)
+    result = backup_service.create_backup()
+    with gzip.open(os.path.join(backup_dir, result.file_name), "wb") as corrupt:
+        corrupt.write(b"not a database")
+
+    verification = backup_service.verify_backup(result.file_name)
+    assert not verification.ok and verification.subscriptions is None
+
+    add_subscription("Spotify", 15)
+    with pytest.raises(ValueError):
+        backup_service.restore_backup(result.file_name)
+    assert names(session) == ["Netflix", "Spotify"]
+
+
+def test_rotation_and_file_name_validation(session, backup_dir, add_subscription):
+    add_subscription("Netflix", 68)
+    for _ in range(3):
+        backup_service.create_backup(keep=2)
+    assert len(list_snapshots()) == 2
+
+    for name in ("../test.db", "subscription-20260101-000000.db", "other.db.gz"):
+        with pytest.raises(ValueError):
+            snapshot_path(name)
+    with pytest.raises(FileNotFoundError):
+        snapshot_path("subscription-20000101-000000.db.gz")
@@ -0,0 +1,59 @@
+"""续费接口写入的到期日应与日历、iCal 订阅源展开的日期一致"""
+from datetime import date, timedelta
+
+import pytest
+
+from calendar_service import CalendarService, MAX_CALENDAR_DAYS
+from cycles import iter_due_dates
+
+
+def create(client, name, cycle, next_due_date):
+    response = client.post("/api/subscriptions", json={
+        "name": name, "price": 10, "currency": "CNY", "cycle": cycle, "next_due_date": next_due_date.isoformat()
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def calendar_dates(client, subscription_id, from_date, to_date):
+    response = client.get("/api/calendar", params={"from": from_date.isoformat(), "to": to_date.isoformat()})
+    assert response.status_code == 200, response.text
+    return [date.fromisoformat(item["date"]) for item in response.json() if item["subscription_id"] == subscription_id]
+
+
+@pytest.mark.parametrize("cycle, first", [
+    ("monthly", date(2026, 1, 31)),
+    ("monthly", date(2026, 3, 30)),
+    ("quarterly", date(2025, 11, 30)),
+    ("yearly", date(2024, 2, 29)),
+])
+def test_renew_moves_to_next_calendar_occurrence(client, cycle, first):
+    subscription = create(client, "Renewable", cycle, first)
+    until = first + timedelta(days=MAX_CALENDAR_DAYS - 1)
+    before = calendar_dates(client, subscription["id"], first, until)
+
+    response = client.post(f"/api/subscriptions/{subscription['id']}/renew")
+    assert response.status_code == 200, response.text
+    renewed = date.fromisoformat(response.json()["next_due_date"])
+
+    # 续费后的到期日就是续费前日历上的下一期，续费后的日历从它开始按同一规则展开
+    assert renewed == before[1]
+    after = calendar_dates(client, subscription["id"], first, until)
+    assert after == list(iter_due_dates(renewed, cycle, until))
+    assert after[0] == renewed
+
+
+def test_ical_feed_lists_calendar_occurrences(client, session):
+    subscription = create(client, "Feed", "monthly", date(2026, 1, 31))
+    from_date, to_date = date(2026, 1, 1), date(2026, 6, 30)
+
+    response = client.get("/api/calendar.ics", params={"from": from_date.isoformat(), "to": to_date.isoformat()})
+    assert response.status_code == 200
+
+    expected = [item.date for item in CalendarService(session).get_occurrences(from_date, to_date)]
+    assert expected == [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30),
+                        date(2026, 5, 31), date(2026, 6, 30)]
+    for due_date in expected:
+        assert f"DTSTART;VALUE=DATE:{due_date:%Y%m%d}" in response.text
+    assert response.text.count("BEGIN:VEVENT") == len(expected)
+    assert f"UID:subscription-{subscription['id']}-20260228@" in response.text
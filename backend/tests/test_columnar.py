@@ -0,0 +1,73 @@
+"""列式分析引擎：结果与逐行/汇总表实现一致，数据版本变化时重新载入，假设分析的调整按预期生效"""
+from datetime import date
+
+import pytest
+
+from analytics import AnalyticsService
+from columnar import ColumnarAnalyticsService, columnar_cache
+from models import ScenarioFilter, ScenarioRequest, PriceAdjustment
+
+
+@pytest.fixture
+def subscriptions(session, add_subscription):
+    add_subscription("Video", 10, "USD", "monthly", date(2026, 11, 3))
+    add_subscription("Music", 15, "CNY", "monthly", date(2026, 10, 28))
+    add_subscription("Cloud", 120, "EUR", "quarterly", date(2026, 12, 1))
+    add_subscription("Domain", 95, "USD", "yearly", date(2027, 3, 15))
+    add_subscription("Storage", 600, "CNY", "yearly", date(2026, 11, 20))
+    add_subscription("News", 0.99, "USD", "monthly", date(2026, 10, 25))
+    return session
+
+
+def test_matches_row_based_analytics(subscriptions):
+    columnar = ColumnarAnalyticsService(subscriptions)
+    rows = AnalyticsService(subscriptions)
+
+    assert columnar.get_subscription_analytics() == rows.get_subscription_analytics()
+    assert columnar.get_creation_timeline() == rows.get_creation_timeline()
+    assert columnar.get_renewal_timeline() == rows.get_renewal_timeline()
+
+
+def test_frame_reloaded_when_data_changes(subscriptions, add_subscription):
+    frame = ColumnarAnalyticsService(subscriptions).frame
+    assert ColumnarAnalyticsService(subscriptions).frame is frame
+
+    add_subscription("Backup", 30, "CNY", "monthly")
+    reloaded = ColumnarAnalyticsService(subscriptions).frame
+    assert reloaded is not frame
+    assert len(reloaded) == len(frame) + 1
+    assert columnar_cache.frame is reloaded
+
+
+def test_scenario_filters_and_adjustments(subscriptions):
+    service = ColumnarAnalyticsService(subscriptions)
+    baseline = service.frame.baseline
+
+    # 剔除 USD 订阅后与只保留其余货币相同
+    excluded = service.run_scenario(ScenarioRequest(exclude=[ScenarioFilter(currencies=["usd"])]))
+    included = service.run_scenario(ScenarioRequest(include=ScenarioFilter(currencies=["CNY", "EUR"])))
+    assert excluded.scenario == included.scenario
+    assert excluded.scenario.subscription_count == 3
+    assert "USD" not in excluded.scenario.currency_breakdown
+    assert excluded.baseline == baseline
+
+    # 全部涨价 10%，月度成本同比例变化，跨过区间边界的订阅换到新的价格区间
+    raised = service.run_scenario(ScenarioRequest(price_adjustments=[PriceAdjustment(percent=10)]))
+    assert raised.scenario.total_monthly_cost == pytest.approx(baseline.total_monthly_cost * 1.1, abs=0.01)
+    assert raised.monthly_delta == pytest.approx(baseline.total_monthly_cost * 0.1, abs=0.01)
+    assert raised.scenario.price_ranges["0-50"] == baseline.price_ranges["0-50"]
+    assert raised.scenario.price_ranges["50-100"] == baseline.price_ranges["50-100"] - 1
+    assert raised.scenario.price_ranges["100-300"] == baseline.price_ranges["100-300"] + 1
+
+    # 汇率调整只影响对应货币
+    rate = service.run_scenario(ScenarioRequest(rate_adjustments={"EUR": 50}))
+    eur = baseline.currency_breakdown["EUR"]["monthly"]
+    assert rate.monthly_delta == pytest.approx(eur * 0.5, abs=0.01)
+    assert rate.scenario.currency_breakdown["CNY"] == baseline.currency_breakdown["CNY"]
+
+
+def test_scenario_rejects_invalid_adjustments(client):
+    response = client.post("/api/analytics/scenario", json={"price_adjustments": [{"percent": -100}]})
+    assert response.status_code == 400
+    response = client.post("/api/analytics/scenario", json={"rate_adjustments": {"USD": -150}})
+    assert response.status_code == 400
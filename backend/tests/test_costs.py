@@ -0,0 +1,107 @@
+"""基准货币成本：切换基准后活跃与归档订阅都按新基准重新折算，未知货币不折算，写请求只用缓存的汇率"""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+import main
+from analytics import AnalyticsService
+from archive import archive_subscription
+from costs import apply_normalized_costs, base_rates, refresh_base_costs
+from currency_service import currency_service
+from models import ArchivedSubscription, Subscription
+
+
+def test_base_currency_change_refreshes_archived_rows(session, exchange_rates, set_base_currency, add_subscription):
+    add_subscription("Video", 10, "USD", "monthly")
+    add_subscription("Music", 21, "CNY", "monthly")
+    archived_only = add_subscription("Domain", 96, "EUR", "yearly")
+    archived_usd = add_subscription("Old video", 5, "USD", "monthly")
+    archive_subscription(session, archived_only.id)
+    archive_subscription(session, archived_usd.id)
+
+    set_base_currency("USD")
+    asyncio.run(refresh_base_costs(session))
+    session.expire_all()
+
+    def to_usd(row):
+        return row.monthly_cost * exchange_rates[row.currency] / exchange_rates["USD"]
+
+    for row in [*session.exec(select(Subscription)).all(), *session.exec(select(ArchivedSubscription)).all()]:
+        assert row.monthly_cost_base == pytest.approx(to_usd(row)), row.name
+        assert row.yearly_cost_base == pytest.approx(to_usd(row) * 12), row.name
+
+    # 只出现在归档中的货币也按新基准得出汇率
+    rates = base_rates(session)
+    assert rates["USD"] == 1.0
+    assert rates["EUR"] == pytest.approx(exchange_rates["EUR"] / exchange_rates["USD"])
+    assert rates["CNY"] == pytest.approx(1 / exchange_rates["USD"])
+
+    # 包含归档时周期总额不再混入旧基准货币的金额
+    analytics = AnalyticsService(session, include_archived=True).get_subscription_analytics()
+    yearly = next(item for item in analytics.cycle_breakdown if item.cycle == "yearly")
+    assert yearly.total_amount == pytest.approx(96 * exchange_rates["EUR"] / exchange_rates["USD"], abs=0.01)
+    monthly = next(item for item in analytics.cycle_breakdown if item.cycle == "monthly")
+    assert monthly.total_amount == pytest.approx(10 + 5 + 21 / exchange_rates["USD"], abs=0.01)
+
+
+def test_unknown_currency_leaves_base_costs_empty(session, exchange_rates, add_subscription):
+    """汇率表中没有的货币不按 1:1 折算，基准货币成本留空且不计入统计"""
+    add_subscription("Video", 10, "USD", "monthly")
+    unknown = Subscription(name="Local", price=50, currency="XYZ", cycle="monthly", next_due_date=date(2026, 11, 1))
+    asyncio.run(currency_service.get_exchange_rates("USD"))
+    assert apply_normalized_costs(unknown) is False
+    session.add(unknown)
+    session.commit()
+
+    assert unknown.monthly_cost == 50
+    assert unknown.monthly_cost_base is None and unknown.yearly_cost_base is None
+
+    asyncio.run(refresh_base_costs(session))
+    session.refresh(unknown)
+    assert unknown.monthly_cost_base is None
+    assert "XYZ" not in base_rates(session)
+
+    analytics = AnalyticsService(session).get_subscription_analytics()
+    assert analytics.total_monthly_cost == pytest.approx(10 * exchange_rates["USD"])
+
+
+def test_write_uses_cached_rates_only(client, session, exchange_rates, monkeypatch):
+    """汇率未缓存时写请求不访问汇率接口，基准货币成本留空并触发后台刷新"""
+    async def unreachable(base_currency: str = "USD"):
+        raise AssertionError("write path fetched exchange rates")
+
+    refreshes = []
+    monkeypatch.setattr(currency_service, "_fetch_rates", unreachable)
+    monkeypatch.setattr(main.scheduler_service, "refresh_costs_soon", lambda: refreshes.append(True))
+
+    response = client.post("/api/subscriptions", json={
+        "name": "Video", "price": 10, "currency": "USD", "cycle": "monthly", "next_due_date": "2026-11-01"
+    })
+    assert response.status_code == 200
+    assert response.json()["monthly_cost"] == 10
+    assert response.json()["monthly_cost_base"] is None
+    assert refreshes == [True]
+
+    # 缓存就绪后写请求直接折算，不再触发刷新
+    currency_service.cache["rates_USD"] = {
+        "rates": {currency: exchange_rates["USD"] / rate for currency, rate in exchange_rates.items()},
+        "timestamp": datetime.now() - timedelta(days=1),
+    }
+    response = client.put(f"/api/subscriptions/{response.json()['id']}", json={"price": 12})
+    assert response.json()["monthly_cost_base"] == pytest.approx(12 * exchange_rates["USD"])
+    assert refreshes == [True]
+
+
+def test_base_currency_setting_schedules_cost_refresh(client, monkeypatch, set_base_currency):
+    """修改基准货币不在请求中刷新成本，而是让后台刷新任务立即运行"""
+    refreshes = []
+    monkeypatch.setattr(main.scheduler_service, "refresh_costs_soon", lambda: refreshes.append(True))
+
+    response = client.put("/api/settings/base_currency", json={"value": "USD"})
+    assert response.status_code == 200
+    assert refreshes == [True]
+
+    client.put("/api/settings/base_currency", json={"value": "USD"})
+    assert refreshes == [True]
@@ -0,0 +1,111 @@
+"""前缀和价格趋势应与按事件逐条重放后直接计算的结果一致"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import event_log
+from analytics import AnalyticsService
+from costs import base_rates
+from cycles import monthly_cost
+from event_log import record_subscription_change, snapshot, utc_day_start
+
+
+class FrozenClock(datetime):
+    """替换 event_log 中的 datetime，让事件落在指定的时间"""
+    current = datetime(2026, 1, 1, 12)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(event_log, "datetime", FrozenClock)
+    return FrozenClock
+
+
+@pytest.fixture
+def history(session, clock, add_subscription, update_subscription):
+    """按时间顺序执行一组增删改，返回 (发生时间, 订阅 id, 变更后的快照或 None) 列表"""
+    steps = []
+
+    def at(day: date):
+        clock.current = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+
+    def create(day, *args, **kwargs):
+        at(day)
+        subscription = add_subscription(*args, **kwargs)
+        record_subscription_change(session, subscription.id, None, snapshot(subscription))
+        session.commit()
+        steps.append((clock.current, subscription.id, snapshot(subscription)))
+        return subscription
+
+    def update(day, subscription, **changes):
+        at(day)
+        before = snapshot(subscription)
+        update_subscription(subscription, **changes)
+        record_subscription_change(session, subscription.id, before, snapshot(subscription))
+        session.commit()
+        steps.append((clock.current, subscription.id, snapshot(subscription)))
+
+    def delete(day, subscription):
+        at(day)
+        before = snapshot(subscription)
+        session.delete(subscription)
+        record_subscription_change(session, subscription.id, before, None)
+        session.commit()
+        steps.append((clock.current, subscription.id, None))
+
+    music = create(date(2026, 1, 10), "Music", 30, "CNY", "monthly")
+    video = create(date(2026, 2, 5), "Video", 10, "USD", "monthly")
+    domain = create(date(2026, 2, 20), "Domain", 120, "EUR", "yearly")
+    create(date(2026, 3, 1), "Cloud", 60, "USD", "quarterly")
+    update(date(2026, 3, 15), music, price=45)
+    update(date(2026, 4, 2), video, currency="EUR", price=9)
+    update(date(2026, 5, 20), domain, cycle="monthly", price=12)
+    update(date(2026, 5, 20), music, price=40, cycle="quarterly")
+    delete(date(2026, 6, 1), music)
+    create(date(2026, 7, 31), "Gym", 300, "CNY", "quarterly")
+    return steps
+
+
+def recompute(steps, rates, before: datetime):
+    """不借助累计值，直接重放 before 之前的所有变更"""
+    state = {}
+    for occurred_at, subscription_id, after in steps:
+        if occurred_at >= before:
+            break
+        if after is None:
+            state.pop(subscription_id, None)
+        else:
+            state[subscription_id] = after
+    total = sum(monthly_cost(row["price"], row["cycle"]) * rates.get(row["currency"], 0.0) for row in state.values())
+    return round(total, 2), len(state)
+
+
+@pytest.mark.parametrize("granularity, from_date, to_date", [
+    ("month", date(2025, 12, 1), date(2026, 8, 31)),
+    ("week", date(2026, 1, 1), date(2026, 8, 10)),
+    ("day", date(2026, 5, 15), date(2026, 6, 5)),
+])
+def test_trend_matches_replay(session, history, granularity, from_date, to_date):
+    service = AnalyticsService(session)
+    trend = service.get_price_trend(from_date, to_date, granularity)
+    rates = base_rates(session)
+
+    buckets = service._trend_buckets(from_date, to_date, granularity)
+    assert [point.month for point in trend.monthly_spending] == [label for label, _ in buckets]
+    for point, (_, last_day) in zip(trend.monthly_spending, buckets):
+        bucket_end = utc_day_start(min(last_day, to_date) + timedelta(days=1))
+        expected_total, expected_count = recompute(history, rates, bucket_end)
+        assert point.total_amount == pytest.approx(expected_total), point.month
+        assert point.subscription_count == expected_count, point.month
+
+
+def test_trend_end_matches_current_subscriptions(session, history):
+    trend = AnalyticsService(session).get_price_trend(date(2026, 1, 1), date(2026, 8, 31), "month")
+    analytics = AnalyticsService(session).get_subscription_analytics()
+
+    assert trend.total_monthly == pytest.approx(analytics.total_monthly_cost)
+    assert trend.monthly_spending[-1].subscription_count == analytics.active_subscriptions
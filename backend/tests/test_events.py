@@ -0,0 +1,72 @@
+"""变更事件流：按 Last-Event-ID 从环形缓冲区续传，游标过期或未知时发送 reset"""
+import asyncio
+import json
+import threading
+
+from events import EventBroker
+
+
+def parse(chunk: bytes):
+    """把事件帧解析为 (id, event, data) 列表"""
+    events = []
+    for frame in chunk.decode("utf-8").split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_resume_returns_only_missed_events():
+    broker = EventBroker(buffer_size=4)
+    ids = [broker.publish("updated", {"id": n}) for n in range(3)]
+
+    chunk, cursor = broker.events_since(ids[0])
+    assert parse(chunk) == [(ids[1], "updated", {"id": 1}), (ids[2], "updated", {"id": 2})]
+    assert cursor == ids[2]
+    assert broker.events_since(cursor) == (b"", cursor)
+    # 启动后的第一个事件之前的游标仍可续传
+    assert [event[0] for event in parse(broker.events_since(broker.first_id)[0])] == ids
+
+
+def test_overwritten_or_unknown_cursor_gets_reset():
+    broker = EventBroker(buffer_size=4)
+    ids = [broker.publish("updated", {"id": n}) for n in range(6)]
+
+    # 缓冲区只保留最后 4 个事件，从 ids[1] 续传需要 ids[2]，仍在缓冲区中
+    assert [event[0] for event in parse(broker.events_since(ids[1])[0])] == ids[2:]
+    for stale in (ids[0], broker.first_id, ids[-1] + 1, 0):
+        chunk, cursor = broker.events_since(stale)
+        assert parse(chunk) == [(ids[-1], "reset", {})]
+        assert cursor == ids[-1]
+
+
+def test_stream_delivers_events_published_from_worker_threads():
+    broker = EventBroker(buffer_size=8)
+    before = broker.publish("created", {"id": 1})
+
+    async def scenario():
+        live = broker.stream()
+        assert (await live.__anext__()).startswith(b"retry: ")
+        received = asyncio.ensure_future(live.__anext__())
+        await asyncio.sleep(0.01)
+        thread = threading.Thread(target=broker.publish, args=("deleted", {"id": 1}))
+        thread.start()
+        thread.join()
+        live_events = parse(await asyncio.wait_for(received, 1))
+
+        resumed = broker.stream(before)
+        await resumed.__anext__()
+        resumed_events = parse(await asyncio.wait_for(resumed.__anext__(), 1))
+        assert broker.clients == 2
+        await live.aclose()
+        await resumed.aclose()
+        return live_events, resumed_events
+
+    live_events, resumed_events = asyncio.run(scenario())
+    assert live_events == [(before + 1, "deleted", {"id": 1})]
+    assert resumed_events == live_events
+    assert broker.clients == 0
+
+
+def test_invalid_last_event_id_is_rejected(client):
+    assert client.get("/api/events", headers={"Last-Event-ID": "abc"}).status_code == 400
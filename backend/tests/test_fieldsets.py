@@ -0,0 +1,92 @@
+"""稀疏字段集与响应压缩：fields= 只返回所选列（副本开关两条路径一致），按 Accept-Encoding 选择编码"""
+
+import pytest
+
+from compression import etag_matches, parse_accept_encoding
+
+
+@pytest.fixture
+def subscriptions(client):
+    for name, price in [("Video", 10), ("Music", 15), ("Cloud", 30)]:
+        response = client.post("/api/subscriptions", json={
+            "name": name, "price": price, "currency": "CNY", "cycle": "monthly", "next_due_date": "2026-11-01"
+        })
+        assert response.status_code == 200, response.text
+    return client
+
+
+@pytest.fixture(params=[True, False], ids=["replica", "database"])
+def replica_enabled(request, subscriptions):
+    subscriptions.put("/api/settings/subscription_replica", json={"value": request.param})
+    yield subscriptions
+    subscriptions.put("/api/settings/subscription_replica", json={"value": True})
+
+
+def test_fields_select_columns(replica_enabled):
+    client = replica_enabled
+    full = client.get("/api/subscriptions").json()
+    sparse = client.get("/api/subscriptions", params={"fields": "price,name"})
+    assert sparse.status_code == 200
+    # 总是带上 id，字段按模型顺序
+    assert [list(row) for row in sparse.json()] == [["id", "name", "price"]] * 3
+    assert sparse.json() == [{"id": row["id"], "name": row["name"], "price": row["price"]} for row in full]
+
+    one = client.get(f"/api/subscriptions/{full[0]['id']}", params={"fields": "next_due_date"})
+    assert one.json() == {"id": full[0]["id"], "next_due_date": "2026-11-01"}
+    assert client.get("/api/subscriptions/999999", params={"fields": "name"}).status_code == 404
+
+
+def test_unknown_fields_rejected(client):
+    response = client.get("/api/subscriptions", params={"fields": "name,password"})
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+    assert client.get("/api/analytics/comprehensive", params={"fields": "nope"}).status_code == 400
+
+
+def test_accept_encoding_q_values():
+    assert parse_accept_encoding("gzip;q=0.5, br;q=0, *") == {"gzip": 0.5, "br": 0.0, "*": 1.0}
+    assert parse_accept_encoding("gzip;q=abc") == {"gzip": 0.0}
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("identity", None),
+])
+def test_response_compression(subscriptions, monkeypatch, accept, encoding):
+    import compression
+    monkeypatch.setattr(compression, "brotli", None)
+    response = subscriptions.get("/api/calendar.ics", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == encoding
+    assert response.text.startswith("BEGIN:VCALENDAR")
+
+    # 压缩后的 ETag 变为弱 ETag，用它发起的条件请求仍然命中
+    etag = response.headers["etag"]
+    assert etag.startswith("W/") == (encoding is not None)
+    cached = subscriptions.get("/api/calendar.ics", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+
+
+def test_small_responses_not_compressed(client):
+    response = client.get("/api/subscriptions", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_weak_etag_comparison():
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', 'W/"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_brotli_preferred_on_equal_q(subscriptions):
+    pytest.importorskip("brotli")
+    response = subscriptions.get("/api/calendar.ics", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    response = subscriptions.get("/api/calendar.ics", headers={"Accept-Encoding": "gzip, br;q=0.5"})
+    assert response.headers["content-encoding"] == "gzip"
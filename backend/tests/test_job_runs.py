@@ -0,0 +1,92 @@
+"""定时任务运行记录：重叠的运行被跳过并记录，计数与外部调用耗时记入当前运行，失败的运行记录错误"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobExecutionEvent, JobSubmissionEvent
+from sqlalchemy import text
+
+from job_runs import ALREADY_RUNNING, JobRunTracker, add_counts, get_job_run_history, timed
+
+
+@pytest.fixture
+def tracker(session):
+    session.execute(text("DELETE FROM job_runs"))
+    session.commit()
+    return JobRunTracker()
+
+
+def history(session, job_id):
+    session.expire_all()
+    return get_job_run_history(session, job_id)
+
+
+def test_overlapping_run_is_skipped(tracker, session):
+    @tracker.track("test_job")
+    async def job(gate):
+        add_counts(rows_scanned=3)
+        with timed("telegram"):
+            with timed("fx"):
+                await asyncio.sleep(0.02)
+            await gate.wait()
+        add_counts(rows_scanned=2, reminders_sent=1)
+        return "done"
+
+    async def scenario():
+        gate = asyncio.Event()
+        first = asyncio.create_task(job(gate))
+        await asyncio.sleep(0.05)
+        assert tracker.is_running("test_job")
+        assert await job(gate) is None
+        gate.set()
+        return await first
+
+    assert asyncio.run(scenario()) == "done"
+    assert not tracker.is_running("test_job")
+
+    result = history(session, "test_job")
+    skipped, succeeded = result.runs
+    assert (skipped.status, skipped.error) == ("skipped", ALREADY_RUNNING)
+    assert (succeeded.status, succeeded.rows_scanned, succeeded.reminders_sent) == ("success", 5, 1)
+    # 嵌套的汇率耗时只计入 fx_ms，不重复计入 telegram_ms
+    assert succeeded.fx_ms >= 20
+    assert succeeded.telegram_ms + succeeded.fx_ms <= succeeded.duration_ms + 1
+    stats = result.stats[0]
+    assert (stats.runs, stats.succeeded, stats.skipped) == (2, 1, 1)
+    assert stats.max_ms == succeeded.duration_ms
+
+
+def test_failed_run_is_recorded_and_raised(tracker, session):
+    @tracker.track("test_failing_job")
+    async def job():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(job())
+    assert not tracker.is_running("test_failing_job")
+
+    run = history(session, "test_failing_job").runs[0]
+    assert (run.status, run.error) == ("failed", "RuntimeError: boom")
+
+
+def test_scheduler_events_and_untracked_counts(tracker, session):
+    tracker.on_scheduler_event(JobExecutionEvent(EVENT_JOB_MISSED, "test_missed_job", "default", datetime.now()))
+    tracker.on_scheduler_event(JobSubmissionEvent(
+        EVENT_JOB_MAX_INSTANCES, "test_missed_job", "default", [datetime.now(timezone.utc)]
+    ))
+    stats = history(session, "test_missed_job").stats[0]
+    assert (stats.missed, stats.skipped, stats.avg_ms) == (1, 1, 0.0)
+
+    # 不在被跟踪的任务中时计数和计时都被忽略
+    add_counts(rows_scanned=1)
+    with timed("fx"):
+        pass
+
+    with pytest.raises(ValueError):
+        get_job_run_history(session, days=0)
+
+
+def test_manual_run_conflicts_with_running_job(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main.job_run_tracker, "running", {main.REMINDER_JOB_ID})
+    assert client.post("/api/reminders/check").status_code == 409
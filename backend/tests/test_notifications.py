@@ -0,0 +1,30 @@
+"""写接口的操作通知在响应之后作为后台任务发送，发送失败不影响写入"""
+from datetime import date
+
+from telegram_service import telegram_service
+
+
+def test_operation_notifications_run_after_the_write(client, monkeypatch):
+    sent = []
+
+    async def send_operation_notification(operation, subscription, old_data=None):
+        sent.append((operation, subscription.name, old_data))
+        raise RuntimeError("Telegram unavailable")
+
+    monkeypatch.setattr(telegram_service, "send_operation_notification", send_operation_notification)
+
+    response = client.post("/api/subscriptions", json={
+        "name": "Video", "price": 10, "currency": "CNY", "cycle": "monthly", "next_due_date": "2026-11-01"
+    })
+    assert response.status_code == 200
+    subscription_id = response.json()["id"]
+
+    assert client.post(f"/api/subscriptions/{subscription_id}/renew").status_code == 200
+    assert client.get(f"/api/subscriptions/{subscription_id}").json()["next_due_date"] == "2026-12-01"
+    assert client.delete(f"/api/subscriptions/{subscription_id}").status_code == 200
+
+    assert sent == [
+        ("created", "Video", None),
+        ("renewed", "Video", {"next_due_date": date(2026, 11, 1)}),
+        ("deleted", "Video", None),
+    ]
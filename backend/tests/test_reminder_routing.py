@@ -0,0 +1,73 @@
+"""提醒路由：按标签分发到多个会话，未匹配的发给默认会话；并发发送有上限，单个会话失败不影响其他会话"""
+import asyncio
+from datetime import date
+
+import pytest
+
+import telegram_service as telegram_module
+from models import ReminderRoute, Subscription
+from reminder_routing import ReminderRouter, parse_routes
+from telegram_service import telegram_service
+
+
+def subscription(name: str, tags=None) -> Subscription:
+    return Subscription(name=name, price=10, currency="CNY", cycle="monthly",
+                        next_due_date=date(2026, 11, 1), tags=tags)
+
+
+def test_parse_routes():
+    routes = parse_routes('[{"chat_id": -100123, "tags": ["ops"], "name": "运维群"}, {"chat_id": "42", "tags": ["*"]}]')
+    assert routes == [
+        ReminderRoute(chat_id="-100123", tags=["ops"], name="运维群"),
+        ReminderRoute(chat_id="42", tags=["*"]),
+    ]
+    assert parse_routes("  ") == []
+    for value in ["{", '{"chat_id": "1"}', '[{"tags": ["ops"]}]']:
+        with pytest.raises(ValueError):
+            parse_routes(value)
+
+
+def test_route_by_tags():
+    router = ReminderRouter([
+        ReminderRoute(chat_id="ops", tags=["OPS", "infra"]),
+        ReminderRoute(chat_id="finance", tags=["billing", " infra "]),
+        ReminderRoute(chat_id="ops", tags=["billing"]),
+    ], default_chat_id="default")
+
+    assert router.recipients(subscription("Server", "infra")) == ["ops", "finance"]
+    assert router.recipients(subscription("Invoice", "Billing, ops")) == ["finance", "ops"]
+    # 没有匹配任何路由的订阅发给默认会话
+    assert router.recipients(subscription("Video", "media")) == ["default"]
+    assert router.recipients(subscription("Music")) == ["default"]
+
+
+def test_catch_all_and_missing_default():
+    router = ReminderRouter([ReminderRoute(chat_id="all", tags=["*"]), ReminderRoute(chat_id="ops", tags=["ops"])])
+    batches = router.route([subscription("Server", "ops"), subscription("Video")])
+    assert {chat_id: [sub.name for sub in subs] for chat_id, subs in batches.items()} == {
+        "all": ["Server", "Video"], "ops": ["Server"]
+    }
+
+    assert ReminderRouter([]).route([subscription("Video")]) == {}
+
+
+def test_send_routed_reminders_bounded_and_isolated(monkeypatch):
+    monkeypatch.setattr(telegram_module, "REMINDER_CONCURRENCY", 2)
+    in_flight = []
+    peak = []
+
+    async def send_batch_reminders(subscriptions, chat_id=None):
+        in_flight.append(chat_id)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(chat_id)
+        if chat_id == "broken":
+            raise RuntimeError("chat not found")
+        return chat_id != "rejected"
+
+    monkeypatch.setattr(telegram_service, "send_batch_reminders", send_batch_reminders)
+    batches = {chat_id: [subscription("Video")] for chat_id in ["a", "broken", "b", "rejected", "c"]}
+    results = asyncio.run(telegram_service.send_routed_reminders(batches))
+
+    assert results == {"a": True, "broken": False, "b": True, "rejected": False, "c": True}
+    assert max(peak) == 2
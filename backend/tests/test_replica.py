@@ -0,0 +1,91 @@
+"""订阅副本：进程外写入由一致性检查修复，write-through 读取已提交的行，排序与数据库一致"""
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+
+from models import Subscription
+from subscription_replica import subscription_replica, sql_order
+
+
+@pytest.fixture
+def replica(session):
+    subscription_replica.load()
+    yield subscription_replica
+    subscription_replica.load()
+
+
+def test_check_repairs_out_of_band_write(session, add_subscription, replica):
+    video = add_subscription("Video", 10)
+    replica.load()
+    repairs = replica.repairs
+
+    session.execute(text("UPDATE subscriptions SET price = 99 WHERE id = :id"), {"id": video.id})
+    session.commit()
+    assert replica.get(video.id).price == 10
+
+    assert replica.check() == 1
+    assert replica.last_mismatches == 1
+    assert replica.repairs == repairs + 1
+    assert replica.get(video.id).price == 99
+
+    replica.check()
+    assert replica.last_mismatches == 0
+    assert replica.repairs == repairs + 1
+
+
+def test_check_defers_repair_after_concurrent_write(session, add_subscription, replica, monkeypatch):
+    """读取数据库期间发生 write-through 时不用可能过时的数据覆盖副本"""
+    video = add_subscription("Video", 10)
+    replica.load()
+    session.execute(text("UPDATE subscriptions SET price = 99 WHERE id = :id"), {"id": video.id})
+    session.commit()
+
+    fetch_all = replica._fetch_all
+
+    def fetch_during_write():
+        rows = fetch_all()
+        replica.writes += 1
+        return rows
+
+    monkeypatch.setattr(replica, "_fetch_all", fetch_during_write)
+    repairs = replica.repairs
+    replica.check()
+    assert replica.last_mismatches == 1
+    assert replica.repairs == repairs
+    assert replica.get(video.id).price == 10
+
+    monkeypatch.undo()
+    replica.check()
+    assert replica.get(video.id).price == 99
+
+
+def test_write_through_reads_committed_rows(session, add_subscription, replica):
+    """upsert 按 id 重新读取，调用方手中未提交或过时的对象不会进入副本"""
+    video = add_subscription("Video", 10)
+    replica.upsert(video)
+    assert replica.get(video.id).price == 10
+
+    video.price = 50
+    replica.upsert(video)
+    assert replica.get(video.id).price == 10
+    session.rollback()
+
+    session.delete(session.get(Subscription, video.id))
+    session.commit()
+    replica.upsert(video)
+    assert replica.get(video.id) is None
+    assert video.id not in replica.ids
+
+
+@pytest.mark.parametrize("order_by", ["next_due_date", "name", "id"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_list_order_matches_sql(session, add_subscription, replica, order_by, descending):
+    for name, due in [("beta", date(2026, 11, 1)), ("Alpha", date(2026, 11, 1)), ("Émile", date(2026, 10, 5)),
+                      ("alpha", date(2026, 12, 1)), ("Zed", date(2026, 10, 5))]:
+        add_subscription(name, 10, next_due_date=due)
+    replica.load()
+
+    expected = session.exec(select(Subscription).order_by(*sql_order(order_by, descending))).all()
+    assert [row.id for row in replica.list(order_by, descending)] == [row.id for row in expected]
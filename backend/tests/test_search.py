@@ -0,0 +1,66 @@
+"""全文搜索：索引由触发器与主表同步，查询中的 FTS5 语法、LIKE 通配符和 HTML 都按字面处理"""
+import pytest
+
+from search import search_subscriptions
+
+
+def names(session, query, **filters):
+    return [hit.subscription.name for hit in search_subscriptions(session, query, **filters)]
+
+
+def test_index_follows_insert_update_and_delete(session, add_subscription, update_subscription):
+    video = add_subscription("Netflix Premium", 68, notes="家庭共享账号")
+    add_subscription("Spotify", 15, "USD", notes="student plan")
+
+    assert names(session, "flix") == ["Netflix Premium"]
+    assert names(session, "共享账") == ["Netflix Premium"]
+    assert names(session, "plan") == ["Spotify"]
+
+    update_subscription(video, name="Disney Plus", notes=None)
+    assert names(session, "flix") == []
+    assert names(session, "共享账") == []
+    assert names(session, "Disney") == ["Disney Plus"]
+
+    session.delete(video)
+    session.commit()
+    assert names(session, "Disney") == []
+
+
+def test_name_hits_rank_above_notes_and_filters_apply(session, add_subscription):
+    add_subscription("Cloud backup", 30, notes="photos")
+    add_subscription("Photos", 20, "USD", cycle="yearly", notes="cloud storage")
+
+    assert names(session, "cloud") == ["Cloud backup", "Photos"]
+    assert names(session, "cloud", cycle="yearly") == ["Photos"]
+    assert names(session, "cloud", currency="usd") == ["Photos"]
+
+
+@pytest.mark.parametrize("query", ['"', 'a"b" OR', 'ab"c', "NOT", "name:x*", "(", "NEAR(a b)", "^start"])
+def test_fts_syntax_in_queries_is_literal(session, add_subscription, query):
+    add_subscription("Plain", 10, notes="regular text")
+    assert names(session, query) == []
+
+
+def test_operators_and_wildcards_match_literally(session, add_subscription):
+    add_subscription("Music OR Video", 10)
+    add_subscription("Music", 10, notes="100% off")
+    add_subscription("Video", 10, notes='a_b, "quoted"')
+
+    assert names(session, "OR Video") == ["Music OR Video"]
+    assert names(session, "%") == ["Music"]
+    assert names(session, "_") == ["Video"]
+    assert names(session, '"quoted"') == ["Video"]
+    assert names(session, 'ted"OR"Mus') == []
+    assert names(session, 'quo"ted') == []
+
+
+def test_highlights_escape_user_text(session, add_subscription):
+    add_subscription("<b>Tools</b>", 10, notes="<script>alert(1)</script> tools")
+
+    hit = search_subscriptions(session, "tool")[0]
+    assert hit.name_highlight == "&lt;b&gt;<mark>Tool</mark>s&lt;/b&gt;"
+    assert hit.notes_snippet.endswith("&lt;/script&gt; <mark>tool</mark>s")
+    assert "<script>" not in hit.notes_snippet
+
+    short = search_subscriptions(session, "<b")[0]
+    assert short.name_highlight.startswith("<mark>&lt;b</mark>")
@@ -0,0 +1,89 @@
+"""设置注册表：读取走缓存，写入校验后整批 upsert 并只通知变化的键，绕过缓存的写入由 reload 发现"""
+import pytest
+from sqlalchemy import text
+
+from settings_registry import SettingsRegistry, parse_bool
+
+KEYS = ("test_flag", "test_name")
+
+
+@pytest.fixture
+def registry(session):
+    def clean():
+        session.execute(text("DELETE FROM settings WHERE key IN ('test_flag', 'test_name')"))
+        session.commit()
+
+    clean()
+    registry = SettingsRegistry()
+    registry.define("test_flag", parse_bool, False)
+    registry.define("test_name", default="anonymous")
+    yield registry
+    clean()
+
+
+@pytest.fixture
+def notifications(registry):
+    received = []
+    registry.subscribe(received.append)
+    return received
+
+
+def test_reads_are_cached_after_first_load(registry, monkeypatch):
+    loads = []
+    load = registry._load
+    monkeypatch.setattr(registry, "_load", lambda: loads.append(True) or load())
+
+    assert registry.get("test_flag") is False
+    assert registry.get("test_name") == "anonymous"
+    assert registry.get_raw("test_flag") is None
+    assert loads == [True]
+
+
+def test_update_notifies_only_changed_keys(registry, session, notifications):
+    assert registry.update(session, {"test_flag": "yes", "test_name": "Alice"}) == set(KEYS)
+    assert registry.get("test_flag") is True and registry.get("test_name") == "Alice"
+
+    assert registry.update(session, {"test_flag": "yes", "test_name": "Bob"}) == {"test_name"}
+    assert registry.update(session, {"test_name": "Bob"}) == set()
+    assert notifications == [set(KEYS), {"test_name"}]
+
+    stored = dict(session.execute(text("SELECT key, value FROM settings WHERE key IN ('test_flag', 'test_name')")).all())
+    assert stored == {"test_flag": "yes", "test_name": "Bob"}
+
+
+def test_invalid_values_are_rejected_before_writing(registry, session, notifications):
+    with pytest.raises(ValueError):
+        registry.update(session, {"test_name": "Alice", "test_flag": "maybe"})
+    assert registry.get_raw("test_name") is None
+    assert notifications == []
+
+
+def test_reload_picks_up_writes_outside_the_registry(registry, session, notifications):
+    assert registry.get("test_flag") is False
+
+    def failing_subscriber(keys):
+        raise RuntimeError("subscriber failure")
+
+    registry.subscribers.insert(0, failing_subscriber)
+    session.execute(text("INSERT INTO settings (key, value) VALUES ('test_flag', 'on'), ('test_name', 'Carol')"))
+    session.commit()
+    assert registry.get("test_flag") is False
+
+    assert registry.reload() == set(KEYS)
+    assert registry.get("test_flag") is True and registry.get("test_name") == "Carol"
+    # 其他订阅者不受失败的订阅者影响
+    assert notifications == [set(KEYS)]
+    assert registry.reload() == set()
+
+    # 库中无法解析的值按默认值处理
+    session.execute(text("UPDATE settings SET value = 'maybe' WHERE key = 'test_flag'"))
+    session.commit()
+    registry.reload()
+    assert registry.get("test_flag") is False
+
+
+def test_settings_api_validates_registered_keys(client):
+    before = client.get("/api/settings/auto_renew")
+    response = client.put("/api/settings/auto_renew", json={"value": "maybe"})
+    assert response.status_code == 400
+    assert client.get("/api/settings/auto_renew").json() == before.json()
@@ -0,0 +1,62 @@
+"""慢查询日志：按归一化语句汇总，参数脱敏，附带查询计划并标记 subscriptions 全表扫描"""
+import pytest
+from sqlalchemy import text
+
+from slow_query_log import normalize_statement, redact_parameters, slow_query_log
+
+
+@pytest.fixture
+def log_everything(monkeypatch):
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    slow_query_log.reset()
+    yield slow_query_log
+    slow_query_log.reset()
+
+
+def test_normalize_statement():
+    assert normalize_statement("SELECT *\n  FROM t WHERE a = 'it''s' AND b = 42 AND c IN (?, ?, ?)") == \
+        "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)"
+    assert normalize_statement("SELECT col2 FROM t2") == "SELECT col2 FROM t2"
+
+
+def test_redact_parameters():
+    assert redact_parameters(("secret-token", 7, None)) == ["<str:12>", "<int>", "<NoneType>"]
+    assert redact_parameters({"token": "abc"}) == ["<str:3>"]
+    assert redact_parameters([("abcd", 1.5), ("efgh", 2.5)]) == ["<str:4>", "<float>"]
+
+
+def entry_for(statement_prefix: str):
+    return next(entry for entry in slow_query_log.top(100) if entry.statement.startswith(statement_prefix))
+
+
+def test_records_plan_and_full_scans(session, add_subscription, log_everything):
+    for name in ["Video", "Music", "Cloud"]:
+        add_subscription(name, 10, notes="secret-token")
+
+    rows = session.execute(
+        text("SELECT id, name FROM subscriptions WHERE notes = :notes"), {"notes": "secret-token"}
+    ).all()
+    assert len(rows) == 3
+    scan = entry_for("SELECT id, name FROM subscriptions WHERE notes")
+    assert scan.full_scan is True
+    assert scan.rows == 3
+    assert scan.parameters == ["<str:12>"]
+    assert any(step.startswith("SCAN") for step in scan.plan)
+
+    session.execute(text("SELECT name FROM subscriptions WHERE id = :id"), {"id": rows[0].id}).all()
+    session.execute(text("SELECT name FROM subscriptions WHERE id = :id"), {"id": rows[1].id}).all()
+    lookup = entry_for("SELECT name FROM subscriptions WHERE id")
+    assert lookup.full_scan is False
+    assert lookup.count == 2
+    assert any(step.startswith("SEARCH") for step in lookup.plan)
+
+
+def test_admin_endpoint(client, log_everything):
+    client.get("/api/analytics/subscription")
+    response = client.get("/api/admin/slow-queries", params={"order_by": "count", "limit": 5})
+    assert response.status_code == 200
+    counts = [entry["count"] for entry in response.json()]
+    assert counts and counts == sorted(counts, reverse=True)
+
+    assert client.delete("/api/admin/slow-queries").status_code == 200
+    assert slow_query_log.top() == []
@@ -0,0 +1,95 @@
+"""每日分析快照：指标与汇总表和当天变更一致，同一天重复生成会覆盖，历史按粒度汇总存量与流量"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import AnalyticsSnapshot
+from snapshots import get_snapshot_history, take_snapshot
+
+
+@pytest.fixture
+def snapshots(session):
+    session.execute(text("DELETE FROM analytics_snapshots"))
+    session.commit()
+    return session
+
+
+def create(client, name, price, currency, cycle, next_due_date):
+    response = client.post("/api/subscriptions", json={
+        "name": name, "price": price, "currency": currency, "cycle": cycle,
+        "next_due_date": next_due_date.isoformat()
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_snapshot_counts_today(client, snapshots, exchange_rates):
+    today = date.today()
+    create(client, "Video", 10, "USD", "monthly", today + timedelta(days=5))
+    music = create(client, "Music", 15, "CNY", "monthly", today - timedelta(days=2))
+    create(client, "Domain", 120, "CNY", "yearly", today + timedelta(days=90))
+    old = create(client, "Old", 5, "CNY", "monthly", today)
+    assert client.put(f"/api/subscriptions/{music['id']}", json={"price": 20}).status_code == 200
+    assert client.post(f"/api/subscriptions/{old['id']}/archive").status_code == 200
+
+    response = client.post("/api/analytics/snapshots")
+    assert response.status_code == 200, response.text
+    snapshot = response.json()
+    assert snapshot["snapshot_date"] == today.isoformat()
+    assert snapshot["active_count"] == 3
+    assert snapshot["archived_count"] == 1
+    assert snapshot["upcoming_30d_count"] == 1
+    assert snapshot["overdue_count"] == 1
+    assert (snapshot["created_count"], snapshot["removed_count"], snapshot["price_change_count"]) == (4, 1, 1)
+    assert snapshot["cycle_counts"] == {"monthly": 2, "yearly": 1}
+    assert snapshot["currency_breakdown"]["USD"]["count"] == 1
+
+    analytics = client.get("/api/analytics/subscription").json()
+    assert snapshot["monthly_total_base"] == pytest.approx(analytics["total_monthly_cost"], abs=0.01)
+
+    # 同一天再次生成覆盖原快照
+    client.delete(f"/api/subscriptions/{music['id']}")
+    again = client.post("/api/analytics/snapshots").json()
+    assert again["active_count"] == 2 and again["removed_count"] == 2
+    assert snapshots.execute(text("SELECT COUNT(*) FROM analytics_snapshots")).scalar() == 1
+
+
+def add_snapshot(session, day: date, active: int, created: int):
+    session.add(AnalyticsSnapshot(snapshot_date=day, base_currency="CNY", active_count=active,
+                                  created_count=created, cycle_counts='{"monthly": 1}'))
+    session.commit()
+
+
+def test_history_granularity(snapshots):
+    for day, active, created in [(date(2026, 9, 28), 5, 1), (date(2026, 9, 30), 6, 1),
+                                 (date(2026, 10, 1), 8, 2), (date(2026, 10, 6), 7, 0)]:
+        add_snapshot(snapshots, day, active, created)
+
+    def history(granularity):
+        points = get_snapshot_history(snapshots, date(2026, 9, 1), date(2026, 10, 31), granularity).points
+        return [(point.period, point.snapshot_date.isoformat(), point.active_count, point.created_count)
+                for point in points]
+
+    assert history("day") == [
+        ("2026-09-28", "2026-09-28", 5, 1), ("2026-09-30", "2026-09-30", 6, 1),
+        ("2026-10-01", "2026-10-01", 8, 2), ("2026-10-06", "2026-10-06", 7, 0),
+    ]
+    # 存量取区间内最后一个快照，流量求和
+    assert history("week") == [("2026-09-28", "2026-10-01", 8, 4), ("2026-10-05", "2026-10-06", 7, 0)]
+    assert history("month") == [("2026-09", "2026-09-30", 6, 2), ("2026-10", "2026-10-06", 7, 2)]
+
+    point = get_snapshot_history(snapshots, date(2026, 9, 28), date(2026, 9, 28)).points[0]
+    assert point.cycle_counts == {"monthly": 1}
+
+
+def test_history_rejects_invalid_ranges(client):
+    assert client.get("/api/analytics/history", params={"from": "2026-10-02", "to": "2026-10-01"}).status_code == 400
+    assert client.get("/api/analytics/history", params={"from": "2010-01-01", "to": "2026-10-01"}).status_code == 400
+    assert client.get("/api/analytics/history", params={"granularity": "year"}).status_code == 422
+
+
+def test_take_snapshot_without_subscriptions(snapshots):
+    snapshot = take_snapshot(snapshots, date(2026, 10, 1))
+    assert snapshot.active_count == 0 and snapshot.monthly_total_base == 0.0
+    assert get_snapshot_history(snapshots, date(2026, 10, 1), date(2026, 10, 1)).base_currency == "CNY"
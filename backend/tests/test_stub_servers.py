@@ -0,0 +1,51 @@
+"""本地替身服务器：Telegram 返回 python-telegram-bot 能解析的消息，按配置注入 429，汇率接口按基准货币换算"""
+import pytest
+from fastapi.testclient import TestClient
+from telegram import Message
+
+import stub_servers
+from stub_servers import BASE_RATES, StubConfig
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(stub_servers, "config", StubConfig())
+    client = TestClient(stub_servers.app)
+    client.post("/stub/reset")
+    yield client
+    client.post("/stub/reset")
+
+
+@pytest.mark.parametrize("chat_id, chat_type", [("42", "private"), ("-100123", "group"), ("@news", "channel")])
+def test_send_message_returns_parsable_message(stub, chat_id, chat_type):
+    response = stub.post("/botTOKEN/sendMessage", json={"chat_id": chat_id, "text": "hello"})
+    assert response.status_code == 200
+    message = Message.de_json(response.json()["result"], None)
+    assert message.text == "hello"
+    assert message.chat.type == chat_type
+    if chat_type == "channel":
+        assert message.chat.username == "news"
+        # 频道的假 id 对同一个用户名固定不变（表单提交同样可以）
+        again = stub.post("/botTOKEN/sendMessage", data={"chat_id": chat_id, "text": "again"})
+        assert again.json()["result"]["chat"]["id"] == message.chat.id
+
+    assert stub.get("/stub/messages").json()[0]["chat_id"] == chat_id
+
+
+def test_rate_limit_injection(stub):
+    stub.post("/stub/config", json={"rate_limit_rate": 1, "retry_after": 3})
+    response = stub.post("/botTOKEN/sendMessage", json={"chat_id": "42", "text": "hello"})
+    assert response.status_code == 429
+    assert response.json()["parameters"] == {"retry_after": 3}
+
+    counters = stub.get("/stub/stats").json()["counters"]
+    assert counters == {"telegram_requests": 1, "telegram_rate_limited": 1}
+
+
+@pytest.mark.parametrize("path, base_key", [("/v4/latest/cny", "base"), ("/v6/latest/cny", "base_code")])
+def test_exchange_rates_relative_to_base(stub, path, base_key):
+    body = stub.get(path).json()
+    assert body[base_key] == "CNY"
+    assert body["rates"]["CNY"] == 1.0
+    assert body["rates"]["USD"] == pytest.approx(1 / BASE_RATES["CNY"], rel=1e-5)
+    assert body["rates"]["EUR"] == pytest.approx(BASE_RATES["EUR"] / BASE_RATES["CNY"], rel=1e-5)
@@ -0,0 +1,78 @@
+"""Telegram 投递管道：按 UTF-16 长度在条目边界拆分并标注序号，RetryAfter 与网络错误重试，其他错误放弃"""
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import telegram_delivery
+from telegram_delivery import DeliveryPipeline, message_length, split_message
+
+
+class FakeBot:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    # 重试的随机等待取 0，限流放宽到不影响测试耗时
+    monkeypatch.setattr(telegram_delivery.random, "uniform", lambda low, high: 0)
+    return DeliveryPipeline(global_rate=1000, chat_rate=1000, group_rate=1000, max_attempts=3)
+
+
+def test_split_on_block_boundaries():
+    blocks = [f"• 订阅 {index} 🔔" + "x" * 40 for index in range(20)]
+    assert split_message(blocks, limit=2000) == ["\n".join(blocks)]
+
+    messages = split_message(blocks, limit=200)
+    assert len(messages) > 1
+    assert all(message_length(message) <= 200 for message in messages)
+    assert [message.split("\n", 1)[0] for message in messages] == [
+        f"({index}/{len(messages)})" for index in range(1, len(messages) + 1)
+    ]
+    # 序号之后是完整的条目，顺序不变
+    assert [line for message in messages for line in message.split("\n")[1:]] == blocks
+
+
+def test_oversized_block_split_by_line_and_character():
+    assert message_length("🔔") == 2
+    messages = split_message(["短", "a" * 250 + "\n" + "b" * 30], limit=100)
+    assert all(message_length(message) <= 100 for message in messages)
+    body = "".join(message.split("\n", 1)[1].replace("\n", "") for message in messages)
+    assert body == "短" + "a" * 250 + "b" * 30
+
+
+def test_retry_after_and_network_errors_retried(pipeline):
+    bot = FakeBot([RetryAfter(0), NetworkError("reset")])
+    assert asyncio.run(pipeline.deliver(bot, "42", ["hello"])) is True
+    assert bot.sent == [("42", "hello")]
+
+
+def test_gives_up_after_max_attempts_and_on_bad_request(pipeline):
+    bot = FakeBot([RetryAfter(0)] * 3)
+    assert asyncio.run(pipeline.deliver(bot, "42", ["hello"])) is False
+    assert bot.sent == []
+
+    bot = FakeBot([BadRequest("chat not found")])
+    assert asyncio.run(pipeline.deliver(bot, "42", ["hello"])) is False
+    assert bot.failures == [] and bot.sent == []
+
+
+def test_parts_of_one_chat_are_not_interleaved(pipeline):
+    bot = FakeBot()
+    first = [f"first {index} " + "x" * 90 for index in range(100)]
+    second = [f"second {index} " + "y" * 90 for index in range(100)]
+
+    async def deliver_both():
+        return await asyncio.gather(pipeline.deliver(bot, "-100", first), pipeline.deliver(bot, "-100", second))
+
+    assert asyncio.run(deliver_both()) == [True, True]
+    labels = [text.split("\n")[1].split()[0] for _, text in bot.sent]
+    assert labels == sorted(labels, key=lambda label: label != "first")
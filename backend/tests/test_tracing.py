@@ -0,0 +1,73 @@
+"""请求追踪：采样的请求导出一行 OTLP/JSON，SQL span 挂在路由模板命名的根 span 下；未采样时不记录"""
+import asyncio
+import json
+
+import pytest
+
+from tracing import STATUS_ERROR, traced, tracer
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracer, "export_path", str(path))
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+
+    def exported():
+        if not path.exists():
+            return []
+        return [
+            [span for resource in json.loads(line)["resourceSpans"]
+             for scope in resource["scopeSpans"] for span in scope["spans"]]
+            for line in path.read_text(encoding="utf-8").splitlines()
+        ]
+    return exported
+
+
+def test_request_trace_includes_sql_spans(client, add_subscription, traces):
+    subscription = add_subscription("Video", 10)
+    response = client.get("/api/analytics/subscription")
+    assert response.status_code == 200
+    client.get(f"/api/subscriptions/{subscription.id}")
+
+    analytics, lookup = traces()
+    root = next(span for span in analytics if not span["parentSpanId"])
+    assert root["name"] == "GET /api/analytics/subscription"
+    assert root["kind"] == 2
+    attributes = {item["key"]: item["value"] for item in root["attributes"]}
+    assert attributes["http.status_code"] == {"intValue": "200"}
+
+    queries = [span for span in analytics if span["name"].startswith("sqlite ")]
+    assert queries
+    assert {span["traceId"] for span in analytics} == {root["traceId"]}
+    span_ids = {span["spanId"] for span in analytics}
+    assert all(span["parentSpanId"] in span_ids for span in queries)
+
+    # 根 span 用路由模板命名，具体路径放在 http.target
+    lookup_root = next(span for span in lookup if not span["parentSpanId"])
+    assert lookup_root["name"] == "GET /api/subscriptions/{subscription_id}"
+    target = next(item["value"] for item in lookup_root["attributes"] if item["key"] == "http.target")
+    assert target == {"stringValue": f"/api/subscriptions/{subscription.id}"}
+
+
+def test_unsampled_traces_not_exported(client, traces, monkeypatch):
+    monkeypatch.setattr(tracer, "sample_rate", 1e-12)
+    monkeypatch.setattr("tracing.random.random", lambda: 0.5)
+    assert client.get("/api/analytics/subscription").status_code == 200
+    assert traces() == []
+
+
+def test_traced_records_errors(traces):
+    @traced("job.fail")
+    async def fail():
+        with tracer.span("job.step"):
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fail())
+
+    (spans,) = traces()
+    step, root = spans
+    assert (step["name"], root["name"]) == ("job.step", "job.fail")
+    assert step["parentSpanId"] == root["spanId"]
+    assert root["status"] == {"code": STATUS_ERROR, "message": "RuntimeError: boom"}
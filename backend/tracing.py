@@ -0,0 +1,271 @@
+"""
+轻量请求追踪
+用 contextvars 保存当前 span，父子关系随 asyncio 任务和线程池自动传递。
+在根 span 处按 TRACE_SAMPLE_RATE 采样（默认 0，即关闭），未采样的链路几乎没有开销；
+整条链路结束后以 OTLP/JSON（ExportTraceServiceRequest）格式写入本地 JSONL 文件的一行。
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", os.path.join(project_root, "data", "traces.jsonl"))
+SERVICE_NAME = "subscription-manager"
+
+# OTLP 枚举值
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+MAX_ATTRIBUTE_LENGTH = 1024
+
+# 当前链路未被采样时放入上下文的标记，子 span 据此直接跳过
+_UNSAMPLED = object()
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # OTLP/JSON 中 int64 用字符串表示
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)[:MAX_ATTRIBUTE_LENGTH]}
+
+
+class _Trace:
+    """一条链路中已结束、等待随根 span 一起导出的 span"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.finished: List["Span"] = []
+        self.exported = False
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", trace: _Trace, name: str, kind: str,
+                 parent: Optional["Span"], attributes: Optional[Dict[str, Any]]):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent.span_id if parent else ""
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status_code = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def is_root(self) -> bool:
+        return not self.parent_span_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:MAX_ATTRIBUTE_LENGTH]
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer.on_end(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, SPAN_KINDS["internal"]),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, export_path: str = TRACE_EXPORT_PATH):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start_span(self, name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None,
+                   require_parent: bool = False) -> Optional[Span]:
+        """创建 span 但不设为当前 span；未采样或（require_parent 时）没有父 span 时返回 None"""
+        if not self.enabled:
+            return None
+        parent = _current_span.get()
+        if parent is _UNSAMPLED or (parent is None and require_parent):
+            return None
+        if parent is None:
+            trace = _Trace(f"{random.getrandbits(128):032x}")
+        else:
+            trace = parent.trace
+        return Span(self, trace, name, kind, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal",
+             attributes: Optional[Dict[str, Any]] = None) -> Iterator[Optional[Span]]:
+        """在当前上下文中开启子 span（没有父 span 时按采样率开启新链路），未采样时产出 None"""
+        if not self.enabled:
+            yield None
+            return
+
+        if _current_span.get() is None and random.random() >= self.sample_rate:
+            token = _current_span.set(_UNSAMPLED)
+            try:
+                yield None
+            finally:
+                _current_span.reset(token)
+            return
+
+        span = self.start_span(name, kind, attributes)
+        if span is None:
+            yield None
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def on_end(self, span: Span):
+        """根 span 结束时整条链路写成一行；根 span 之后才结束的后台任务 span 单独导出"""
+        trace = span.trace
+        with self.lock:
+            if trace.exported:
+                spans = [span]
+            else:
+                trace.finished.append(span)
+                if not span.is_root:
+                    return
+                spans = trace.finished
+                trace.exported = True
+                trace.finished = []
+        self._export(spans)
+
+    def _export(self, spans: List[Span]):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}, ensure_ascii=False)
+        try:
+            with self.lock:
+                os.makedirs(os.path.dirname(self.export_path) or ".", exist_ok=True)
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to export trace spans: {e}")
+
+
+def traced(name: str, kind: str = "internal"):
+    """把同步或异步函数包在一个 span 里"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """为每个 HTTP 请求创建根 span，名称使用匹配到的路由模板"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        attributes = {"http.method": method, "http.target": scope["path"]}
+        with tracer.span(f"{method} {scope['path']}", "server", attributes) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_status(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status_code = STATUS_ERROR
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # 路由匹配后 FastAPI 会把 route 写回同一个 scope
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{method} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+
+def instrument_engine(engine: Engine):
+    """为 SQL 语句创建子 span（只在已有链路中记录）"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.start_span(
+            f"sqlite {statement.lstrip().split(' ', 1)[0].upper()}", "client",
+            {"db.system": "sqlite", "db.statement": statement}, require_parent=True
+        )
+        if context is not None:
+            context._trace_span = span
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        span = getattr(exception_context.execution_context, "_trace_span", None)
+        if span is not None:
+            span.record_error(exception_context.original_exception)
+            span.end()
+
+
+# 全局实例
+tracer = Tracer()
@@ -9,6 +9,9 @@ export const subscriptionApi = {
   // Get all subscriptions
   getAll: () => api.get('/subscriptions'),
 
+  // Full-text search over names and notes
+  search: (params) => api.get('/subscriptions/search', { params }),
+
   // Get subscription by ID
   getById: (id) => api.get(`/subscriptions/${id}`),
 
@@ -22,7 +25,24 @@ export const subscriptionApi = {
   delete: (id) => api.delete(`/subscriptions/${id}`),
 
   // Renew subscription
-  renew: (id) => api.post(`/subscriptions/${id}/renew`)
+  renew: (id) => api.post(`/subscriptions/${id}/renew`),
+
+  // Cancel a subscription and move it to the archive
+  archive: (id, reason) => api.post(`/subscriptions/${id}/archive`, reason ? { reason } : undefined),
+
+  // List archived subscriptions
+  getArchived: (params) => api.get('/archived-subscriptions', { params }),
+
+  // Restore an archived subscription
+  restore: (archiveId) => api.post(`/archived-subscriptions/${archiveId}/restore`)
+}
+
+export const calendarApi = {
+  // Get renewal occurrences within a date range
+  getOccurrences: (params) => api.get('/calendar', { params }),
+
+  // iCalendar feed URL for calendar apps
+  feedUrl: '/api/calendar.ics'
 }
 
 export const settingsApi = {
@@ -52,13 +72,31 @@ export const analyticsApi = {
   getSubscriptionAnalytics: () => api.get('/analytics/subscription'),
 
   // Get price trend data
-  getPriceTrend: () => api.get('/analytics/price-trend'),
+  getPriceTrend: (params) => api.get('/analytics/price-trend', { params }),
 
   // Get creation timeline
   getCreationTimeline: () => api.get('/analytics/timeline/creation'),
 
   // Get renewal timeline
-  getRenewalTimeline: () => api.get('/analytics/timeline/renewal')
+  getRenewalTimeline: () => api.get('/analytics/timeline/renewal'),
+
+  // What-if scenario: filters plus price/rate adjustments
+  runScenario: (scenario) => api.post('/analytics/scenario', scenario),
+
+  // Historical trend from daily snapshots
+  getHistory: (params) => api.get('/analytics/history', { params })
+}
+
+export const eventsApi = {
+  // Subscribe to the server-sent change stream; handlers are keyed by event type.
+  // The browser reconnects on its own and resumes via Last-Event-ID.
+  subscribe: (handlers) => {
+    const source = new EventSource('/api/events')
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data)))
+    })
+    return source
+  }
 }
 
 export default api
\ No newline at end of file